@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of extract.utils.clean_table_data.
+
+Compares the current single-pass implementation with the original two-pass
+version (kept below as reference_clean_table_data) on synthetic
+pdfplumber-like tables, and checks that both return the same output.
+
+    python benchmarks/clean_table_data.py
+    python benchmarks/clean_table_data.py --rows 1000 50000 --columns 12 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extract.utils import clean_table_data  # noqa: E402
+
+
+def reference_clean_table_data(table):
+    """clean_table_data before the single-pass rewrite, the output contract of the current one."""
+    cleaned_table = [row for row in table if any(cell and str(cell).strip() for cell in row)]
+    header_row = next((row for row in cleaned_table if any(cell and str(cell).strip() for cell in row)), None)
+    if header_row is None:
+        return table
+    header_index = cleaned_table.index(header_row)
+    headers = [str(cell).strip() if cell else f'Column_{i}' for i, cell in enumerate(header_row)]
+    data_rows = cleaned_table[header_index + 1:]
+    cleaned_data_rows = []
+    for row in data_rows:
+        cleaned_row = [str(cell).strip() if cell is not None else '' for cell in row[:len(headers)]]
+        while len(cleaned_row) < len(headers):
+            cleaned_row.append('')
+        cleaned_data_rows.append(cleaned_row)
+    return [headers] + cleaned_data_rows
+
+
+def synthetic_table(rows, columns, seed=0):
+    """A table shaped like pdfplumber output: padded strings, None cells, blank and short rows."""
+    rng = random.Random(seed)
+    table = [[f' Header {i} ' if i % 4 else None for i in range(columns)]]
+    for row in range(rows):
+        if rng.random() < 0.02:
+            table.append([None] * columns)
+            continue
+        cells = [
+            None if rng.random() < 0.1
+            else f'  {rng.randint(0, 10 ** 6)}.{row % 100:02d} ' if i % 2
+            else f'value {row}-{i}\n'
+            for i in range(columns)
+        ]
+        table.append(cells[:rng.randint(1, columns)] if rng.random() < 0.05 else cells)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--columns', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for rows in args.rows:
+        table = synthetic_table(rows, args.columns)
+        if clean_table_data(table) != reference_clean_table_data(table):
+            raise SystemExit(f'Output differs from the reference implementation at {rows} rows')
+
+        reference = min(timeit.repeat(lambda: reference_clean_table_data(table), number=1, repeat=args.repeat))
+        current = min(timeit.repeat(lambda: clean_table_data(table), number=1, repeat=args.repeat))
+        results.append({
+            'rows': rows,
+            'columns': args.columns,
+            'reference_ms': round(reference * 1000, 3),
+            'current_ms': round(current * 1000, 3),
+            'speedup': round(reference / current, 2),
+        })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
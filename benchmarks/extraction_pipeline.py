@@ -0,0 +1,262 @@
+"""
+Benchmark of the PDF extraction pipeline on a synthetic corpus.
+
+Every case generates a PDF with benchmarks/synthetic_pdf.py and runs it
+through the functions a worker uses: ingest_upload stores it, iter_tables
+streams its tables into save_tables. The stage breakdown is what
+extract.metrics records in pdf_stage_seconds along the way:
+
+- hash: SHA-256 of the uploaded file, once per document
+- spool: Copying the file to a temporary file and renaming it into place, once per document
+- open: pdfplumber.open and reading the page list, once per document
+- prefilter: The pre-filter, once per page
+- page: Table detection, once per page that passed the pre-filter
+- clean: clean_table_data, once per table
+- dataframe: Building the pandas DataFrame, once per table
+- write: Writing a table file atomically, once per table
+
+Call counts and totals come from the metrics registry, which also holds
+those of the page-parallel pool (--page-workers). p50/p95 need the duration
+of every call and are left out for stages that ran in pool processes.
+
+Cases run in a fresh process each, so their peak RSS does not include the
+previous case, and start with an untimed warm-up run. The report is JSON,
+pass an earlier report as --baseline to fail when a stage got slower than
+the tolerance allows.
+
+    python benchmarks/extraction_pipeline.py --pages 1 10 50 --tables-per-page 1 3 --rows 10 40 --output run.json
+    python benchmarks/extraction_pipeline.py --baseline run.json --tolerance 0.25
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_pdf import write_pdf  # noqa: E402
+
+STAGES = ['hash', 'spool', 'open', 'prefilter', 'page', 'clean', 'dataframe', 'write']
+
+
+def percentile(values, q):
+    """Linear interpolation percentile of values, q in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(seconds):
+    """Call count, total and p50/p95 latency in milliseconds of one stage."""
+    return {
+        'calls': len(seconds),
+        'total_ms': round(sum(seconds) * 1000, 3),
+        'p50_ms': round(percentile(seconds, 50) * 1000, 3) if seconds else None,
+        'p95_ms': round(percentile(seconds, 95) * 1000, 3) if seconds else None,
+    }
+
+
+def summarize_stage(histogram, samples):
+    """summarize for a stage timed by extract.metrics, the percentiles only when every call was recorded in this process."""
+    calls, total = histogram
+    complete = calls and len(samples) == calls
+    return {
+        'calls': calls,
+        'total_ms': round(total * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3) if complete else None,
+        'p95_ms': round(percentile(samples, 95) * 1000, 3) if complete else None,
+    }
+
+
+def record_samples(samples):
+    """Appends every duration extract.metrics observes in this process to samples[stage], on top of recording it."""
+    from extract import metrics
+
+    observe = metrics.registry.observe
+
+    def recording_observe(name, value, **labels):
+        observe(name, value, **labels)
+        if name == 'pdf_stage_seconds':
+            samples[labels['stage']].append(value)
+
+    metrics.registry.observe = metrics.observe = recording_observe
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB (ru_maxrss is in bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_document(pdf_path, engine, output_format, histograms):
+    """
+    Runs one document through the worker pipeline and adds the stage
+    histograms extract.metrics recorded to histograms (stage -> [calls, seconds]).
+    The stored PDF and its tables are removed again, every run writes them anew.
+
+    Returns:
+    - The page and table counts
+    """
+    from django.core.files import File
+
+    from extract import metrics
+    from extract.storage import full_path, tables_dir
+    from extract.utils import ingest_upload, iter_tables, save_tables
+
+    progress = []
+    with open(pdf_path, 'rb') as source:
+        file_hash, stored_path, _ = ingest_upload(File(source, name=os.path.basename(pdf_path)))
+    try:
+        # As in jobs._run_job
+        with closing(iter_tables(full_path(stored_path), engine=engine, on_progress=lambda *args: progress.append(args))) as tables:
+            first_table = next(tables, None)
+            saved = save_tables(itertools.chain([first_table], tables), file_hash, output_format) if first_table is not None else []
+    finally:
+        os.remove(full_path(stored_path))
+        shutil.rmtree(full_path(tables_dir(file_hash)), ignore_errors=True)
+
+    for name, labels, _, total, count in metrics.drain()['histograms']:
+        if name == 'pdf_stage_seconds':
+            histograms[labels['stage']][0] += count
+            histograms[labels['stage']][1] += total
+    return progress[-1][1], len(saved)
+
+
+def run_case(case, repeat, engine, prefilter, output_format, page_workers, corpus_dir=None):
+    """Generates the PDF of a case and benchmarks it, meant to run in a fresh process."""
+    from django.conf import settings
+
+    with tempfile.TemporaryDirectory(prefix='pdf-bench-') as work_dir:
+        if not settings.configured:
+            settings.configure(MEDIA_ROOT=work_dir, PDF_PAGE_WORKERS=page_workers, PDF_PAGE_PREFILTER=prefilter,
+                               PDF_MAX_UPLOAD_SIZE=2 ** 40)
+
+        name = 'pages{pages}-tables{tables_per_page}-rows{rows}-{layout}.pdf'.format(**case)
+        pdf_path = os.path.join(corpus_dir or work_dir, name)
+        file_bytes = write_pdf(pdf_path, pages=case['pages'], tables_per_page=case['tables_per_page'],
+                               rows=case['rows'], columns=case['columns'], ruled=case['layout'] == 'ruled')
+
+        # Untimed first run, it pays for the lazy imports and warms the caches
+        run_document(pdf_path, engine, output_format, defaultdict(lambda: [0, 0.0]))
+
+        histograms = defaultdict(lambda: [0, 0.0])
+        samples = defaultdict(list)
+        record_samples(samples)
+        documents = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            pages, tables = run_document(pdf_path, engine, output_format, histograms)
+            documents.append(time.perf_counter() - started)
+
+    total = sum(documents)
+    return {
+        'case': case,
+        'file_bytes': file_bytes,
+        'pages': pages,
+        'tables': tables,
+        'document': summarize(documents),
+        'stages': {stage: summarize_stage(histograms[stage], samples[stage]) for stage in STAGES},
+        'throughput': {
+            'pages_per_second': round(pages * repeat / total, 2),
+            'tables_per_second': round(tables * repeat / total, 2),
+            'megabytes_per_second': round(file_bytes * repeat / total / 1e6, 3),
+        },
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def regressions(report, baseline, tolerance):
+    """Stages whose p50 latency grew by more than tolerance compared to the baseline report."""
+    previous = {json.dumps(case['case'], sort_keys=True): case for case in baseline['cases']}
+    found = []
+    for case in report['cases']:
+        before = previous.get(json.dumps(case['case'], sort_keys=True))
+        if before is None:
+            continue
+        for stage, summary in case['stages'].items():
+            old, new = before['stages'].get(stage, {}).get('p50_ms'), summary['p50_ms']
+            if old and new and new > old * (1 + tolerance):
+                found.append({'case': case['case'], 'stage': stage, 'baseline_p50_ms': old, 'p50_ms': new})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--tables-per-page', type=int, nargs='+', default=[1, 3])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 40])
+    parser.add_argument('--columns', type=int, default=6)
+    parser.add_argument('--layouts', nargs='+', choices=['ruled', 'unruled'], default=['ruled', 'unruled'])
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of every document.')
+    parser.add_argument('--engine', default='pdfplumber')
+    parser.add_argument('--no-prefilter', action='store_true', help='Run table detection on every page.')
+    parser.add_argument('--output-format', default='csv')
+    parser.add_argument('--page-workers', type=int, default=1, help='PDF_PAGE_WORKERS, more than 1 extracts long documents in a process pool.')
+    parser.add_argument('--corpus-dir', help='Keep the generated PDFs in this directory.')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare the p50 latencies with.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown against the baseline.')
+    args = parser.parse_args()
+
+    if args.corpus_dir:
+        os.makedirs(args.corpus_dir, exist_ok=True)
+
+    cases = [
+        {'pages': pages, 'tables_per_page': tables_per_page, 'rows': rows, 'columns': args.columns, 'layout': layout}
+        for pages, tables_per_page, rows, layout in itertools.product(args.pages, args.tables_per_page, args.rows, args.layouts)
+    ]
+    results = []
+    for case in cases:
+        # spawn, so every case starts from a clean interpreter with its own peak RSS
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            results.append(executor.submit(
+                run_case, case, args.repeat, args.engine, not args.no_prefilter, args.output_format, args.page_workers, args.corpus_dir
+            ).result())
+        print(f"{results[-1]['document']['p50_ms']:>10.1f} ms  {json.dumps(case)}", file=sys.stderr)
+
+    import pdfplumber
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pdfplumber': pdfplumber.__version__,
+        'engine': args.engine,
+        'prefilter': not args.no_prefilter,
+        'output_format': args.output_format,
+        'page_workers': args.page_workers,
+        'repeat': args.repeat,
+        'cases': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(report, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f'Regression: {json.dumps(regression)}', file=sys.stderr)
+        if found:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
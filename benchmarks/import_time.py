@@ -0,0 +1,140 @@
+"""
+Import-time benchmark of the Django project, from python -X importtime.
+
+Every scenario runs in a fresh interpreter, repeat times, and the median is
+reported:
+
+- django: django.setup() alone, the floor every process pays
+- urls: The URLconf with every view, what manage.py check and migrate and a
+  web process's first request load
+- worker: The job queue and extraction code the workers import
+
+None of them may import the extraction stack (pandas, pdfplumber and the
+optional engines), which is loaded on first use. The report is JSON with the
+total import time, the module count and the slowest modules of each
+scenario. Pass an earlier report as --baseline to fail when a scenario got
+slower than the tolerance allows. Startup times are noisy, compare runs on
+the same machine.
+
+    python benchmarks/import_time.py --output imports.json
+    python benchmarks/import_time.py --baseline imports.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    'django': 'import django; django.setup()',
+    'urls': 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns',
+    'worker': 'import django; django.setup(); import extract.jobs',
+}
+
+# Loaded on first extraction only, never at startup
+HEAVY_MODULES = ['pandas', 'numpy', 'pdfplumber', 'pdfminer', 'camelot', 'cv2', 'tabula', 'pyarrow']
+
+
+def parse_importtime(output):
+    """
+    Parses the stderr of python -X importtime.
+
+    Returns:
+    - Dict of module name -> (self, cumulative) microseconds
+    - Total microseconds, the sum of the cumulative times of top-level imports
+    """
+    modules = {}
+    total = 0
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+        if not name[1:].startswith(' '):
+            total += int(cumulative_us)
+    return modules, total
+
+
+def run_scenario(statement, settings_module):
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module, PYTHONPATH=ROOT)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode:
+        raise SystemExit(f'{statement!r} failed:\n{completed.stderr[-2000:]}')
+    return parse_importtime(completed.stderr)
+
+
+def measure(name, statement, repeat, settings_module, top):
+    runs = [run_scenario(statement, settings_module) for _ in range(repeat)]
+    modules, _ = runs[-1]
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        'scenario': name,
+        'total_ms': round(statistics.median(total for _, total in runs) / 1000, 1),
+        'modules': len(modules),
+        'heavy_modules': sorted({module.split('.')[0] for module in modules} & set(HEAVY_MODULES)),
+        'slowest': [{'module': module, 'cumulative_ms': round(cumulative / 1000, 1)} for module, (_, cumulative) in slowest],
+    }
+
+
+def regressions(report, baseline, tolerance):
+    """Scenarios that import heavy modules or got slower than tolerance allows compared to the baseline report."""
+    previous = {scenario['scenario']: scenario for scenario in baseline['scenarios']} if baseline else {}
+    found = []
+    for scenario in report['scenarios']:
+        if scenario['heavy_modules']:
+            found.append({'scenario': scenario['scenario'], 'heavy_modules': scenario['heavy_modules']})
+        before = previous.get(scenario['scenario'])
+        if before and scenario['total_ms'] > before['total_ms'] * (1 + tolerance):
+            found.append({'scenario': scenario['scenario'], 'baseline_total_ms': before['total_ms'], 'total_ms': scenario['total_ms']})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per scenario.')
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'project.settings'))
+    parser.add_argument('--top', type=int, default=10, help='Slowest modules listed per scenario.')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare the import times with.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed import time growth against the baseline.')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios:
+        results.append(measure(name, SCENARIOS[name], args.repeat, args.settings, args.top))
+        print(f"{results[-1]['total_ms']:>10.1f} ms  {name}", file=sys.stderr)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'scenarios': results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    else:
+        print(output)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    found = regressions(report, baseline, args.tolerance)
+    for regression in found:
+        print(f'Regression: {json.dumps(regression)}', file=sys.stderr)
+    if found:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+HTTP load test of the API, to compare server setups.
+
+A number of simulated clients send requests back to back over keep-alive
+connections for a fixed time, cycling through the chosen endpoints:
+
+- status: GET of the status endpoint for a PDF uploaded at the start
+- list: GET of the first page of the PDF list
+- upload: POST of that same PDF, answered from the existing row
+
+The first response is timed separately (cold_start_ms), it includes the
+imports a fresh process does on its first request. The report is JSON with
+requests/sec and latency percentiles per endpoint. Pass an earlier report as
+--baseline to print the change and fail when throughput dropped or the p99
+latency grew by more than the tolerance.
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 50 --duration 30 --output before.json
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from extraction_pipeline import percentile  # noqa: E402
+from synthetic_pdf import build_pdf  # noqa: E402
+
+ENDPOINTS = ['status', 'list', 'upload']
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, reopened when the server closes it."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """Sends a request and reads the whole response, returns the status code and body."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.host}', f'Content-Length: {len(body)}']
+        head += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            response_body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while (await self.reader.readline()) not in (b'\r\n', b''):
+                        pass
+                    break
+                response_body += (await self.reader.readexactly(size + 2))[:-2]
+        elif 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, bytes(response_body)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def multipart(pdf_bytes):
+    """Body and content type of an upload form with the PDF as "file"."""
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load-test.pdf"\r\n'
+        'Content-Type: application/pdf\r\n\r\n'
+    ).encode() + pdf_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+async def client(connection, requests, deadline, latencies, statuses, offset):
+    """Sends the requests in turn, starting at offset, until the deadline."""
+    turn = offset
+    while time.monotonic() < deadline:
+        name, method, path, body, headers = requests[turn % len(requests)]
+        turn += 1
+        started = time.perf_counter()
+        try:
+            status, _ = await connection.request(method, path, body, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            connection.close()
+            status = 'error'
+        latencies[name].append(time.perf_counter() - started)
+        statuses[f'{name} {status}'] += 1
+    connection.close()
+
+
+def summarize(latencies, elapsed):
+    return {
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port, prefix = url.hostname, url.port or 80, url.path.rstrip('/') + '/api/v1/pdfs'
+    body, content_type = multipart(build_pdf(pages=args.pages, tables_per_page=1, rows=10, columns=4))
+
+    setup = Connection(host, port)
+    started = time.perf_counter()
+    status, response = await setup.request('POST', f'{prefix}/extract-table/', body, {'Content-Type': content_type})
+    cold_start_ms = round((time.perf_counter() - started) * 1000, 2)
+    setup.close()
+    if status >= 400:
+        raise SystemExit(f'Setup upload failed with {status}: {response[:200]!r}')
+    file_hash = json.loads(response)['data']['hash']
+
+    available = {
+        'status': ('status', 'GET', f'{prefix}/status/{file_hash}/', b'', None),
+        'list': ('list', 'GET', f'{prefix}/list/?limit=20', b'', None),
+        'upload': ('upload', 'POST', f'{prefix}/extract-table/', body, {'Content-Type': content_type}),
+    }
+    requests = [available[name] for name in args.endpoints]
+
+    latencies, statuses = defaultdict(list), Counter()
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        client(Connection(host, port), requests, deadline, latencies, statuses, offset)
+        for offset in range(args.concurrency)
+    ))
+    elapsed = time.monotonic() - started
+
+    every = [latency for name in latencies for latency in latencies[name]]
+    errors = sum(count for key, count in statuses.items() if not key.split()[1].startswith(('2', '3')))
+    return {
+        'url': args.url,
+        'label': args.label,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'cold_start_ms': cold_start_ms,
+        'errors': errors,
+        'statuses': dict(sorted(statuses.items())),
+        'total': summarize(every, elapsed),
+        'endpoints': {name: summarize(latencies[name], elapsed) for name in args.endpoints},
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Prints the change against the baseline report and returns the regressions."""
+    found = []
+    for name, summary in [('total', report['total'])] + list(report['endpoints'].items()):
+        before = baseline['total'] if name == 'total' else baseline['endpoints'].get(name)
+        if not before or not before['requests'] or not summary['requests']:
+            continue
+        rps_change = summary['requests_per_sec'] / before['requests_per_sec'] - 1
+        p99_change = summary['p99_ms'] / before['p99_ms'] - 1
+        print(
+            f"{name:>8}: {before['requests_per_sec']:>8.1f} -> {summary['requests_per_sec']:>8.1f} req/s ({rps_change:+.0%}), "
+            f"p95 {before['p95_ms']:.1f} -> {summary['p95_ms']:.1f} ms, p99 {before['p99_ms']:.1f} -> {summary['p99_ms']:.1f} ms ({p99_change:+.0%})",
+            file=sys.stderr,
+        )
+        if rps_change < -tolerance or p99_change > tolerance:
+            found.append({'endpoint': name, 'requests_per_sec_change': round(rps_change, 3), 'p99_change': round(p99_change, 3)})
+    print(f"cold start: {baseline['cold_start_ms']:.1f} -> {report['cold_start_ms']:.1f} ms", file=sys.stderr)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test.')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=['status', 'list'])
+    parser.add_argument('--concurrency', type=int, default=50, help='Simulated clients.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to send requests for.')
+    parser.add_argument('--pages', type=int, default=1, help='Pages of the uploaded PDF.')
+    parser.add_argument('--label', default='', help='Name of the setup under test, stored in the report.')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed throughput drop and p99 growth against the baseline.')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = compare(report, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print(f'Regression: {json.dumps(regression)}', file=sys.stderr)
+        if found:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
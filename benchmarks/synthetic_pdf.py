@@ -0,0 +1,150 @@
+"""
+Synthetic PDF corpus for the benchmarks.
+
+Writes small, valid PDFs by hand (no PDF library needed) holding grids of
+text cells laid out like real tables. Ruled tables draw a line between every
+row and column, which pdfplumber's default line strategy detects. Unruled
+tables only align their text in columns, like most financial statements.
+
+    python benchmarks/synthetic_pdf.py out.pdf --pages 20 --tables-per-page 2 --rows 15 --unruled
+"""
+import argparse
+import random
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 36
+TABLE_GAP = 24
+MAX_ROW_HEIGHT = 16
+
+PROSE = (
+    'The figures below were compiled from the quarterly filings and are shown for illustration only. '
+    'Amounts are unaudited and rounded to the nearest unit, totals may not add up exactly.'
+)
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text(x, y, size, text):
+    return f'BT /F1 {size:.2f} Tf {x:.2f} {y:.2f} Td ({_escape(text)}) Tj ET'
+
+
+def _cell_text(rng, row, column):
+    if row == 0:
+        return f'Column {column + 1}'
+    if column == 0:
+        return f'Item {row}'
+    return f'{rng.randint(0, 99999)}.{rng.randint(0, 99):02d}'
+
+
+def page_content(rng, page_number, tables_per_page, rows, columns, ruled):
+    """Content stream of one page: a heading, a line of prose and the tables stacked below."""
+    commands = [_text(MARGIN, PAGE_HEIGHT - MARGIN, 14, f'Report page {page_number}')]
+    commands.append(_text(MARGIN, PAGE_HEIGHT - MARGIN - 20, 9, PROSE[:110]))
+
+    top = PAGE_HEIGHT - MARGIN - 40
+    if not tables_per_page:
+        # Prose only pages, which the pre-filter is expected to skip
+        for line in range(30):
+            commands.append(_text(MARGIN, top - line * 14, 9, PROSE[line % 3 * 30:][:110]))
+        return '\n'.join(commands)
+
+    # Shrink the rows so that every table fits on the page
+    available = top - MARGIN - TABLE_GAP * (tables_per_page - 1)
+    row_height = min(MAX_ROW_HEIGHT, available / (tables_per_page * (rows + 1)))
+    font_size = row_height * 0.6
+    column_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+
+    for _ in range(tables_per_page):
+        bottom = top - (rows + 1) * row_height
+        for row in range(rows + 1):
+            baseline = top - (row + 1) * row_height + row_height * 0.3
+            for column in range(columns):
+                commands.append(_text(MARGIN + column * column_width + 2, baseline, font_size, _cell_text(rng, row, column)))
+
+        if ruled:
+            commands.append('0.5 w')
+            for row in range(rows + 2):
+                y = top - row * row_height
+                commands.append(f'{MARGIN:.2f} {y:.2f} m {PAGE_WIDTH - MARGIN:.2f} {y:.2f} l S')
+            for column in range(columns + 1):
+                x = MARGIN + column * column_width
+                commands.append(f'{x:.2f} {top:.2f} m {x:.2f} {bottom:.2f} l S')
+
+        top = bottom - TABLE_GAP
+    return '\n'.join(commands)
+
+
+def build_pdf(pages=1, tables_per_page=1, rows=10, columns=5, ruled=True, seed=0):
+    """
+    Builds a synthetic PDF.
+
+    Args:
+    - pages: Number of pages
+    - tables_per_page: Tables stacked on every page, 0 for prose only pages
+    - rows: Data rows per table, a header row is added on top
+    - columns: Columns per table
+    - ruled: Draw ruling lines around every cell
+    - seed: Seed of the cell values, the same arguments always give the same bytes
+
+    Returns:
+    - The PDF as bytes
+    """
+    rng = random.Random(seed)
+    # 1: catalog, 2: page tree, 3: font, then a page and a content stream object per page
+    page_ids = [4 + 2 * index for index in range(pages)]
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        2: f'<< /Type /Pages /Kids [{" ".join(f"{page_id} 0 R" for page_id in page_ids)}] /Count {pages} >>'.encode(),
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    }
+    for page_number, page_id in enumerate(page_ids, start=1):
+        content = page_content(rng, page_number, tables_per_page, rows, columns, ruled).encode('latin-1')
+        objects[page_id] = (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>'
+        ).encode()
+        objects[page_id + 1] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)
+
+    output = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b'%d 0 obj\n%s\nendobj\n' % (object_id, objects[object_id])
+
+    xref_offset = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for object_id in sorted(objects):
+        output += b'%010d 00000 n \n' % offsets[object_id]
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return bytes(output)
+
+
+def write_pdf(path, **options):
+    """Writes build_pdf(**options) to path and returns the number of bytes written."""
+    data = build_pdf(**options)
+    with open(path, 'wb') as pdf_file:
+        pdf_file.write(data)
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--pages', type=int, default=1)
+    parser.add_argument('--tables-per-page', type=int, default=1)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--columns', type=int, default=5)
+    parser.add_argument('--unruled', action='store_true', help='Align the cells without drawing ruling lines.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    size = write_pdf(args.path, pages=args.pages, tables_per_page=args.tables_per_page, rows=args.rows,
+                     columns=args.columns, ruled=not args.unruled, seed=args.seed)
+    print(f'Wrote {size} bytes to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -17,11 +17,20 @@ sleep 2
 
 echo "================================👌🙏🔥 Server is starting now 👌🙏🔥=================================="
 
+if [ "$MODE" = "worker" ]; then
+    # Extraction workers run the jobs the api queues, the api applies the migrations
+    echo "================================👌🙏🔥 Starting extraction workers 👌🙏🔥=================================="
+    exec python3 manage.py run_extraction_workers
+fi
+
 echo "================================👌🙏🔥 Applying Migrations 👌🙏🔥=================================="
 
 python3 manage.py migrate
 
 # Start Django Sever
 echo "===================👌🙏🔥 Starting Django server 👌🙏🔥============================"
-#exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
-python manage.py runserver
+if [ "$MODE" = "production" ]; then
+    # Pre-forked workers with the extraction stack imported before they accept traffic
+    exec gunicorn -c gunicorn.conf.py project.asgi:application
+fi
+exec uvicorn project.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}"
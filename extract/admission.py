@@ -0,0 +1,206 @@
+"""
+Admission control of extraction work.
+
+Every job is queued with an estimate of its cost: the page count of the PDF
+(read from its page objects, or guessed from the file size when they are
+compressed) and the peak memory extracting it takes. The estimates are used
+twice:
+
+- Workers only claim a job when the estimated memory of the jobs running on
+  their host plus its own fits PDF_EXTRACTION_MEMORY_BUDGET (see
+  jobs.claim_next_job). A burst of big PDFs then waits in the queue instead
+  of running side by side and pushing the host into swap. Smaller jobs may
+  overtake one that does not fit, for HEAD_OF_LINE_WAIT seconds at most.
+  Claims on one host are serialised by lock_host and the claiming UPDATE
+  checks the budget again (within_budget), so concurrent workers cannot
+  claim more than it together.
+- Upload endpoints answer 503 with a Retry-After header while the pages
+  queued exceed PDF_ADMISSION_MAX_QUEUED_PAGES, before reading the upload.
+  Retry-After is the time the workers need to bring the backlog back under
+  the limit at the page rate of the last THROUGHPUT_WINDOW seconds.
+"""
+import math
+import os
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ExtractionJob
+
+PAGE_OBJECT = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+PAGE_COUNT = re.compile(rb'/Count\s+(\d+)')
+READ_SIZE = 1024 * 1024
+MATCH_WINDOW = 64
+# Guess for PDFs whose page objects are compressed in object streams
+BYTES_PER_PAGE = 50 * 1024
+# Peak RSS of an extraction process: the interpreter with pdfplumber and
+# pandas, plus the parsed document. Pages are released as they are done, the
+# page count does not add up
+MEMORY_BASE = 160 * 2 ** 20
+MEMORY_PER_BYTE = 2
+CLAIM_CANDIDATES = 50
+HEAD_OF_LINE_WAIT = 60
+THROUGHPUT_WINDOW = 600
+# Retry-After when nothing finished lately, and the longest one sent
+DEFAULT_RETRY_AFTER = 30
+MAX_RETRY_AFTER = 600
+# Seconds an admission decision is reused, a burst of uploads costs one query per process
+DECISION_TTL = 1.0
+
+# Monotonic time of the last decision and the decision
+_decision = (float('-inf'), None)
+_decision_lock = threading.Lock()
+
+
+def count_pages(path):
+    """
+    Page count of a PDF from its raw bytes, without parsing it.
+
+    Returns:
+    - The number of page objects, or the largest page tree /Count, 0 when
+      neither is readable (compressed object streams)
+    """
+    pages = count = 0
+    pending = b''
+    with open(path, 'rb') as pdf:
+        for block in iter(lambda: pdf.read(READ_SIZE), b''):
+            # Matches starting in the last MATCH_WINDOW bytes are counted with
+            # the next block, which holds their end and the character after it
+            pending += block
+            cutoff = len(pending) - MATCH_WINDOW
+            pages += sum(1 for match in PAGE_OBJECT.finditer(pending) if match.start() < cutoff)
+            count = max([count, *map(int, PAGE_COUNT.findall(pending))])
+            pending = pending[max(cutoff, 0):]
+    pages += len(PAGE_OBJECT.findall(pending))
+    return max(pages, count)
+
+
+def estimate_cost(path):
+    """
+    Estimated pages and peak memory in bytes of extracting a stored PDF.
+    Documents long enough for the page-parallel pool (see utils.iter_tables)
+    count one process per pool worker on top of the job's own.
+
+    Returns:
+    - Dict of estimated_pages and estimated_memory, the ExtractionJob fields
+    """
+    try:
+        size = os.path.getsize(path)
+        pages = count_pages(path) or max(1, size // BYTES_PER_PAGE)
+    except OSError:
+        return {'estimated_pages': 0, 'estimated_memory': 0}
+    processes = 1
+    workers = getattr(settings, 'PDF_PAGE_WORKERS', 1)
+    if workers > 1 and pages >= getattr(settings, 'PDF_PAGE_PARALLEL_MIN_PAGES', 50):
+        processes += min(workers, -(-pages // getattr(settings, 'PDF_PAGE_CHUNK_SIZE', 10)))
+    return {
+        'estimated_pages': pages,
+        'estimated_memory': processes * (MEMORY_BASE + MEMORY_PER_BYTE * size),
+    }
+
+
+def memory_budget():
+    return getattr(settings, 'PDF_EXTRACTION_MEMORY_BUDGET', 0)
+
+
+def _host(worker):
+    """Host part of a worker name, host:pid."""
+    return worker.rsplit(':', 1)[0]
+
+
+def lock_host(worker):
+    """
+    Serialises the claims of the workers of a host until the transaction ends,
+    with a transaction-level advisory lock on Postgres. Other backends
+    serialise writes anyway, within_budget is evaluated after the previous
+    claim committed.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'pdf-extraction-claim:{_host(worker)}'])
+
+
+def within_budget(jobs, worker, budget, memory):
+    """
+    Narrows jobs down to nothing unless memory fits next to the jobs running on
+    the host of worker, or nothing runs there. Evaluated in the claiming UPDATE
+    itself, so it sees the claims committed since choose_job.
+    """
+    running = ExtractionJob.objects.filter(
+        status=ExtractionJob.RUNNING, worker__startswith=f'{_host(worker)}:'
+    ).order_by().values('status').annotate(memory=Sum('estimated_memory')).values('memory')
+    return jobs.alias(host_memory=Coalesce(Subquery(running), 0)).filter(
+        Q(host_memory=0) | Q(host_memory__lte=budget - memory)
+    )
+
+
+def choose_job(queued, worker, budget):
+    """
+    The queued job a worker may claim under the memory budget of its host.
+
+    The oldest job that fits wins. A job that exceeds the budget by itself
+    only runs when nothing else runs on the host.
+
+    Args:
+    - queued: Queued ExtractionJobs, oldest first
+    - worker: Name of the claiming worker, host:pid
+    - budget: PDF_EXTRACTION_MEMORY_BUDGET in bytes
+
+    Returns:
+    - An ExtractionJob, or None when the running jobs leave no room for any
+    """
+    running = ExtractionJob.objects.filter(status=ExtractionJob.RUNNING, worker__startswith=f'{_host(worker)}:').aggregate(
+        memory=Coalesce(Sum('estimated_memory'), 0)
+    )['memory']
+    for position, job in enumerate(queued[:CLAIM_CANDIDATES]):
+        if not running or running + job.estimated_memory <= budget:
+            return job
+        if position == 0 and timezone.now() - job.created_at > timedelta(seconds=HEAD_OF_LINE_WAIT):
+            # Waited long enough, the memory being freed is kept for it
+            return None
+    return None
+
+
+def retry_after(excess_pages):
+    """Seconds the workers need to extract excess_pages at their recent rate."""
+    since = timezone.now() - timedelta(seconds=THROUGHPUT_WINDOW)
+    done = ExtractionJob.objects.filter(status=ExtractionJob.COMPLETE, finished_at__gte=since).aggregate(
+        pages=Coalesce(Sum(Coalesce('pages_total', 'estimated_pages')), 0)
+    )['pages']
+    if not done:
+        return DEFAULT_RETRY_AFTER
+    return min(MAX_RETRY_AFTER, max(1, math.ceil(excess_pages * THROUGHPUT_WINDOW / done)))
+
+
+def _decide():
+    max_pages = getattr(settings, 'PDF_ADMISSION_MAX_QUEUED_PAGES', 0)
+    if not max_pages:
+        return None
+    queued = ExtractionJob.objects.filter(status=ExtractionJob.QUEUED).aggregate(
+        pages=Coalesce(Sum('estimated_pages'), 0)
+    )['pages']
+    return retry_after(queued - max_pages + 1) if queued >= max_pages else None
+
+
+def admission_retry_after():
+    """
+    Whether new uploads are admitted.
+
+    Returns:
+    - None when the queue has room, otherwise the seconds a client should wait before retrying
+    """
+    global _decision
+    decided_at, decision = _decision
+    if time.monotonic() - decided_at < DECISION_TTL:
+        return decision
+    with _decision_lock:
+        if time.monotonic() - _decision[0] >= DECISION_TTL:
+            _decision = (time.monotonic(), _decide())
+        return _decision[1]
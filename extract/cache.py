@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import metrics
+from .downloads import renditions
+from .engines import get_engine
+from .models import ExtractionResult
+
+TABLE_FIELDS = ['id', 'file', 'member', 'format', 'page_number', 'table_index']
+
+
+def extraction_identity(engine='pdfplumber', output_format='csv'):
+    """Engine, engine version and options that identify the output of an extraction."""
+    return engine, get_engine(engine).version(), {'output_format': output_format}
+
+
+def result_cache_key(file_hash, engine, engine_version, options):
+    """Stable key of an extraction result, options are compared by value."""
+    payload = json.dumps([file_hash, engine, engine_version, options], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _hot_cache():
+    """In-process metadata tier in front of ExtractionResult, disabled when PDF_RESULT_HOT_CACHE_TTL is 0."""
+    if not getattr(settings, 'PDF_RESULT_HOT_CACHE_TTL', 0):
+        return None
+    return caches[getattr(settings, 'PDF_RESULT_HOT_CACHE_ALIAS', 'default')]
+
+
+def status_cache():
+    """Short-lived cache of status responses, disabled when PDF_STATUS_CACHE_TTL is 0."""
+    if not getattr(settings, 'PDF_STATUS_CACHE_TTL', 0):
+        return None
+    return caches[getattr(settings, 'PDF_STATUS_CACHE_ALIAS', 'default')]
+
+
+def get_cached_tables(cache_key):
+    """
+    Looks up the stored tables of an extraction result.
+
+    Returns:
+    - List of table dicts (TABLE_FIELDS) or None on a cache miss
+    """
+    hot_cache = _hot_cache()
+    if hot_cache is not None:
+        tables = hot_cache.get(f'pdf-result:{cache_key}')
+        if tables is not None:
+            metrics.inc('pdf_result_cache_requests_total', result='hit')
+            return tables
+
+    result = ExtractionResult.objects.filter(cache_key=cache_key).only('pk').first()
+    metrics.inc('pdf_result_cache_requests_total', result='miss' if result is None else 'hit')
+    if result is None:
+        return None
+
+    ExtractionResult.objects.filter(pk=result.pk).update(last_used_at=timezone.now())
+    tables = list(result.tables.values(*TABLE_FIELDS))
+    if hot_cache is not None:
+        hot_cache.set(f'pdf-result:{cache_key}', tables, settings.PDF_RESULT_HOT_CACHE_TTL)
+    return tables
+
+
+def artifact_size(saved_tables):
+    """Disk usage of the files written by save_tables, zip bundles are counted once."""
+    paths = {table['path'] for table in saved_tables}
+    return sum(os.path.getsize(os.path.join(settings.MEDIA_ROOT, path)) for path in paths)
+
+
+def delete_result(result):
+    """Deletes a result together with its table files and their download renditions."""
+    tables = list(result.tables.values_list('file', 'member', 'format'))
+    paths = {path for path, _, _ in tables}
+    result.delete()
+
+    for path, member, table_format in tables:
+        for rendition in renditions(path, member, table_format):
+            os.remove(rendition)
+    for path in paths:
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+    # Drop the now empty tables/<hash>/<variant>/ and tables/<hash>/ directories
+    for directory in {os.path.dirname(os.path.join(settings.MEDIA_ROOT, path)) for path in paths}:
+        for empty_candidate in (directory, os.path.dirname(directory)):
+            if os.path.isdir(empty_candidate) and not os.listdir(empty_candidate):
+                os.rmdir(empty_candidate)
+
+    hot_cache = _hot_cache()
+    if hot_cache is not None:
+        hot_cache.delete(f'pdf-result:{result.cache_key}')
+
+
+def evict_results(max_bytes=None):
+    """
+    Deletes the least recently used results until their artifacts fit in max_bytes.
+
+    Args:
+    - max_bytes: Disk budget for table artifacts (default: PDF_RESULT_CACHE_MAX_BYTES, 0 means unlimited)
+
+    Returns:
+    - Number of results evicted
+    """
+    max_bytes = max_bytes if max_bytes is not None else getattr(settings, 'PDF_RESULT_CACHE_MAX_BYTES', 0)
+    if not max_bytes:
+        return 0
+
+    total = ExtractionResult.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    evicted = 0
+    while total > max_bytes:
+        # Oldest first, fetched in small batches since every deletion also writes to the table
+        batch = list(ExtractionResult.objects.order_by('last_used_at', 'id')[:100])
+        if not batch:
+            break
+        for result in batch:
+            if total <= max_bytes:
+                break
+            total -= result.size_bytes
+            delete_result(result)
+            evicted += 1
+    return evicted
@@ -0,0 +1,311 @@
+"""
+Table downloads.
+
+The download endpoint serves one stored table as CSV, JSON Lines or
+Parquet, gzip or zstd compressed when the client accepts it. Every
+representation is written once next to the stored table, e.g.
+page-1-table-0.jsonl.gz, and served from disk from then on, so a multi-MB
+table is not converted or compressed again on every request. Conversions
+read the source in batches of BATCH_ROWS rows and downloads read the file
+in BLOCK_SIZE pieces, memory stays flat whatever the size of the table.
+Workers pre-compress the CSV tables they store (PDF_DOWNLOAD_PRECOMPRESS).
+"""
+import gzip
+import importlib.util
+import os
+import shutil
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import metrics
+from .storage import write_atomically
+from .utils import available_output_formats
+
+# Format -> media types accepted for it, the first one is sent back
+DOWNLOAD_FORMATS = {
+    'csv': ['text/csv'],
+    'jsonl': ['application/jsonl', 'application/x-ndjson', 'application/jsonlines'],
+    'parquet': ['application/vnd.apache.parquet', 'application/x-parquet'],
+}
+# Content codings in order of preference
+ENCODING_SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+BATCH_ROWS = 10000
+BLOCK_SIZE = 256 * 1024
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 10
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header lies outside of the representation."""
+
+
+def available_download_formats():
+    """Download formats usable in this environment, Parquet requires pyarrow."""
+    return [name for name in DOWNLOAD_FORMATS if name != 'parquet' or 'parquet' in available_output_formats()]
+
+
+def available_encodings():
+    """Content codings usable in this environment, zstd requires zstandard."""
+    return [name for name in ENCODING_SUFFIXES if name != 'zstd' or importlib.util.find_spec('zstandard') is not None]
+
+
+def _accepted(header):
+    """(value, quality) pairs of an Accept or Accept-Encoding header."""
+    accepted = []
+    for item in header.split(','):
+        value, *params = [part.strip() for part in item.split(';')]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        accepted.append((value.lower(), quality))
+    return accepted
+
+
+def _media_type_quality(accepted, media_type):
+    """Quality of the most specific media range matching media_type."""
+    ranges = {media_type: 2, media_type.split('/')[0] + '/*': 1, '*/*': 0}
+    best = None
+    for value, quality in accepted:
+        if value in ranges and (best is None or ranges[value] > best[0]):
+            best = (ranges[value], quality)
+    return best[1] if best else 0.0
+
+
+def negotiate_format(accept, default='csv'):
+    """
+    Picks the download format for an Accept header, default wins ties.
+
+    Returns:
+    - A key of DOWNLOAD_FORMATS, or None when none of the available ones is acceptable
+    """
+    accepted = _accepted(accept) if accept else [('*/*', 1.0)]
+    qualities = {
+        name: max(_media_type_quality(accepted, media_type) for media_type in DOWNLOAD_FORMATS[name])
+        for name in available_download_formats()
+    }
+    best = max(qualities, key=lambda name: (qualities[name], name == default))
+    return best if qualities[best] > 0 else None
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Picks the content coding for an Accept-Encoding header.
+
+    Returns:
+    - "zstd", "gzip" or None for the identity coding
+    """
+    if not accept_encoding:
+        return None
+    accepted = dict(_accepted(accept_encoding))
+    identity = accepted.get('identity', accepted.get('*', 1.0))
+    best, best_quality = None, 0.0
+    for name in available_encodings():
+        quality = accepted.get(name, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best if best is not None and best_quality >= identity else None
+
+
+def parse_range(header, size):
+    """
+    Parses a single "bytes=" Range header against a representation of size bytes.
+
+    Returns:
+    - Offset and length of the range, or None to send the whole representation
+      (no header, several ranges or a malformed one, which are ignored)
+
+    Raises:
+    - RangeNotSatisfiable: The range starts past the end
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0 or size == 0:
+                raise RangeNotSatisfiable(header)
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, end - start + 1
+
+
+def rendition_path(file, member, source_format, output_format, encoding=None):
+    """
+    Absolute path of a stored table in output_format with the content coding
+    (None for identity), next to the stored file. A table already stored in
+    output_format is its own identity rendition.
+    """
+    source = os.path.join(settings.MEDIA_ROOT, file)
+    if member or source_format != output_format:
+        stem = os.path.splitext(member or os.path.basename(file))[0]
+        source = os.path.join(os.path.dirname(source), f'{stem}.{output_format}')
+    return source + ENCODING_SUFFIXES[encoding] if encoding else source
+
+
+def renditions(file, member, source_format):
+    """Paths of the renditions of a stored table that exist on disk, the stored file excluded."""
+    stored = os.path.join(settings.MEDIA_ROOT, file)
+    for output_format in DOWNLOAD_FORMATS:
+        for encoding in [None, *ENCODING_SUFFIXES]:
+            path = rendition_path(file, member, source_format, output_format, encoding)
+            if path != stored and os.path.exists(path):
+                yield path
+
+
+def read_batches(file, member, source_format):
+    """Yields the rows of a stored table as DataFrames of at most BATCH_ROWS rows."""
+    import pandas as pd
+
+    source = os.path.join(settings.MEDIA_ROOT, file)
+    if source_format in ('parquet', 'arrow'):
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if source_format == 'parquet':
+            batches = pyarrow.parquet.ParquetFile(source).iter_batches(batch_size=BATCH_ROWS)
+        else:
+            reader = pyarrow.ipc.open_file(pa.memory_map(source))
+            batches = (reader.get_batch(index) for index in range(reader.num_record_batches))
+        for batch in batches:
+            yield batch.to_pandas()
+        return
+
+    # CSV, stored alone or as a member of tables.zip. Values are kept as the
+    # strings that were extracted, an empty cell stays empty
+    if member:
+        with zipfile.ZipFile(source) as bundle, bundle.open(member) as csv_file:
+            yield from pd.read_csv(csv_file, dtype=str, keep_default_na=False, chunksize=BATCH_ROWS)
+    else:
+        with open(source, 'rb') as csv_file:
+            yield from pd.read_csv(csv_file, dtype=str, keep_default_na=False, chunksize=BATCH_ROWS)
+
+
+def _convert(file, member, source_format, output_format, output):
+    """Writes a stored table to output in output_format, one batch at a time."""
+    batches = read_batches(file, member, source_format)
+    if output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet
+
+        writer = None
+        for batch in batches:
+            table = pa.Table.from_pandas(batch, schema=writer.schema if writer else None, preserve_index=False)
+            writer = writer or pyarrow.parquet.ParquetWriter(output, table.schema)
+            writer.write_table(table)
+        if writer is None:
+            pyarrow.parquet.write_table(pa.table({}), output)
+        else:
+            writer.close()
+        return
+
+    for index, batch in enumerate(batches):
+        if output_format == 'csv':
+            text = batch.to_csv(index=False, header=index == 0)
+        elif batch.empty:
+            continue
+        else:
+            text = batch.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+            if not text.endswith('\n'):
+                text += '\n'
+        output.write(text.encode('utf-8'))
+
+
+def _compress(path, output, encoding):
+    """Writes the file at path to output with the content coding."""
+    with open(path, 'rb') as plain:
+        if encoding == 'gzip':
+            # No name or time in the header, the same table always compresses to the same bytes
+            with gzip.GzipFile(filename='', mode='wb', compresslevel=GZIP_LEVEL, fileobj=output, mtime=0) as compressed:
+                shutil.copyfileobj(plain, compressed, BLOCK_SIZE)
+        else:
+            import zstandard
+
+            zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(plain, output, read_size=BLOCK_SIZE, write_size=BLOCK_SIZE)
+
+
+def materialize(file, member, source_format, output_format, encoding=None):
+    """
+    Writes a rendition of a stored table unless it exists already.
+
+    Args:
+    - file: Path of the stored table relative to MEDIA_ROOT
+    - member: Name of the table in a tables.zip bundle, empty otherwise
+    - source_format: Format the table was stored in (csv, zip, parquet or arrow)
+    - output_format: A key of DOWNLOAD_FORMATS
+    - encoding: A key of ENCODING_SUFFIXES, None for identity
+
+    Returns:
+    - The absolute path of the rendition and the number of bytes written for it
+
+    Raises:
+    - FileNotFoundError: The stored table is gone, e.g. its result was evicted
+    """
+    path = rendition_path(file, member, source_format, output_format, encoding)
+    if os.path.exists(path):
+        return path, 0
+
+    if encoding is None:
+        with metrics.timer('convert'):
+            write_atomically(path, lambda output: _convert(file, member, source_format, output_format, output))
+        return path, os.path.getsize(path)
+
+    plain, written = materialize(file, member, source_format, output_format)
+    with metrics.timer('compress'):
+        write_atomically(path, lambda output: _compress(plain, output, encoding))
+    return path, written + os.path.getsize(path)
+
+
+def precompress_tables(tables, encodings=None):
+    """
+    Writes the compressed renditions of freshly saved CSV tables.
+
+    Args:
+    - tables: Table dicts as returned by save_tables
+    - encodings: Content codings to write (default: PDF_DOWNLOAD_PRECOMPRESS, unavailable ones are skipped)
+
+    Returns:
+    - Number of bytes written
+    """
+    encodings = encodings if encodings is not None else getattr(settings, 'PDF_DOWNLOAD_PRECOMPRESS', ['gzip'])
+    encodings = [encoding for encoding in encodings if encoding in available_encodings()]
+    written = 0
+    for table in tables:
+        if table['format'] == 'csv':
+            for encoding in encodings:
+                written += materialize(table['path'], table['member'], table['format'], 'csv', encoding)[1]
+    return written
+
+
+async def read_blocks(path, start, length):
+    """Yields length bytes of the file at path from start, in BLOCK_SIZE pieces read off the event loop."""
+    stream = open(path, 'rb')
+    read = sync_to_async(stream.read, thread_sensitive=False)
+    try:
+        stream.seek(start)
+        while length > 0:
+            block = await read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        stream.close()
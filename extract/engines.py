@@ -0,0 +1,201 @@
+"""
+Table extraction engines.
+
+Every engine turns one pdfplumber page into raw tables (lists of rows) that
+go through clean_table_data like the pdfplumber output always did. camelot
+and tabula are optional, an engine whose library is missing is simply not
+offered by available_engines(). Availability and versions are read from the
+installed package metadata, the libraries are imported on first extraction.
+"""
+import importlib
+import importlib.metadata
+import importlib.util
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+
+class TableEngine:
+    """Base class of the engine adapters."""
+    name = None
+    module = None
+    # Distribution that installs the module, when named differently
+    distribution = None
+
+    def is_available(self):
+        return importlib.util.find_spec(self.module) is not None
+
+    def version(self):
+        try:
+            return importlib.metadata.version(self.distribution or self.module)
+        except importlib.metadata.PackageNotFoundError:
+            return getattr(importlib.import_module(self.module), '__version__', '')
+
+    def extract_page(self, pdf_path, page):
+        """Returns the raw tables found on the page, each a list of rows."""
+        raise NotImplementedError
+
+
+class PdfplumberEngine(TableEngine):
+    name = 'pdfplumber'
+    module = 'pdfplumber'
+
+    def __init__(self, table_settings=None):
+        self.table_settings = table_settings
+
+    def extract_page(self, pdf_path, page):
+        return page.extract_tables(self.table_settings)
+
+
+class CamelotEngine(TableEngine):
+    name = 'camelot'
+    module = 'camelot'
+    distribution = 'camelot-py'
+
+    def __init__(self, flavor='lattice'):
+        self.flavor = flavor
+
+    def extract_page(self, pdf_path, page):
+        import camelot
+        tables = camelot.read_pdf(pdf_path, pages=str(page.page_number), flavor=self.flavor)
+        return [table.df.values.tolist() for table in tables]
+
+
+class TabulaEngine(TableEngine):
+    name = 'tabula'
+    module = 'tabula'
+    distribution = 'tabula-py'
+
+    def is_available(self):
+        # The adapter needs tabula-py, which installs under the same module name
+        # as the unrelated tabula package
+        try:
+            importlib.metadata.distribution(self.distribution)
+        except importlib.metadata.PackageNotFoundError:
+            return False
+        return super().is_available()
+
+    def extract_page(self, pdf_path, page):
+        import tabula
+        frames = tabula.read_pdf(pdf_path, pages=page.page_number, multiple_tables=True, pandas_options={'header': None})
+        return [frame.astype(object).where(frame.notna(), None).values.tolist() for frame in frames]
+
+
+def page_features(page):
+    """
+    Cheap layout features of a page, read from pdfplumber's object lists
+    without running table detection.
+    """
+    return {
+        'ruling_lines': len(page.lines) + len(page.rects) + len(page.curves),
+        'chars': len(page.chars),
+        'images': len(page.images),
+    }
+
+
+# Pre-filter thresholds, see is_table_candidate
+MIN_RULING_LINES = 4
+MIN_ALIGNED_COLUMNS = 2
+MIN_ALIGNED_ROWS = 3
+COLUMN_GAP_EM = 1.0
+COLUMN_TOLERANCE = 2
+
+
+def aligned_text_columns(chars):
+    """
+    Counts x positions where text segments start on at least MIN_ALIGNED_ROWS lines.
+
+    Characters are grouped into lines by their top coordinate and a line is
+    split into segments wherever the horizontal gap exceeds COLUMN_GAP_EM
+    times the font size, which word spacing never does. Prose only ever
+    lines up at the left margin, tables line up once per column.
+    """
+    lines = defaultdict(list)
+    for char in chars:
+        if not char['text'].isspace():
+            lines[round(char['top'])].append(char)
+
+    starts = Counter()
+    for line_chars in lines.values():
+        line_chars.sort(key=itemgetter('x0'))
+        line_starts = {round(line_chars[0]['x0'] / COLUMN_TOLERANCE)}
+        for previous, char in zip(line_chars, line_chars[1:]):
+            if char['x0'] - previous['x1'] > COLUMN_GAP_EM * char.get('size', 10):
+                line_starts.add(round(char['x0'] / COLUMN_TOLERANCE))
+        starts.update(line_starts)
+
+    return sum(1 for count in starts.values() if count >= MIN_ALIGNED_ROWS)
+
+
+def is_table_candidate(page):
+    """
+    Cheap pre-screen run before full table detection.
+
+    Returns:
+    - Whether the page can hold a table, and the skip reason when it cannot
+    """
+    features = page_features(page)
+    if not features['chars']:
+        return False, 'no_text'
+    if features['ruling_lines'] >= MIN_RULING_LINES:
+        return True, None
+    if aligned_text_columns(page.chars) >= MIN_ALIGNED_COLUMNS:
+        return True, None
+    return False, 'no_structure'
+
+
+class AutoEngine(TableEngine):
+    """
+    Picks the cheapest engine likely to succeed, page by page.
+
+    - Image-only pages are skipped, no engine can read them without OCR
+    - Ruled pages go to camelot's lattice mode when installed, pdfplumber's
+      line strategy otherwise
+    - Everything else is read by pdfplumber with the text strategy, which
+      finds unruled tables that the line strategy misses
+    """
+    name = 'auto'
+
+    def __init__(self):
+        self.ruled_engine = CamelotEngine() if CamelotEngine().is_available() else PdfplumberEngine()
+        self.text_engine = PdfplumberEngine({'vertical_strategy': 'text', 'horizontal_strategy': 'text'})
+
+    def is_available(self):
+        return True
+
+    def version(self):
+        engines = {self.ruled_engine.name: self.ruled_engine, self.text_engine.name: self.text_engine}
+        return ','.join(f'{name}={engine.version()}' for name, engine in sorted(engines.items()))
+
+    def choose(self, page):
+        """Returns the engine for the page, or None when it cannot hold a table."""
+        features = page_features(page)
+        if not features['chars']:
+            return None
+        if features['ruling_lines'] >= MIN_RULING_LINES:
+            return self.ruled_engine
+        return self.text_engine
+
+    def extract_page(self, pdf_path, page):
+        engine = self.choose(page)
+        return engine.extract_page(pdf_path, page) if engine else []
+
+
+ENGINES = {
+    'pdfplumber': PdfplumberEngine,
+    'camelot': CamelotEngine,
+    'tabula': TabulaEngine,
+    'auto': AutoEngine,
+}
+
+
+def get_engine(name):
+    """Instantiates the engine registered under name."""
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown extraction engine '{name}'.")
+
+
+def available_engines():
+    """Names of the engines usable in this environment."""
+    return [name for name, engine in ENGINES.items() if engine().is_available()]
@@ -0,0 +1,301 @@
+import cProfile
+import os
+import shutil
+import socket
+import time
+import traceback
+from collections import Counter
+from contextlib import closing
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .admission import choose_job, estimate_cost, lock_host, memory_budget, within_budget
+from .cache import artifact_size, evict_results, extraction_identity, result_cache_key
+from .downloads import precompress_tables
+from .models import CsvFile, ExtractionJob, ExtractionResult, Pdf
+from .rows import ingest_enabled, ingest_rows
+from .search import index_result, search_enabled
+from .storage import full_path, tables_dir
+from .uploads import expire_upload_sessions
+from .utils import MemoryLimitExceeded, iter_tables, save_error_details, save_profile, save_tables
+
+
+def enqueue_extraction(pdf, output_format='csv', engine='pdfplumber', profile=False):
+    """Queues an extraction job for the given Pdf instance, with profile the worker runs it under cProfile."""
+    job = ExtractionJob.objects.create(
+        pdf=pdf, output_format=output_format, engine=engine, profile=profile, **estimate_cost(pdf.file.path)
+    )
+    set_pdf_status(job.pdf_id, ExtractionJob.QUEUED)
+    return job
+
+
+def enqueue_extractions(pdfs, output_format='csv', engine='pdfplumber'):
+    """Queues one extraction job per Pdf instance with a single insert, see enqueue_extraction."""
+    jobs = ExtractionJob.objects.bulk_create(
+        ExtractionJob(pdf=pdf, output_format=output_format, engine=engine, **estimate_cost(pdf.file.path)) for pdf in pdfs
+    )
+    set_pdf_status([pdf.pk for pdf in pdfs], ExtractionJob.QUEUED)
+    return jobs
+
+
+def set_pdf_status(pdf_ids, status):
+    """Mirrors the state of the latest job onto Pdf.status, which the list endpoint filters on."""
+    if not isinstance(pdf_ids, (list, tuple, set)):
+        pdf_ids = [pdf_ids]
+    Pdf.objects.filter(pk__in=pdf_ids).update(status=status)
+
+
+def worker_name():
+    """Identifies the current worker process in job rows."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next_job(worker=None):
+    """
+    Atomically claims the oldest queued job, or with PDF_EXTRACTION_MEMORY_BUDGET
+    the oldest one that fits next to the jobs running on this host (see
+    admission.choose_job).
+
+    On backends with SKIP LOCKED (Postgres) concurrent workers never block on
+    each other's candidate row. Everywhere else (SQLite) the conditional
+    UPDATE below is what guarantees a job is only handed to one worker.
+
+    Under the budget, the workers of one host claim one at a time
+    (admission.lock_host) and the UPDATE only succeeds while the job still
+    fits next to the jobs running there (admission.within_budget). Workers
+    choosing at the same time therefore cannot claim more than the budget
+    together.
+
+    Returns:
+    - The claimed ExtractionJob, or None when the queue is empty or no job fits the budget
+    """
+    worker = worker or worker_name()
+    budget = memory_budget()
+    while True:
+        with transaction.atomic():
+            if budget:
+                lock_host(worker)
+            queued = ExtractionJob.objects.filter(status=ExtractionJob.QUEUED).order_by('created_at', 'id')
+            if connection.features.has_select_for_update_skip_locked:
+                queued = queued.select_for_update(skip_locked=True)
+            job = choose_job(queued, worker, budget) if budget else queued.first()
+            if job is None:
+                return None
+
+            claimable = ExtractionJob.objects.filter(pk=job.pk, status=ExtractionJob.QUEUED)
+            if budget:
+                claimable = within_budget(claimable, worker, budget, job.estimated_memory)
+            claimed = claimable.update(
+                status=ExtractionJob.RUNNING,
+                attempts=F('attempts') + 1,
+                worker=worker,
+                started_at=timezone.now(),
+                pages_total=None,
+                pages_done=0,
+                tables_found=0,
+                progress_at=None,
+            )
+        if claimed:
+            job.refresh_from_db()
+            set_pdf_status(job.pdf_id, ExtractionJob.RUNNING)
+            return job
+        # Another worker won the race for this row, or filled the budget, try again
+
+
+def requeue_stale_jobs(timeout=None, max_attempts=None):
+    """
+    Returns jobs whose worker died mid-extraction to the queue.
+
+    Jobs that already used up their attempts are marked as failed instead.
+    """
+    timeout = timeout if timeout is not None else getattr(settings, 'PDF_JOB_TIMEOUT', 3600)
+    max_attempts = max_attempts if max_attempts is not None else getattr(settings, 'PDF_JOB_MAX_ATTEMPTS', 3)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = ExtractionJob.objects.filter(status=ExtractionJob.RUNNING, started_at__lt=cutoff)
+    exhausted = stale.filter(attempts__gte=max_attempts)
+    retryable = stale.filter(attempts__lt=max_attempts)
+
+    with transaction.atomic():
+        failed_pdfs = list(exhausted.values_list('pdf_id', flat=True))
+        failed = exhausted.update(status=ExtractionJob.FAILED, finished_at=timezone.now())
+        set_pdf_status(failed_pdfs, ExtractionJob.FAILED)
+
+        requeued_pdfs = list(retryable.values_list('pdf_id', flat=True))
+        requeued = retryable.update(status=ExtractionJob.QUEUED, worker='', started_at=None)
+        set_pdf_status(requeued_pdfs, ExtractionJob.QUEUED)
+    return requeued, failed
+
+
+def progress_recorder(job, interval=None):
+    """
+    Returns an on_progress callback for iter_tables that stores the progress on the job row.
+
+    The first and the last report are always written, the ones in between at
+    most every interval seconds, so long documents do not cost a write per page.
+
+    Args:
+    - job: The running ExtractionJob
+    - interval: Minimum seconds between two writes (default: PDF_PROGRESS_INTERVAL)
+    """
+    interval = interval if interval is not None else getattr(settings, 'PDF_PROGRESS_INTERVAL', 1.0)
+    written_at = None
+
+    def record(pages_done, pages_total, tables_found):
+        nonlocal written_at
+        now = time.monotonic()
+        if written_at is not None and pages_done < pages_total and now - written_at < interval:
+            return
+        written_at = now
+        job.pages_done, job.pages_total, job.tables_found = pages_done, pages_total, tables_found
+        job.progress_at = timezone.now()
+        ExtractionJob.objects.filter(pk=job.pk).update(
+            pages_done=pages_done, pages_total=pages_total, tables_found=tables_found, progress_at=job.progress_at
+        )
+
+    return record
+
+
+def finish_job(job, status, error_file='', result=None):
+    """Records the final state of a job."""
+    metrics.inc('pdf_jobs_total', status=status)
+    job.status = status
+    job.error_file = error_file
+    job.result = result
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error_file', 'result', 'page_stats', 'finished_at'])
+    set_pdf_status(job.pdf_id, status)
+
+
+@metrics.timer('job')
+def run_job(job):
+    """
+    Runs a claimed job, see _run_job.
+
+    Jobs queued with profile run under cProfile and the report is stored in
+    job.profile_file. Page-parallel pool processes are not profiled, their
+    work shows up as time spent waiting for the chunks.
+    """
+    if not job.profile:
+        return _run_job(job)
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(_run_job, job)
+    finally:
+        job.profile_file = save_profile(job.pdf.hash, profiler, f'job-{job.pk}')
+        job.save(update_fields=['profile_file'])
+
+
+def _run_job(job):
+    """
+    Extracts the tables of a claimed job and stores them as an ExtractionResult
+    with one CsvFile row per table.
+
+    Tables are streamed from iter_tables straight into save_tables, so a job
+    never holds more than a page worth of DataFrames. A job whose result is
+    already cached (e.g. queued twice) completes without extracting, as does
+    one that loses the insert of the result to a concurrent job.
+    Failures never propagate: the traceback, or the reason when the memory
+    limit was hit, is written with save_error_details, partially written
+    tables are removed and the job is marked as failed.
+    """
+    pdf = job.pdf
+    engine, engine_version, options = extraction_identity(job.engine, job.output_format)
+    cache_key = result_cache_key(pdf.hash, engine, engine_version, options)
+    variant = cache_key[:16]
+    page_stats = job.page_stats = Counter()
+    try:
+        result = ExtractionResult.objects.filter(cache_key=cache_key).first()
+        metrics.inc('pdf_result_cache_requests_total', result='miss' if result is None else 'hit')
+        if result is not None:
+            finish_job(job, ExtractionJob.COMPLETE, result=result)
+            return job
+
+        progress = progress_recorder(job)
+        with closing(iter_tables(pdf.file.path, engine=job.engine, stats=page_stats, on_progress=progress)) as tables:
+            first_table = next(tables, None)
+            if first_table is None:
+                error_details = 'No tables found in PDF'
+            else:
+                saved = save_tables(chain([first_table], tables), pdf.hash, job.output_format, variant=variant)
+
+        if first_table is not None:
+            size_bytes = artifact_size(saved) + precompress_tables(saved)
+            metrics.inc('pdf_table_bytes_total', size_bytes)
+            try:
+                with transaction.atomic():
+                    result = ExtractionResult.objects.create(
+                        pdf=pdf, cache_key=cache_key, engine=engine, engine_version=engine_version,
+                        options=options, size_bytes=size_bytes
+                    )
+                    CsvFile.objects.bulk_create(
+                        CsvFile(pdf=pdf, result=result, file=table['path'], member=table['member'], format=table['format'],
+                                page_number=table['page_number'], table_index=table['table_index'])
+                        for table in saved
+                    )
+                    if ingest_enabled():
+                        ingest_rows(result)
+                    if search_enabled():
+                        index_result(result)
+            except IntegrityError:
+                # A concurrent job for the same settings stored its result
+                # first, its tables are the ones just rewritten in the shared
+                # variant directory
+                result = ExtractionResult.objects.filter(cache_key=cache_key).first()
+                if result is None:
+                    raise
+            finish_job(job, ExtractionJob.COMPLETE, result=result)
+            return job
+
+    except MemoryLimitExceeded as e:
+        error_details = str(e)
+    except Exception:
+        error_details = traceback.format_exc()
+
+    # Tables written before the failure belong to no result, drop them unless
+    # a concurrent job for the same settings stored its result in between
+    if not ExtractionResult.objects.filter(cache_key=cache_key).exists():
+        shutil.rmtree(full_path(tables_dir(pdf.hash, variant)), ignore_errors=True)
+    error_file_path = save_error_details(pdf.hash, error_details)
+    finish_job(job, ExtractionJob.FAILED, error_file=error_file_path)
+    return job
+
+
+def work(poll_interval=1.0, burst=False, max_jobs=None):
+    """
+    Runs the worker loop of a single process.
+
+    Args:
+    - poll_interval: Seconds to sleep when the queue is empty
+    - burst: Exit as soon as the queue is empty instead of polling
+    - max_jobs: Exit after processing this many jobs
+
+    Returns:
+    - Number of jobs processed
+    """
+    worker = worker_name()
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        metrics.flush()
+        job = claim_next_job(worker)
+        if job is None:
+            # Jobs left in the queue wait for memory, see claim_next_job
+            if burst and not ExtractionJob.objects.filter(status=ExtractionJob.QUEUED).exists():
+                break
+            requeue_stale_jobs()
+            expire_upload_sessions()
+            time.sleep(poll_interval)
+            continue
+
+        run_job(job)
+        processed += 1
+        if job.status == ExtractionJob.COMPLETE:
+            evict_results()
+    metrics.flush(force=True)
+    return processed
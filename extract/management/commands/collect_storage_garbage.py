@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from extract.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Deletes temporary files, PDFs, tables and error reports under MEDIA_ROOT that nothing refers to any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=getattr(settings, 'PDF_STORAGE_GC_GRACE', 86400),
+            help='Minimum age in seconds of a deleted file (default: PDF_STORAGE_GC_GRACE).',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+
+    def handle(self, *args, **options):
+        reclaimed = collect_garbage(grace=options['grace'], dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        for kind, (files, size) in reclaimed.items():
+            self.stdout.write(f'{verb} {files} {kind} files, {size} bytes')
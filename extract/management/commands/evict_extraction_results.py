@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from extract.cache import evict_results
+
+
+class Command(BaseCommand):
+    help = 'Deletes least recently used extraction results until their artifacts fit in the disk budget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-bytes', type=int, default=getattr(settings, 'PDF_RESULT_CACHE_MAX_BYTES', 0),
+            help='Disk budget for table artifacts (default: PDF_RESULT_CACHE_MAX_BYTES).',
+        )
+
+    def handle(self, *args, **options):
+        if not options['max_bytes']:
+            self.stdout.write('No disk budget configured, nothing to evict')
+            return
+        evicted = evict_results(options['max_bytes'])
+        self.stdout.write(f'Evicted {evicted} extraction results')
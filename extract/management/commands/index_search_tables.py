@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from extract.search import index_missing_results
+
+
+class Command(BaseCommand):
+    help = 'Adds the tables of extraction results stored before PDF_SEARCH_INDEX was turned on to the search index.'
+
+    def handle(self, *args, **options):
+        segments = index_missing_results()
+        self.stdout.write(f'Indexed {segments} table segments')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from extract.rows import ingest_missing_rows
+
+
+class Command(BaseCommand):
+    help = 'Loads the rows of extraction results stored before PDF_INGEST_TABLE_ROWS was turned on.'
+
+    def handle(self, *args, **options):
+        results, rows = ingest_missing_rows()
+        self.stdout.write(f'Loaded {rows} rows of {results} extraction results')
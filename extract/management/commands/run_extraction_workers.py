@@ -0,0 +1,57 @@
+import multiprocessing
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from extract.jobs import requeue_stale_jobs, work
+
+
+def _worker_main(poll_interval, burst):
+    # Children get a fresh connection instead of sharing the parent's socket
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = 'Starts a pool of worker processes that run queued PDF extraction jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            default=getattr(settings, 'PDF_EXTRACTION_WORKERS', None) or os.cpu_count(),
+            help='Number of worker processes (default: PDF_EXTRACTION_WORKERS or the CPU count).',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is drained.')
+
+    def handle(self, *args, **options):
+        requeued, failed = requeue_stale_jobs()
+        if requeued or failed:
+            self.stdout.write(f'Recovered stale jobs: {requeued} requeued, {failed} failed')
+
+        connections.close_all()
+        for connection in connections.all():
+            # A pool (DB_POOL_MAX_SIZE) keeps its sockets open after close_all,
+            # the forked workers must not share them
+            if hasattr(connection, 'close_pool'):
+                connection.close_pool()
+        processes = [
+            multiprocessing.Process(target=_worker_main, args=(options['poll_interval'], options['burst']))
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} extraction workers')
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
@@ -0,0 +1,218 @@
+"""
+Stage timings and counters of the extraction pipeline, in the Prometheus
+text format.
+
+Recording a value is a dict update under a lock, cheap enough for the
+per-page and per-table hot paths. Every web and worker process keeps its
+own registry and writes it to PDF_METRICS_DIR as a JSON snapshot at most
+every PDF_METRICS_FLUSH_INTERVAL seconds, the metrics endpoint adds them up.
+Page-parallel pool processes hand theirs back with every chunk instead.
+"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+METRICS = {
+    'pdf_stage_seconds': ('histogram', 'Time spent in each stage of the extraction pipeline.'),
+    'pdf_ingested_bytes_total': ('counter', 'Bytes of uploaded PDFs hashed and stored.'),
+    'pdf_pages_total': ('counter', 'Pages processed, by engine.'),
+    'pdf_pages_skipped_total': ('counter', 'Pages skipped by the pre-filter, by reason.'),
+    'pdf_tables_total': ('counter', 'Tables extracted.'),
+    'pdf_table_bytes_total': ('counter', 'Bytes of table artifacts written.'),
+    'pdf_result_cache_requests_total': ('counter', 'Result cache lookups, by result (hit or miss).'),
+    'pdf_jobs_total': ('counter', 'Finished extraction jobs, by status.'),
+    'pdf_downloads_total': ('counter', 'Table downloads, by format and content coding.'),
+    'pdf_download_bytes_total': ('counter', 'Bytes of table downloads sent.'),
+    'pdf_table_rows_total': ('counter', 'Table rows loaded for row queries.'),
+    'pdf_search_segments_total': ('counter', 'Table segments added to the search index.'),
+    'pdf_admission_rejected_total': ('counter', 'Uploads refused with 503 for a full extraction queue, by endpoint.'),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _as_snapshot(counters, histograms):
+    return {
+        'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [
+            [name, dict(labels), list(buckets), total, count]
+            for (name, labels), (buckets, total, count) in histograms.items()
+        ],
+    }
+
+
+class MetricsRegistry:
+    """Counters and histograms of one process, keyed by metric name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = 0
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Count per bucket (the last one is +Inf), sum and count
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect_left(BUCKETS, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        """Observes the duration of the block in pdf_stage_seconds, also usable as a decorator."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('pdf_stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def snapshot(self):
+        """JSON-serializable copy of every metric."""
+        with self._lock:
+            return _as_snapshot(self._counters, self._histograms)
+
+    def drain(self):
+        """Returns the snapshot and starts over from zero."""
+        with self._lock:
+            counters, histograms = self._counters, self._histograms
+            self._counters, self._histograms = {}, {}
+        return _as_snapshot(counters, histograms)
+
+    def merge(self, snapshot):
+        """Adds a snapshot of another registry to this one."""
+        with self._lock:
+            for name, labels, value in snapshot['counters']:
+                key = _key(name, labels)
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, buckets, total, count in snapshot['histograms']:
+                histogram = self._histograms.setdefault(_key(name, labels), [[0] * (len(BUCKETS) + 1), 0.0, 0])
+                histogram[0] = [mine + theirs for mine, theirs in zip(histogram[0], buckets)]
+                histogram[1] += total
+                histogram[2] += count
+
+    def flush(self, force=False):
+        """Writes the snapshot of this process to PDF_METRICS_DIR when the flush interval has passed."""
+        directory = getattr(settings, 'PDF_METRICS_DIR', '')
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < getattr(settings, 'PDF_METRICS_FLUSH_INTERVAL', 10):
+            return
+        self._flushed_at = now
+
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(snapshot_file.name, snapshot_path())
+
+
+registry = MetricsRegistry()
+
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+drain = registry.drain
+merge = registry.merge
+flush = registry.flush
+
+
+def reset():
+    """Clears the registry of this process, the initializer of page-parallel pool processes."""
+    registry.reset()
+
+
+def snapshot_path():
+    """Snapshot file of the current process in PDF_METRICS_DIR."""
+    return os.path.join(settings.PDF_METRICS_DIR, f'{socket.gethostname()}-{os.getpid()}.json')
+
+
+def collect():
+    """
+    Adds up the metrics of this process and the snapshots flushed by every other one.
+
+    Snapshots not updated for PDF_METRICS_RETENTION seconds were left by
+    processes that are gone and are deleted.
+    """
+    combined = MetricsRegistry()
+    combined.merge(registry.snapshot())
+
+    directory = getattr(settings, 'PDF_METRICS_DIR', '')
+    if not directory or not os.path.isdir(directory):
+        return combined
+
+    own_snapshot = snapshot_path()
+    cutoff = time.time() - getattr(settings, 'PDF_METRICS_RETENTION', 86400)
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json') or entry.path == own_snapshot:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                continue
+            with open(entry.path) as snapshot_file:
+                combined.merge(json.load(snapshot_file))
+        except (OSError, ValueError):
+            # Removed or replaced while being read, it is picked up on the next scrape
+            continue
+    return combined
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    escaped = {name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in labels.items()}
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped.items()) + '}'
+
+
+def _by_labels(rows, name):
+    return sorted((row for row in rows if row[0] == name), key=lambda row: sorted(row[1].items()))
+
+
+def render(metrics_registry):
+    """Renders a registry in the Prometheus text exposition format."""
+    snapshot = metrics_registry.snapshot()
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+        if metric_type == 'counter':
+            for _, labels, value in _by_labels(snapshot['counters'], name):
+                lines.append(f'{name}{_labels(labels)} {value}')
+            continue
+
+        for _, labels, buckets, total, count in _by_labels(snapshot['histograms'], name):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-16 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_jobs_for_existing_pdfs(apps, schema_editor):
+    # PDFs uploaded before the queue existed were extracted inline, the CSV
+    # is the only record of whether that worked
+    Pdf = apps.get_model('extract', 'Pdf')
+    ExtractionJob = apps.get_model('extract', 'ExtractionJob')
+    ExtractionJob.objects.bulk_create(
+        ExtractionJob(pdf=pdf, status='complete' if pdf.csv_files.exists() else 'failed')
+        for pdf in Pdf.objects.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0002_csvfile_pdf_delete_pdfdocument_csvfile_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('complete', 'Complete'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('error_file', models.CharField(blank=True, max_length=1000)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='extract.pdf')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='extract_job_status_idx')],
+            },
+        ),
+        migrations.RunPython(create_jobs_for_existing_pdfs, migrations.RunPython.noop),
+    ]
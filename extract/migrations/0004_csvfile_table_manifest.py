@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-16 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0003_extractionjob'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='csvfile',
+            options={'ordering': ['page_number', 'table_index', 'id']},
+        ),
+        migrations.AddField(
+            model_name='csvfile',
+            name='format',
+            field=models.CharField(default='csv', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='csvfile',
+            name='member',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='csvfile',
+            name='page_number',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='csvfile',
+            name='table_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='output_format',
+            field=models.CharField(default='csv', max_length=20),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-16 13:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def copy_latest_job_status(apps, schema_editor):
+    Pdf = apps.get_model('extract', 'Pdf')
+    ExtractionJob = apps.get_model('extract', 'ExtractionJob')
+    latest_status = ExtractionJob.objects.filter(pdf=OuterRef('pk')).order_by('-created_at', '-id').values('status')[:1]
+    Pdf.objects.update(status=Coalesce(Subquery(latest_status), Value('failed')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0004_csvfile_table_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdf',
+            name='status',
+            field=models.CharField(default='queued', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(fields=['uploaded_at', 'id'], name='extract_pdf_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pdf',
+            index=models.Index(fields=['status', 'uploaded_at', 'id'], name='extract_pdf_status_idx'),
+        ),
+        migrations.RunPython(copy_latest_job_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.4 on 2026-10-16 15:02
+
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def wrap_existing_tables_in_results(apps, schema_editor):
+    # Tables extracted before the cache existed get a result under an unknown
+    # engine version, so they are listed but never served as a cache hit
+    Pdf = apps.get_model('extract', 'Pdf')
+    ExtractionResult = apps.get_model('extract', 'ExtractionResult')
+    CsvFile = apps.get_model('extract', 'CsvFile')
+    ExtractionJob = apps.get_model('extract', 'ExtractionJob')
+
+    for pdf in Pdf.objects.filter(csv_files__isnull=False).distinct().iterator():
+        payload = json.dumps([pdf.hash, 'pdfplumber', '', {'output_format': 'csv'}], sort_keys=True)
+        result = ExtractionResult.objects.create(
+            pdf=pdf,
+            cache_key=hashlib.sha256(payload.encode('utf-8')).hexdigest(),
+            engine='pdfplumber',
+            options={'output_format': 'csv'},
+        )
+        CsvFile.objects.filter(pdf=pdf).update(result=result)
+        ExtractionJob.objects.filter(pdf=pdf, status='complete').update(result=result)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0005_pdf_status_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('engine', models.CharField(max_length=50)),
+                ('engine_version', models.CharField(blank=True, max_length=50)),
+                ('options', models.JSONField(default=dict)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='extract.pdf')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='csvfile',
+            name='result',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tables', to='extract.extractionresult'),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='result',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='extract.extractionresult'),
+        ),
+        migrations.RunPython(wrap_existing_tables_in_results, migrations.RunPython.noop),
+    ]
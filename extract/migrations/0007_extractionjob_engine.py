@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-16 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0006_extractionresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='engine',
+            field=models.CharField(default='pdfplumber', max_length=50),
+        ),
+    ]
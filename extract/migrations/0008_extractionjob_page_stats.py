@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-16 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0007_extractionjob_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='page_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
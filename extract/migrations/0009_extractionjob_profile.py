@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0008_extractionjob_page_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='profile',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='profile_file',
+            field=models.CharField(blank=True, max_length=1000),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='extractionjob',
+            index=models.Index(fields=['pdf', '-created_at', '-id'], name='extract_job_pdf_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-17 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_data_index(apps, schema_editor):
+    # Serves data @> '{"column": "value"}' lookups, only Postgres has GIN indexes
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX extract_row_data_gin ON extract_tablerow USING gin (data jsonb_path_ops)')
+
+
+def drop_data_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS extract_row_data_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0012_extractionjob_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('table_index', models.PositiveIntegerField(blank=True, null=True)),
+                ('row_number', models.PositiveIntegerField()),
+                ('data', models.JSONField()),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='extract.pdf')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='extract.extractionresult')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='extract.csvfile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['pdf', 'page_number', 'table_index', 'row_number'], name='extract_row_position_idx')],
+            },
+        ),
+        migrations.RunPython(create_data_index, drop_data_index),
+    ]
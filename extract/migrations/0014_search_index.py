@@ -0,0 +1,58 @@
+# Generated by Django 5.1.4 on 2026-10-17 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_search_vector(apps, schema_editor):
+    # The tsvector of a segment and its GIN index only exist on Postgres,
+    # other databases use SearchPosting
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE extract_searchsegment ADD COLUMN search_vector tsvector')
+        schema_editor.execute('CREATE INDEX extract_search_vector_gin ON extract_searchsegment USING gin (search_vector)')
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS extract_search_vector_gin')
+        schema_editor.execute('ALTER TABLE extract_searchsegment DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0013_tablerow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.PositiveIntegerField()),
+                ('page_number', models.PositiveIntegerField(blank=True, null=True)),
+                ('table_index', models.PositiveIntegerField(blank=True, null=True)),
+                ('pdf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_segments', to='extract.pdf')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_segments', to='extract.extractionresult')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_segments', to='extract.csvfile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField()),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='extract.searchsegment')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchsegment',
+            constraint=models.UniqueConstraint(fields=('table', 'segment'), name='extract_search_segment_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='searchposting',
+            index=models.Index(fields=['term', 'segment'], name='extract_search_term_idx'),
+        ),
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-17 12:25
+
+from django.db import migrations, models
+
+import extract.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0014_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='csvfile',
+            name='file',
+            field=models.FileField(max_length=1000, upload_to=extract.models.table_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='pdf',
+            name='file',
+            field=models.FileField(upload_to=extract.models.pdf_upload_to),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('extract', '0015_storage_layout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='estimated_memory',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='extractionjob',
+            name='estimated_pages',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='extractionjob',
+            index=models.Index(fields=['status', 'finished_at'], name='extract_job_finished_idx'),
+        ),
+    ]
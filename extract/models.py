@@ -1,19 +1,204 @@
+import os
+import uuid
+
 from django.db import models
 
+from .storage import pdf_path, tables_dir
+
+
+def pdf_upload_to(instance, filename):
+    return pdf_path(instance.hash)
+
+
+def table_upload_to(instance, filename):
+    return os.path.join(tables_dir(instance.pdf.hash), filename)
+
 
 class Pdf(models.Model):
-    file = models.FileField(upload_to='pdfs/%Y/%m/%d/')
+    file = models.FileField(upload_to=pdf_upload_to)
     hash = models.CharField(max_length=1000, unique=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # State of the latest extraction job, kept here so listings can filter on it
+    status = models.CharField(max_length=20, default='queued')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['uploaded_at', 'id'], name='extract_pdf_uploaded_idx'),
+            models.Index(fields=['status', 'uploaded_at', 'id'], name='extract_pdf_status_idx'),
+        ]
 
     def __str__(self):
         return f"PDF {self.hash[:8]}..." # Displaying the first 8 characters of the hash
 
 
+class ExtractionResult(models.Model):
+    """
+    Cached tables of one PDF for one combination of extractor settings.
+
+    cache_key hashes the PDF hash, engine, engine version and options (see
+    extract.cache.result_cache_key); last_used_at drives LRU eviction.
+    """
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, related_name='results')
+    cache_key = models.CharField(max_length=64, unique=True)
+    engine = models.CharField(max_length=50)
+    engine_version = models.CharField(max_length=50, blank=True)
+    options = models.JSONField(default=dict)
+    size_bytes = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.engine} result for {self.pdf.hash[:8]}..."
+
+
 class CsvFile(models.Model):
+    """
+    One extracted table. Tables saved as a zip bundle share the file and are
+    told apart by their member name.
+    """
     pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, related_name='csv_files')
-    file = models.FileField(max_length=1000, upload_to='csvs/%Y/%m/%d/')
+    result = models.ForeignKey(ExtractionResult, on_delete=models.CASCADE, related_name='tables', null=True, blank=True)
+    file = models.FileField(max_length=1000, upload_to=table_upload_to)
+    member = models.CharField(max_length=255, blank=True)
+    format = models.CharField(max_length=20, default='csv')
+    page_number = models.PositiveIntegerField(null=True, blank=True)
+    table_index = models.PositiveIntegerField(null=True, blank=True)
     extracted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['page_number', 'table_index', 'id']
+
     def __str__(self):
         return f"CSV for {self.pdf.hash[:8]}..."
+
+
+class ExtractionJob(models.Model):
+    """
+    A unit of extraction work for a PDF.
+
+    Jobs are queued by the upload endpoint and claimed by the workers started
+    with ``manage.py run_extraction_workers``; the table itself is the queue.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    output_format = models.CharField(max_length=20, default='csv')
+    engine = models.CharField(max_length=50, default='pdfplumber')
+    attempts = models.PositiveIntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    error_file = models.CharField(max_length=1000, blank=True)
+    result = models.ForeignKey(ExtractionResult, on_delete=models.SET_NULL, related_name='jobs', null=True, blank=True)
+    # Pre-filter statistics of the run: pages, skipped_<reason>, candidates, candidates_without_tables
+    page_stats = models.JSONField(default=dict, blank=True)
+    # Run under cProfile, the report is stored in profile_file
+    profile = models.BooleanField(default=False)
+    profile_file = models.CharField(max_length=1000, blank=True)
+    # Progress of the running attempt, updated by the worker every PDF_PROGRESS_INTERVAL seconds
+    pages_total = models.PositiveIntegerField(null=True, blank=True)
+    pages_done = models.PositiveIntegerField(default=0)
+    tables_found = models.PositiveIntegerField(default=0)
+    progress_at = models.DateTimeField(null=True, blank=True)
+    # Cost estimated when queued, see extract.admission
+    estimated_pages = models.PositiveIntegerField(default=0)
+    estimated_memory = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='extract_job_status_idx'),
+            # The latest job of a PDF, read by the status endpoint
+            models.Index(fields=['pdf', '-created_at', '-id'], name='extract_job_pdf_latest_idx'),
+            # Recent throughput, read when uploads are refused for a full queue
+            models.Index(fields=['status', 'finished_at'], name='extract_job_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} for {self.pdf.hash[:8]}... ({self.status})"
+
+
+class TableRow(models.Model):
+    """
+    One row of an extracted table, loaded when PDF_INGEST_TABLE_ROWS is on so
+    rows can be looked up without downloading the tables (see extract.rows).
+    data maps the column names of the table to the cell values.
+    """
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, related_name='rows')
+    result = models.ForeignKey(ExtractionResult, on_delete=models.CASCADE, related_name='rows')
+    table = models.ForeignKey(CsvFile, on_delete=models.CASCADE, related_name='rows')
+    page_number = models.PositiveIntegerField(null=True, blank=True)
+    table_index = models.PositiveIntegerField(null=True, blank=True)
+    row_number = models.PositiveIntegerField()
+    data = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pdf', 'page_number', 'table_index', 'row_number'], name='extract_row_position_idx'),
+        ]
+
+    def __str__(self):
+        return f"Row {self.row_number} of page {self.page_number} table {self.table_index} of {self.pdf.hash[:8]}..."
+
+
+class SearchSegment(models.Model):
+    """
+    Up to SEGMENT_ROWS rows of an extracted table in the full-text search
+    index (see extract.search). On Postgres the text is held in the
+    search_vector tsvector column added by migration 0014, elsewhere in the
+    SearchPosting rows of the segment.
+    """
+    pdf = models.ForeignKey(Pdf, on_delete=models.CASCADE, related_name='search_segments')
+    result = models.ForeignKey(ExtractionResult, on_delete=models.CASCADE, related_name='search_segments')
+    table = models.ForeignKey(CsvFile, on_delete=models.CASCADE, related_name='search_segments')
+    segment = models.PositiveIntegerField()
+    page_number = models.PositiveIntegerField(null=True, blank=True)
+    table_index = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['table', 'segment'], name='extract_search_segment_unique'),
+        ]
+
+    def __str__(self):
+        return f"Segment {self.segment} of page {self.page_number} table {self.table_index} of {self.pdf.hash[:8]}..."
+
+
+class SearchPosting(models.Model):
+    """Entry of the local inverted index: how often a term occurs in a segment."""
+    term = models.CharField(max_length=100)
+    segment = models.ForeignKey(SearchSegment, on_delete=models.CASCADE, related_name='postings')
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'segment'], name='extract_search_term_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload. Chunks are written to a spool file under
+    MEDIA_ROOT/uploads/ until received reaches size and the upload is
+    finalized, see extract.uploads.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField()
+    # Bytes received so far, chunks have to start at this offset
+    received = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.pk} ({self.received}/{self.size} bytes)"
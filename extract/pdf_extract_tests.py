@@ -1,25 +1,76 @@
+import gzip
+import hashlib
+import io
+import json
 import os
-from unittest.mock import patch
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from itertools import islice
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, patch
 
 import django
 import psycopg2
 import pytest
+from asgiref.sync import async_to_sync
 from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
-from .models import CsvFile, Pdf
+from . import metrics
+from .admission import choose_job, count_pages, estimate_cost
+from .cache import extraction_identity, result_cache_key
+from .engines import AutoEngine, aligned_text_columns
+from .jobs import claim_next_job, progress_recorder, run_job
+from .models import CsvFile, ExtractionJob, ExtractionResult, Pdf, UploadSession
+from .rows import ingest_rows
+from .search import index_result
+from .storage import collect_garbage, full_path, pdf_path, store_pdf, tables_dir
+from .uploads import UploadOffsetMismatch, write_chunk
+from .utils import MemoryLimitExceeded, clean_table_data, iter_tables
+from .warmup import warm_up
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from clean_table_data import reference_clean_table_data, synthetic_table  # noqa: E402
+from synthetic_pdf import build_pdf  # noqa: E402
+
+
+async def read_stream(response):
+    """Body of a response streamed from an async iterator, as the async list view returns."""
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+class MediaRootTestCase(APITestCase):
+    """
+    APITestCase that stores uploads and extracted tables in a temporary MEDIA_ROOT
+    """
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        cls.addClassCleanup(media_settings.disable)
+        super().setUpClass()
 
 
 @pytest.mark.django_db
-class TestPdfTableExtractorView(APITestCase):
+class TestPdfTableExtractorView(MediaRootTestCase):
     def setUp(self):
         self.client = APIClient()
-        self.url = reverse('pdf-table-extractor')
-        self.test_pdf_path = os.path.join(os.path.dirname(__file__), 'test_data', 'sample.pdf')
+        self.url = reverse('extract-table')
+        self.content = build_pdf(pages=2)
 
     def test_no_file_provided(self):
         """
@@ -29,62 +80,264 @@ class TestPdfTableExtractorView(APITestCase):
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.data['error'] == 'No file provided'
 
-    @patch('your_app.views.validate_file')
+    @patch('extract.admission.DECISION_TTL', 0)
+    def test_full_queue_refused(self):
+        """
+        Test that uploads get a 503 with Retry-After while too many pages are queued
+        """
+        pdf = Pdf.objects.create(file=SimpleUploadedFile('queued.pdf', b'content'), hash='queued_hash')
+        ExtractionJob.objects.create(pdf=pdf, estimated_pages=500)
+
+        with self.settings(PDF_ADMISSION_MAX_QUEUED_PAGES=100):
+            response = self.client.post(self.url)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert int(response['Retry-After']) == response.data['retry_after'] > 0
+
+        with self.settings(PDF_ADMISSION_MAX_QUEUED_PAGES=1000):
+            assert self.client.post(self.url).status_code == status.HTTP_400_BAD_REQUEST
+
+    @patch('extract.views.validate_file')
     def test_invalid_file(self, mock_validate_file):
         """
         Test API response for invalid file upload
         """
         mock_validate_file.return_value = False
-        with open(self.test_pdf_path, 'rb') as file:
-            uploaded_file = SimpleUploadedFile('sample.pdf', file.read(), content_type='application/pdf')
+        uploaded_file = SimpleUploadedFile('sample.pdf', self.content, content_type='application/pdf')
 
         response = self.client.post(self.url, {'file': uploaded_file}, format='multipart')
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.data['error'] == 'Invalid file'
 
-    @patch('your_app.views.save_temp_pdf')
-    @patch('your_app.views.extract_tables')
-    @patch('your_app.views.save_table_as_csv')
-    def test_successful_pdf_table_extraction(self, mock_save_table_as_csv, mock_extract_tables, mock_save_temp_pdf):
+    def test_successful_pdf_upload_queues_extraction(self):
         """
-        Test successful PDF table extraction
+        Test that a valid upload is stored and queued instead of extracted inline
         """
-        # Mock dependencies
-        mock_save_temp_pdf.return_value = '/tmp/sample.pdf'
-        mock_extract_tables.return_value = [['Table', 'Data'], ['Row1', 'Value']]
-        mock_save_table_as_csv.return_value = 'sample_tables.csv'
-
-        with open(self.test_pdf_path, 'rb') as file:
-            uploaded_file = SimpleUploadedFile('sample.pdf', file.read(), content_type='application/pdf')
+        uploaded_file = SimpleUploadedFile('sample.pdf', self.content, content_type='application/pdf')
 
         response = self.client.post(self.url, {'file': uploaded_file}, format='multipart')
-        assert response.status_code == status.HTTP_200_OK
-        assert 'Successfully Extracted Tables' in response.data['message']
+        assert response.status_code == status.HTTP_202_ACCEPTED
         assert 'hash' in response.data['data']
         assert 'pdf_url' in response.data['data']
-        assert 'csv_url' in response.data['data']
+        assert 'status_url' in response.data['data']
+
+        job = ExtractionJob.objects.get(pdf__hash=response.data['data']['hash'])
+        assert job.status == ExtractionJob.QUEUED
+
+    def test_non_pdf_content_rejected(self):
+        """
+        Test that a file with a .pdf name but no PDF header is rejected
+        """
+        uploaded_file = SimpleUploadedFile('sample.pdf', b'not a pdf', content_type='application/pdf')
+
+        response = self.client.post(self.url, {'file': uploaded_file}, format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['error'] == 'Invalid file: File is not a PDF'
 
     def test_duplicate_file_upload(self):
         """
         Test uploading a file with an existing hash
         """
-        # Create an existing PDF instance
-        existing_pdf = Pdf.objects.create(
-            file=SimpleUploadedFile('existing.pdf', b'content'),
-            hash='existing_hash'
+        content = self.content
+
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('sample.pdf', content)}, format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('copy.pdf', content)}, format='multipart')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['message'] == 'File Already Exists'
+        assert Pdf.objects.count() == 1
+
+    def test_reupload_served_from_result_cache(self):
+        """
+        Test that re-uploading an extracted file returns the cached tables without queueing a job
+        """
+        content = self.content
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('sample.pdf', content)}, format='multipart')
+        ExtractionJob.objects.update(status=ExtractionJob.COMPLETE)
+
+        cached_tables = [{'id': 1, 'file': 'tables/hash/page-1-table-0.csv', 'member': '', 'format': 'csv', 'page_number': 1, 'table_index': 0}]
+        with patch('extract.views.get_cached_tables', return_value=cached_tables):
+            response = self.client.post(self.url, {'file': SimpleUploadedFile('copy.pdf', content)}, format='multipart')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['message'] == 'File Already Exists'
+        assert response.data['data']['tables'][0]['page_number'] == 1
+        assert ExtractionJob.objects.count() == 1
+
+    def test_reupload_after_failure_queues_retry(self):
+        """
+        Test that re-uploading a file whose extraction failed queues a new job
+        """
+        content = self.content
+        self.client.post(self.url, {'file': SimpleUploadedFile('sample.pdf', content)}, format='multipart')
+        ExtractionJob.objects.update(status=ExtractionJob.FAILED)
+
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('copy.pdf', content)}, format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert ExtractionJob.objects.filter(status=ExtractionJob.QUEUED).count() == 1
+
+    @patch('extract.views.save_profile', return_value='errors/hash_request_profile.txt')
+    def test_staff_profiled_upload(self, mock_save_profile):
+        """
+        Test that staff can profile an upload and the queued job
+        """
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_authenticate(staff)
+        uploaded_file = SimpleUploadedFile('sample.pdf', self.content, content_type='application/pdf')
+
+        response = self.client.post(f'{self.url}?profile=1', {'file': uploaded_file}, format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['profile_url'].endswith('/media/errors/hash_request_profile.txt')
+        assert ExtractionJob.objects.get().profile
+
+    @patch('extract.views.save_profile')
+    def test_profile_flag_ignored_for_non_staff(self, mock_save_profile):
+        """
+        Test that anonymous requests cannot turn on profiling
+        """
+        uploaded_file = SimpleUploadedFile('sample.pdf', self.content, content_type='application/pdf')
+
+        response = self.client.post(self.url, {'file': uploaded_file}, format='multipart', HTTP_X_PROFILE='1')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert 'profile_url' not in response.data
+        assert not mock_save_profile.called
+        assert not ExtractionJob.objects.get().profile
+
+
+@pytest.mark.django_db
+class TestBatchExtractView(MediaRootTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('extract-batch')
+
+    def pdf(self, name):
+        return SimpleUploadedFile(name, b'%PDF-1.4\n' + name.encode() + b'\n%%EOF\n', content_type='application/pdf')
+
+    def manifest(self, response):
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson'
+        # Streamed from an async iterator, ASGI servers send it as it is written
+        assert response.is_async
+        return [json.loads(line) for line in async_to_sync(read_stream)(response).decode().splitlines()]
+
+    def test_files_and_archive_queued_in_one_batch(self):
+        """
+        Test that sent files and archive members are stored, deduplicated and queued with one manifest line each
+        """
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('c.pdf', self.pdf('c.pdf').read())
+            zip_file.writestr('again.pdf', self.pdf('a.pdf').read())
+            zip_file.writestr('notes.txt', b'not a pdf')
+        archive = SimpleUploadedFile('batch.zip', archive.getvalue(), content_type='application/zip')
+
+        response = self.client.post(self.url, {'file': [self.pdf('a.pdf'), self.pdf('b.pdf')], 'archive': archive}, format='multipart')
+        lines = self.manifest(response)
+
+        assert [line['name'] for line in lines] == ['a.pdf', 'b.pdf', 'c.pdf', 'again.pdf', 'notes.txt']
+        assert [line.get('status') for line in lines] == ['queued'] * 4 + [None]
+        assert lines[0]['hash'] == lines[3]['hash']
+        assert lines[4]['error'] == 'Invalid file'
+        assert Pdf.objects.count() == 3
+        assert ExtractionJob.objects.filter(status=ExtractionJob.QUEUED).count() == 3
+
+    def test_resent_files_not_queued_twice(self):
+        """
+        Test that files already waiting for extraction are reported with their job state instead of queued again
+        """
+        self.manifest(self.client.post(self.url, {'file': [self.pdf('a.pdf')]}, format='multipart'))
+        lines = self.manifest(self.client.post(self.url, {'file': [self.pdf('a.pdf'), self.pdf('b.pdf')]}, format='multipart'))
+
+        assert [(line['existing'], line['status']) for line in lines] == [(True, 'queued'), (False, 'queued')]
+        assert ExtractionJob.objects.count() == 2
+
+
+@pytest.mark.django_db
+class TestResumableUpload(MediaRootTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.content = b'%PDF-1.4\n' + os.urandom(1000) + b'\n%%EOF\n'
+        response = self.client.post(reverse('upload-create'), {'size': len(self.content), 'filename': 'big.pdf'})
+        assert response.status_code == status.HTTP_201_CREATED
+        self.session_url = response.data['upload_url']
+
+    def put_chunk(self, first, last):
+        return self.client.generic(
+            'PUT', self.session_url, self.content[first:last + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{len(self.content)}'
         )
 
-        with patch('your_app.views.generate_file_hash', return_value='existing_hash'):
-            with open(self.test_pdf_path, 'rb') as file:
-                uploaded_file = SimpleUploadedFile('sample.pdf', file.read(), content_type='application/pdf')
+    def test_chunks_finalized_into_queued_extraction(self):
+        """
+        Test that an upload sent in chunks is stored under its hash and queued like a single request upload
+        """
+        assert self.put_chunk(0, 499).data['received'] == 500
+        assert self.client.get(self.session_url).data['received'] == 500
+        assert self.put_chunk(500, len(self.content) - 1).data['received'] == len(self.content)
 
-            response = self.client.post(self.url, {'file': uploaded_file}, format='multipart')
-            assert response.status_code == status.HTTP_200_OK
-            assert response.data['message'] == 'File Already Exists'
+        response = self.client.post(self.session_url + 'finalize/')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['data']['hash'] == hashlib.sha256(self.content).hexdigest()
+        assert ExtractionJob.objects.get(pdf__hash=response.data['data']['hash']).status == ExtractionJob.QUEUED
+        assert not UploadSession.objects.exists()
+
+    def test_out_of_order_chunk_rejected(self):
+        """
+        Test that a chunk not starting at the received offset is rejected with the offset to resume from
+        """
+        self.put_chunk(0, 99)
+        response = self.put_chunk(200, 299)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['received'] == 100
+
+        response = self.client.post(self.session_url + 'finalize/')
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_concurrent_chunk_for_same_range_not_spooled(self):
+        """
+        Test that of two requests for the same range only the one advancing the session is spooled and hashed
+        """
+        session = UploadSession.objects.get()
+        put_chunk = self.put_chunk
+
+        class RacingStream(io.BytesIO):
+            def read(self, size=-1):
+                # The other request completes while this one receives its body
+                if not self.tell():
+                    assert put_chunk(0, 499).status_code == status.HTTP_200_OK
+                return super().read(size)
+
+        with pytest.raises(UploadOffsetMismatch):
+            write_chunk(session, 0, 500, RacingStream(b'%PDF-9' + b'x' * 494))
+        self.put_chunk(500, len(self.content) - 1)
+
+        response = self.client.post(self.session_url + 'finalize/')
+        digest = response.data['data']['hash']
+        assert digest == hashlib.sha256(self.content).hexdigest()
+        with open(full_path(pdf_path(digest)), 'rb') as stored:
+            assert stored.read() == self.content
+
+    def test_upload_smaller_than_pdf_header_rejected(self):
+        """
+        Test that a session too small to hold the PDF header is refused
+        """
+        response = self.client.post(reverse('upload-create'), {'size': 3, 'filename': 'tiny.pdf'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['error'] == 'size must be at least 5 bytes'
+
+    def test_non_pdf_upload_rejected(self):
+        """
+        Test that the upload is dropped once its first bytes show it is not a PDF
+        """
+        self.content = b'not a pdf' + self.content[9:]
+        response = self.put_chunk(0, 99)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['error'] == 'Invalid chunk: File is not a PDF'
+        assert not UploadSession.objects.exists()
 
 
 @pytest.mark.django_db
-class TestPdfProcessingStatusView(APITestCase):
+class TestPdfProcessingStatusView(MediaRootTestCase):
     def setUp(self):
         self.client = APIClient()
         self.test_hash = 'test_hash_123'
@@ -101,8 +354,9 @@ class TestPdfProcessingStatusView(APITestCase):
             pdf=pdf,
             file=SimpleUploadedFile('tables.csv', b'csv content')
         )
+        ExtractionJob.objects.create(pdf=pdf, status=ExtractionJob.COMPLETE)
 
-        url = reverse('pdf-processing-status', kwargs={'hash': self.test_hash})
+        url = reverse('pdf-status', kwargs={'hash': self.test_hash})
         response = self.client.get(url)
 
         assert response.status_code == status.HTTP_200_OK
@@ -110,20 +364,37 @@ class TestPdfProcessingStatusView(APITestCase):
         assert 'pdf_url' in response.data
         assert 'csv_url' in response.data
 
+    def test_queued_processing(self):
+        """
+        Test status for a PDF whose extraction job has not been picked up yet
+        """
+        pdf = Pdf.objects.create(
+            file=SimpleUploadedFile('sample.pdf', b'content'),
+            hash=self.test_hash
+        )
+        ExtractionJob.objects.create(pdf=pdf)
+
+        url = reverse('pdf-status', kwargs={'hash': self.test_hash})
+        response = self.client.get(url)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status'] == 'queued'
+
     def test_in_progress_processing(self):
         """
         Test status for a PDF still being processed
         """
-        Pdf.objects.create(
+        pdf = Pdf.objects.create(
             file=SimpleUploadedFile('sample.pdf', b'content'),
             hash=self.test_hash
         )
+        ExtractionJob.objects.create(pdf=pdf, status=ExtractionJob.RUNNING)
 
-        url = reverse('pdf-processing-status', kwargs={'hash': self.test_hash})
+        url = reverse('pdf-status', kwargs={'hash': self.test_hash})
         response = self.client.get(url)
 
         assert response.status_code == status.HTTP_200_OK
-        assert response.data['status'] == 'in-progress'
+        assert response.data['status'] == 'running'
 
     def test_failed_processing(self):
         """
@@ -133,22 +404,401 @@ class TestPdfProcessingStatusView(APITestCase):
             file=SimpleUploadedFile('sample.pdf', b'content'),
             hash=self.test_hash
         )
+        ExtractionJob.objects.create(
+            pdf=pdf,
+            status=ExtractionJob.FAILED,
+            error_file=f'errors/{self.test_hash}_error.txt'
+        )
 
-        # Simulate error file creation
-        os.makedirs('media/errors', exist_ok=True)
-        with open(f'media/errors/{self.test_hash}.txt', 'w') as f:
-            f.write('Processing error details')
-
-        url = reverse('pdf-processing-status', kwargs={'hash': self.test_hash})
+        url = reverse('pdf-status', kwargs={'hash': self.test_hash})
         response = self.client.get(url)
 
         assert response.status_code == status.HTTP_200_OK
         assert response.data['status'] == 'failed'
         assert 'error_file_url' in response.data
 
+    def test_poll_is_one_query_and_unchanged_poll_not_modified(self):
+        """
+        Test that a status poll reads one row and an unchanged job answers If-None-Match with 304
+        """
+        pdf = Pdf.objects.create(file=SimpleUploadedFile('sample.pdf', b'content'), hash=self.test_hash)
+        job = ExtractionJob.objects.create(pdf=pdf, status=ExtractionJob.RUNNING)
+        url = reverse('pdf-status', kwargs={'hash': self.test_hash})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+
+        ExtractionJob.objects.filter(pk=job.pk).update(status=ExtractionJob.FAILED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status'] == 'failed'
+
+    def test_unknown_hash_not_found(self):
+        """
+        Test status for a hash that was never uploaded
+        """
+        response = self.client.get(reverse('pdf-status', kwargs={'hash': 'unknown'}))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_running_job_progress(self):
+        """
+        Test that a running job reports its pages, tables and an ETA from the measured rate
+        """
+        pdf = Pdf.objects.create(file=SimpleUploadedFile('sample.pdf', b'content'), hash=self.test_hash)
+        now = timezone.now()
+        ExtractionJob.objects.create(
+            pdf=pdf, status=ExtractionJob.RUNNING, started_at=now - timedelta(seconds=10), progress_at=now,
+            pages_done=5, pages_total=10, tables_found=3
+        )
+
+        response = self.client.get(reverse('pdf-status', kwargs={'hash': self.test_hash}))
+        progress = response.data['progress']
+        assert (progress['pages_done'], progress['pages_total'], progress['tables_found']) == (5, 10, 3)
+        assert progress['percent'] == 50.0
+        assert progress['pages_per_second'] == 0.5
+        assert 9 <= progress['eta_seconds'] <= 10
+
+    def test_event_stream_ends_with_final_status(self):
+        """
+        Test that the event stream sends the final status, and a reconnect after it gets 204
+        """
+        pdf = Pdf.objects.create(file=SimpleUploadedFile('sample.pdf', b'content'), hash=self.test_hash)
+        ExtractionJob.objects.create(pdf=pdf, status=ExtractionJob.FAILED)
+        url = reverse('pdf-status-events', kwargs={'hash': self.test_hash})
+
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        assert response['Content-Type'] == 'text/event-stream'
+        events = async_to_sync(read_stream)(response).decode()
+        event = dict(line.split(': ', 1) for line in events.split('\n\n')[1].splitlines())
+        assert event['event'] == 'status'
+        assert json.loads(event['data'])['status'] == 'failed'
+
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID=event['id'])
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
 
 @pytest.mark.django_db
-class TestPdfListView(APITestCase):
+class TestExtractionJobs(MediaRootTestCase):
+    def setUp(self):
+        self.pdf = Pdf.objects.create(
+            file=SimpleUploadedFile('sample.pdf', b'content'),
+            hash='job_hash'
+        )
+
+    def test_claim_next_job(self):
+        """
+        Test that queued jobs are claimed oldest first and only once
+        """
+        first = ExtractionJob.objects.create(pdf=self.pdf)
+        second = ExtractionJob.objects.create(pdf=self.pdf)
+
+        claimed = claim_next_job('worker-1')
+        assert claimed.pk == first.pk
+        assert claimed.status == ExtractionJob.RUNNING
+        assert claimed.attempts == 1
+        assert claim_next_job('worker-2').pk == second.pk
+        assert claim_next_job('worker-3') is None
+
+    def test_claim_within_memory_budget(self):
+        """
+        Test that a job that does not fit next to the running ones waits while a smaller one overtakes it
+        """
+        gib = 2 ** 30
+        big = ExtractionJob.objects.create(pdf=self.pdf, estimated_memory=3 * gib)
+        small = ExtractionJob.objects.create(pdf=self.pdf, estimated_memory=gib)
+
+        with self.settings(PDF_EXTRACTION_MEMORY_BUDGET=4 * gib):
+            assert claim_next_job('host:1').pk == big.pk
+            assert claim_next_job('host:2').pk == small.pk
+            bigger = ExtractionJob.objects.create(pdf=self.pdf, estimated_memory=5 * gib)
+            assert claim_next_job('host:3') is None
+            # Other hosts have their own budget, and a job alone on its host always runs
+            assert claim_next_job('other-host:1').pk == bigger.pk
+
+    def test_concurrent_claims_within_memory_budget(self):
+        """
+        Test that two workers of a host choosing at the same time do not claim more than the budget together
+        """
+        gib = 2 ** 30
+        ExtractionJob.objects.create(pdf=self.pdf, status=ExtractionJob.RUNNING, worker='host:0', estimated_memory=gib)
+        first = ExtractionJob.objects.create(pdf=self.pdf, estimated_memory=3 * gib)
+        second = ExtractionJob.objects.create(pdf=self.pdf, estimated_memory=3 * gib)
+        raced = []
+
+        def choose_then_race(queued, worker, budget):
+            job = choose_job(queued, worker, budget)
+            if not raced:
+                raced.append(job)
+                # host:2 claims between the choice of host:1 and its UPDATE, skipping the row host:1 holds
+                with patch('extract.jobs.choose_job', lambda queued, worker, budget: choose_job(queued.exclude(pk=job.pk), worker, budget)):
+                    assert claim_next_job('host:2').pk == second.pk
+            return job
+
+        with self.settings(PDF_EXTRACTION_MEMORY_BUDGET=5 * gib), patch('extract.jobs.choose_job', choose_then_race):
+            assert claim_next_job('host:1') is None
+        assert raced == [first]
+        assert ExtractionJob.objects.get(pk=first.pk).status == ExtractionJob.QUEUED
+
+    @patch('extract.jobs.index_result', return_value=0)
+    @patch('extract.jobs.precompress_tables', return_value=0)
+    @patch('extract.jobs.artifact_size', return_value=0)
+    @patch('extract.jobs.save_tables')
+    @patch('extract.jobs.iter_tables')
+    def test_run_job_complete(self, mock_iter_tables, mock_save_tables, mock_artifact_size, mock_precompress_tables,
+                              mock_index_result):
+        """
+        Test that a successful extraction stores one row per table and completes the job
+        """
+        mock_iter_tables.return_value = (table for table in [[['Table', 'Data'], ['Row1', 'Value']]] * 2)
+        mock_save_tables.return_value = [
+            {'path': f'tables/job_hash/page-1-table-{index}.csv', 'member': '', 'page_number': 1, 'table_index': index, 'format': 'csv'}
+            for index in range(2)
+        ]
+        ExtractionJob.objects.create(pdf=self.pdf)
+
+        job = run_job(claim_next_job())
+        assert job.status == ExtractionJob.COMPLETE
+        assert job.result is not None
+        assert list(CsvFile.objects.filter(result=job.result).values_list('page_number', 'table_index')) == [(1, 0), (1, 1)]
+
+    @patch('extract.jobs.save_error_details')
+    @patch('extract.jobs.precompress_tables', return_value=0)
+    @patch('extract.jobs.artifact_size', return_value=0)
+    @patch('extract.jobs.save_tables')
+    @patch('extract.jobs.iter_tables')
+    def test_concurrent_result_reused(self, mock_iter_tables, mock_save_tables, mock_artifact_size, mock_precompress_tables,
+                                      mock_save_error_details):
+        """
+        Test that a job losing the insert of its result to a concurrent job completes with the stored one
+        """
+        mock_iter_tables.return_value = (table for table in [[['Table', 'Data'], ['Row1', 'Value']]])
+        job = ExtractionJob.objects.create(pdf=self.pdf)
+        engine, engine_version, options = extraction_identity(job.engine, job.output_format)
+        cache_key = result_cache_key(self.pdf.hash, engine, engine_version, options)
+
+        def save_tables(tables, file_hash, output_format, variant):
+            list(tables)
+            # The concurrent job finishes while this one writes its tables
+            ExtractionResult.objects.create(pdf=self.pdf, cache_key=cache_key, engine=engine, engine_version=engine_version,
+                                            options=options, size_bytes=0)
+            return [{'path': f'tables/job_hash/{variant}/page-1-table-0.csv', 'member': '', 'page_number': 1, 'table_index': 0, 'format': 'csv'}]
+
+        mock_save_tables.side_effect = save_tables
+        with patch('extract.jobs.shutil.rmtree') as mock_rmtree:
+            job = run_job(claim_next_job())
+        assert job.status == ExtractionJob.COMPLETE
+        assert job.result == ExtractionResult.objects.get(cache_key=cache_key)
+        assert Pdf.objects.get(pk=self.pdf.pk).status == ExtractionJob.COMPLETE
+        assert not mock_rmtree.called
+        assert not mock_save_error_details.called
+
+    @patch('extract.jobs.save_error_details')
+    @patch('extract.jobs.iter_tables')
+    def test_run_job_failed(self, mock_iter_tables, mock_save_error_details):
+        """
+        Test that an extraction error is recorded on the job
+        """
+        mock_iter_tables.side_effect = RuntimeError('Broken PDF')
+        mock_save_error_details.return_value = 'errors/job_hash_error.txt'
+        ExtractionJob.objects.create(pdf=self.pdf)
+
+        job = run_job(claim_next_job())
+        assert job.status == ExtractionJob.FAILED
+        assert job.error_file == 'errors/job_hash_error.txt'
+        assert 'RuntimeError: Broken PDF' in mock_save_error_details.call_args.args[1]
+
+    @patch('extract.jobs.save_profile', return_value='errors/job_hash_job-1_profile.txt')
+    @patch('extract.jobs.save_error_details')
+    @patch('extract.jobs.iter_tables')
+    def test_run_job_profiled(self, mock_iter_tables, mock_save_error_details, mock_save_profile):
+        """
+        Test that a job queued with profile stores its report whatever the outcome
+        """
+        mock_iter_tables.side_effect = RuntimeError('Broken PDF')
+        mock_save_error_details.return_value = 'errors/job_hash_error.txt'
+        ExtractionJob.objects.create(pdf=self.pdf, profile=True)
+
+        job = run_job(claim_next_job())
+        assert job.status == ExtractionJob.FAILED
+        assert ExtractionJob.objects.get(pk=job.pk).profile_file == 'errors/job_hash_job-1_profile.txt'
+
+    @patch('extract.jobs.save_error_details')
+    @patch('extract.jobs.iter_tables')
+    def test_run_job_memory_limit(self, mock_iter_tables, mock_save_error_details):
+        """
+        Test that hitting the memory ceiling fails the job with the reason instead of a traceback
+        """
+        mock_iter_tables.side_effect = MemoryLimitExceeded('Extraction stopped after page 7')
+        mock_save_error_details.return_value = 'errors/job_hash_error.txt'
+        ExtractionJob.objects.create(pdf=self.pdf)
+
+        job = run_job(claim_next_job())
+        assert job.status == ExtractionJob.FAILED
+        assert mock_save_error_details.call_args.args[1] == 'Extraction stopped after page 7'
+
+    def test_progress_recorder_throttles_writes(self):
+        """
+        Test that progress is written on the first and last page and at most once per interval in between
+        """
+        ExtractionJob.objects.create(pdf=self.pdf)
+        job = claim_next_job()
+        record = progress_recorder(job, interval=60)
+
+        for pages_done, tables_found in [(0, 0), (4, 2), (10, 5)]:
+            record(pages_done, 10, tables_found)
+            stored = ExtractionJob.objects.get(pk=job.pk)
+            if pages_done == 4:
+                assert stored.pages_done == 0
+        assert (stored.pages_done, stored.pages_total, stored.tables_found) == (10, 10, 5)
+        assert stored.progress_at is not None
+
+
+@pytest.mark.django_db
+class TestTableDownloadView(MediaRootTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        pdf = Pdf.objects.create(file=SimpleUploadedFile('sample.pdf', b'content'), hash='download_hash')
+        table = CsvFile.objects.create(pdf=pdf, file=SimpleUploadedFile('page-1-table-0.csv', b'Name,Value\na,1\nb,2\n'))
+        self.url = reverse('table-download', kwargs={'pk': table.pk})
+
+    def test_csv_gzip(self):
+        """
+        Test that a client accepting gzip gets the stored CSV compressed
+        """
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'text/csv'
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(async_to_sync(read_stream)(response)) == b'Name,Value\na,1\nb,2\n'
+
+    def test_json_lines_range_and_conditional(self):
+        """
+        Test JSON Lines negotiation, a byte range of it and a conditional request
+        """
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson')
+        body = async_to_sync(read_stream)(response)
+        assert [json.loads(line) for line in body.splitlines()] == [{'Name': 'a', 'Value': '1'}, {'Name': 'b', 'Value': '2'}]
+
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson', HTTP_RANGE='bytes=0-9')
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Range'] == f'bytes 0-9/{len(body)}'
+        assert async_to_sync(read_stream)(response) == body[:10]
+
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson', HTTP_IF_NONE_MATCH=response['ETag'])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_unacceptable_format(self):
+        """
+        Test that a format the endpoint cannot produce is refused
+        """
+        response = self.client.get(self.url, HTTP_ACCEPT='application/xml')
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+
+@pytest.mark.django_db
+class TestTableRowQueryView(MediaRootTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('table-rows')
+        self.pdf = Pdf.objects.create(file=SimpleUploadedFile('sample.pdf', b'content'), hash='rows_hash')
+        result = ExtractionResult.objects.create(pdf=self.pdf, cache_key='rows_key', engine='pdfplumber')
+        CsvFile.objects.create(
+            pdf=self.pdf, result=result, page_number=2, table_index=1,
+            file=SimpleUploadedFile('page-2-table-1.csv', b'Account,Amount\n1001,5.00\n1002,7.50\n1003,9.00\n')
+        )
+        self.loaded = ingest_rows(result)
+
+    def test_lookup_by_column_value(self):
+        """
+        Test that a column/value lookup returns the matching row with its provenance
+        """
+        assert self.loaded == 3
+        response = self.client.get(self.url, {'column': 'Account', 'value': '1002'})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['rows']) == 1
+        row = response.data['rows'][0]
+        assert (row['pdf'], row['page_number'], row['table_index'], row['row_number']) == ('rows_hash', 2, 1, 1)
+        assert row['data'] == {'Account': '1002', 'Amount': '7.50'}
+
+        response = self.client.get(self.url, {'column': 'Account', 'value': '1002', 'pdf': 'other_hash'})
+        assert response.data['rows'] == []
+
+    def test_rows_of_document_paginated(self):
+        """
+        Test keyset pagination over the rows of one document
+        """
+        response = self.client.get(self.url, {'pdf': 'rows_hash', 'limit': 2})
+        assert [row['row_number'] for row in response.data['rows']] == [0, 1]
+
+        response = self.client.get(self.url, {'pdf': 'rows_hash', 'limit': 2, 'cursor': response.data['next_cursor']})
+        assert [row['row_number'] for row in response.data['rows']] == [2]
+        assert response.data['next_cursor'] is None
+
+    def test_filter_required(self):
+        """
+        Test that a lookup over every row of every document is refused
+        """
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTableSearchView(MediaRootTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('table-search')
+        self.pdf = Pdf.objects.create(file=SimpleUploadedFile('sample.pdf', b'content'), hash='search_hash')
+        self.result = ExtractionResult.objects.create(pdf=self.pdf, cache_key='search_key', engine='pdfplumber')
+        CsvFile.objects.create(
+            pdf=self.pdf, result=self.result, page_number=1, table_index=0,
+            file=SimpleUploadedFile('page-1-table-0.csv', b'Account,Holder\nACC-1001,Jane Doe\nACC-1002,John Roe\n')
+        )
+        CsvFile.objects.create(
+            pdf=self.pdf, result=self.result, page_number=3, table_index=0,
+            file=SimpleUploadedFile('page-3-table-0.csv', b'Holder,Note\nJane Doe,Jane Doe again\nJohn Roe,closed\n')
+        )
+        self.indexed = index_result(self.result)
+
+    def test_search_ranks_tables(self):
+        """
+        Test that tables containing every term are found, the better match first
+        """
+        assert self.indexed == 2
+        response = self.client.get(self.url, {'q': 'jane doe'})
+        assert response.status_code == status.HTTP_200_OK
+        [document] = response.data['documents']
+        assert document['pdf'] == 'search_hash'
+        assert [table['page_number'] for table in document['tables']] == [3, 1]
+        assert document['tables'][1]['download_url'].endswith('/api/v1/pdfs/tables/{}/'.format(
+            CsvFile.objects.get(page_number=1).pk
+        ))
+
+        response = self.client.get(self.url, {'q': 'ACC-1002 closed'})
+        assert response.data['documents'] == []
+
+    def test_unchanged_result_not_reindexed(self):
+        """
+        Test that a result with the same tables as an indexed one is skipped
+        """
+        assert index_result(self.result) == 0
+        same_tables = ExtractionResult.objects.create(pdf=self.pdf, cache_key='search_key_parquet', engine='pdfplumber')
+        assert index_result(same_tables) == 0
+
+    def test_query_required(self):
+        """
+        Test that a search without terms is refused
+        """
+        response = self.client.get(self.url, {'q': ' '})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestPdfListView(MediaRootTestCase):
     def setUp(self):
         self.client = APIClient()
         self.url = reverse('pdf-list')
@@ -174,22 +824,342 @@ class TestPdfListView(APITestCase):
         # Note: No CSV for pdf2 to test scenario with missing CSV
 
         response = self.client.get(self.url)
+        data = json.loads(async_to_sync(read_stream)(response))
 
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data['pdfs']) == 2
+        assert len(data['pdfs']) == 2
+        assert data['next_cursor'] is None
 
         # Verify first PDF details
-        pdf_data = response.data['pdfs'][0]
+        pdf_data = data['pdfs'][0]
         assert pdf_data['hash'] == 'hash1'
         assert 'uploaded_at' in pdf_data
         assert 'pdf_url' in pdf_data
         assert 'csv_url' in pdf_data
 
         # Verify second PDF details
-        pdf_data = response.data['pdfs'][1]
+        pdf_data = data['pdfs'][1]
         assert pdf_data['hash'] == 'hash2'
         assert pdf_data['csv_url'] is None
 
+    def test_list_pdfs_cursor_pagination(self):
+        """
+        Test that pages follow each other through next_cursor without overlap
+        """
+        for index in range(3):
+            Pdf.objects.create(file=SimpleUploadedFile(f'sample{index}.pdf', b'content'), hash=f'hash{index}')
+
+        response = self.client.get(self.url, {'limit': 2})
+        first_page = json.loads(async_to_sync(read_stream)(response))
+        assert [pdf['hash'] for pdf in first_page['pdfs']] == ['hash0', 'hash1']
+
+        response = self.client.get(self.url, {'limit': 2, 'cursor': first_page['next_cursor']})
+        second_page = json.loads(async_to_sync(read_stream)(response))
+        assert [pdf['hash'] for pdf in second_page['pdfs']] == ['hash2']
+        assert second_page['next_cursor'] is None
+
+    def test_list_pdfs_status_filter(self):
+        """
+        Test filtering the listing by extraction status
+        """
+        Pdf.objects.create(file=SimpleUploadedFile('sample1.pdf', b'content1'), hash='hash1', status='complete')
+        Pdf.objects.create(file=SimpleUploadedFile('sample2.pdf', b'content2'), hash='hash2', status='failed')
+
+        response = self.client.get(self.url, {'status': 'failed'})
+        data = json.loads(async_to_sync(read_stream)(response))
+        assert [pdf['hash'] for pdf in data['pdfs']] == ['hash2']
+
+
+class TestAutoEngine:
+    def page(self, lines=0, chars=0, images=0):
+        return SimpleNamespace(lines=[{}] * lines, rects=[], curves=[], chars=[{}] * chars, images=[{}] * images, page_number=1)
+
+    def test_image_only_page_skipped(self):
+        """
+        Test that a page without text is not handed to any engine
+        """
+        assert AutoEngine().choose(self.page(images=1)) is None
+
+    def test_ruled_and_text_pages(self):
+        """
+        Test that ruled pages use the ruled engine and unruled ones the text strategy
+        """
+        engine = AutoEngine()
+        assert engine.choose(self.page(lines=10, chars=200)) is engine.ruled_engine
+        assert engine.choose(self.page(lines=0, chars=200)) is engine.text_engine
+
+
+class TestPagePrefilter:
+    def chars(self, rows, columns, column_gap):
+        """Fake pdfplumber chars laid out as rows of 5-character cells."""
+        return [
+            {'text': 'x', 'top': 100 + row * 12, 'x0': 72 + column * column_gap + i * 6, 'x1': 78 + column * column_gap + i * 6, 'size': 10}
+            for row in range(rows) for column in range(columns) for i in range(5)
+        ]
+
+    def test_prose_has_no_aligned_columns(self):
+        """
+        Test that words separated by normal spacing only line up at the margin
+        """
+        assert aligned_text_columns(self.chars(rows=10, columns=8, column_gap=34)) == 1
+
+    def test_table_columns_detected(self):
+        """
+        Test that widely separated cells repeated on several lines count as columns
+        """
+        assert aligned_text_columns(self.chars(rows=10, columns=3, column_gap=120)) == 3
+
+
+class TestStreamingExtraction:
+    def setup_method(self):
+        self.pages = [SimpleNamespace(page_number=number, close=Mock()) for number in (1, 2, 3)]
+        pdf = MagicMock()
+        pdf.__enter__.return_value.pages = self.pages
+        engine = SimpleNamespace(name='stub', extract_page=lambda pdf_path, page: [[['Name', 'Value'], [f'page {page.page_number}', '1']]])
+        self.patches = [patch('pdfplumber.open', return_value=pdf), patch('extract.utils.get_engine', return_value=engine)]
+        for patcher in self.patches:
+            patcher.start()
+
+    def teardown_method(self):
+        for patcher in self.patches:
+            patcher.stop()
+
+    def test_pages_released_as_tables_are_consumed(self):
+        tables = iter_tables('ledger.pdf', workers=1, prefilter=False, memory_limit=0)
+        assert next(tables).page_number == 1
+        assert not self.pages[0].close.called
+
+        assert next(tables).page_number == 2
+        assert self.pages[0].close.called
+        assert not self.pages[1].close.called
+
+    def test_progress_reported_after_every_page(self):
+        progress = []
+        tables = list(iter_tables('ledger.pdf', workers=1, prefilter=False, memory_limit=0, on_progress=lambda *args: progress.append(args)))
+        assert len(tables) == 3
+        assert progress == [(0, 3, 0), (1, 3, 1), (2, 3, 2), (3, 3, 3)]
+
+    @patch('extract.utils.current_rss', return_value=3 * 2 ** 30)
+    def test_memory_limit_stops_extraction(self, mock_current_rss):
+        tables = iter_tables('ledger.pdf', workers=1, prefilter=False, memory_limit=2 ** 30)
+        assert next(tables).page_number == 1
+        with pytest.raises(MemoryLimitExceeded, match='after page 1: 3072 MB in use exceeds the 1024 MB limit'):
+            next(tables)
+
+
+class TestPageParallelExtraction:
+    def setup_method(self):
+        self.progress = []
+
+    def extract(self, pdf_path, workers):
+        tables = iter_tables(pdf_path, workers=workers, chunk_size=2, prefilter=False, memory_limit=0,
+                             on_progress=lambda *args: self.progress.append(args))
+        return [(table.page_number, table.table_index, list(table.data.columns), table.data.values.tolist()) for table in tables]
+
+    def test_pool_matches_serial_extraction(self, tmp_path, settings):
+        """
+        Test that the process pool yields the tables of the serial path in the same page and table order
+        """
+        settings.PDF_PAGE_PARALLEL_MIN_PAGES = 2
+        pdf_path = tmp_path / 'report.pdf'
+        pdf_path.write_bytes(build_pdf(pages=6, tables_per_page=2, rows=4, columns=3))
+
+        serial = self.extract(str(pdf_path), workers=1)
+        assert [(page, index) for page, index, _, _ in serial] == [(page, index) for page in range(1, 7) for index in (0, 1)]
+        assert self.progress[-1] == (6, 6, 12)
+
+        self.progress = []
+        assert self.extract(str(pdf_path), workers=2) == serial
+        # Reported once per chunk of two pages
+        assert self.progress == [(0, 6, 0), (2, 6, 4), (4, 6, 8), (6, 6, 12)]
+
+    def test_worker_failure_raised(self, tmp_path, settings):
+        """
+        Test that an error in a pool worker stops the extraction after the tables of the chunks before it
+        """
+        settings.PDF_PAGE_PARALLEL_MIN_PAGES = 2
+        pdf_path = tmp_path / 'report.pdf'
+        pdf_path.write_bytes(build_pdf(pages=6))
+
+        def extract_page(pdf_path, page):
+            if page.page_number == 3:
+                raise ValueError('Unreadable page 3')
+            return [[['Name', 'Value'], [f'page {page.page_number}', '1']]]
+
+        # The pool workers are forked with the patch applied
+        tables = iter_tables(str(pdf_path), workers=2, chunk_size=2, prefilter=False, memory_limit=0)
+        with patch('extract.utils.get_engine', return_value=SimpleNamespace(name='stub', extract_page=extract_page)):
+            assert [table.page_number for table in islice(tables, 2)] == [1, 2]
+            with pytest.raises(ValueError, match='Unreadable page 3'):
+                next(tables)
+
+
+class TestCleanTableData:
+    def test_empty_rows_dropped_and_cells_aligned(self):
+        """
+        Test that blank rows are dropped, None cells become '' and rows are aligned with the headers,
+        keeping empty columns
+        """
+        table = [
+            [None, None, None],
+            ['  ', '\n', None],
+            [' Name ', None, ' Amount', ''],
+            ['a ', None, 1.5, ''],
+            [None, None, None, None],
+            ['b', None, 0],
+            [0, None, None, None],
+            ['c', None, '2', '', 'extra'],
+        ]
+        assert clean_table_data(table) == [
+            ['Name', 'Column_1', 'Amount', 'Column_3'],
+            ['a', '', '1.5', ''],
+            ['b', '', '0', ''],
+            ['c', '', '2', ''],
+        ]
+
+        empty = [[None, ' '], ['', None]]
+        assert clean_table_data(empty) is empty
+
+    def test_matches_original_implementation(self):
+        """
+        Test that the single pass rewrite returns what the original two pass version did
+        """
+        for seed in range(20):
+            table = synthetic_table(rows=200, columns=8, seed=seed)
+            assert clean_table_data(table) == reference_clean_table_data(table)
+
+
+class TestMetrics:
+    def test_snapshots_add_up_in_prometheus_format(self):
+        worker = metrics.MetricsRegistry()
+        worker.inc('pdf_pages_total', 3, engine='pdfplumber')
+        worker.observe('pdf_stage_seconds', 0.02, stage='page')
+        worker.observe('pdf_stage_seconds', 7, stage='page')
+
+        web = metrics.MetricsRegistry()
+        web.inc('pdf_pages_total', 2, engine='pdfplumber')
+        web.merge(worker.snapshot())
+
+        text = metrics.render(web)
+        assert 'pdf_pages_total{engine="pdfplumber"} 5' in text
+        assert 'pdf_stage_seconds_bucket{stage="page",le="0.01"} 0' in text
+        assert 'pdf_stage_seconds_bucket{stage="page",le="0.025"} 1' in text
+        assert 'pdf_stage_seconds_bucket{stage="page",le="+Inf"} 2' in text
+        assert 'pdf_stage_seconds_count{stage="page"} 2' in text
+
+    def test_flushed_snapshots_collected(self, tmp_path, settings):
+        settings.PDF_METRICS_DIR = str(tmp_path)
+        metrics.reset()
+        (tmp_path / 'worker-1.json').write_text(json.dumps({
+            'counters': [['pdf_jobs_total', {'status': 'complete'}, 4]], 'histograms': []
+        }))
+
+        assert 'pdf_jobs_total{status="complete"} 4' in metrics.render(metrics.collect())
+
+
+@pytest.mark.django_db
+class TestMetricsView(MediaRootTestCase):
+    def test_metrics_endpoint(self):
+        metrics.inc('pdf_tables_total', 2)
+        response = self.client.get(reverse('pdf-metrics'))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert '# TYPE pdf_stage_seconds histogram' in response.content.decode()
+
+
+@pytest.mark.django_db
+class TestStorage:
+    def write(self, root, relative_path, age=0):
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'content')
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+        return relative_path
+
+    def test_store_pdf_sharded_and_deduplicated(self, tmp_path, settings):
+        """
+        Test that PDFs land in shard directories of their hash and a second copy is dropped
+        """
+        settings.MEDIA_ROOT = str(tmp_path)
+        file_hash = 'abcdef' + '0' * 58
+        for created in (True, False):
+            spool = self.write(tmp_path, 'tmp/upload.part')
+            assert store_pdf(str(tmp_path / spool), file_hash) == (f'pdfs/ab/cd/{file_hash}.pdf', created)
+            assert not (tmp_path / spool).exists()
+
+    def test_garbage_collected(self, tmp_path, settings):
+        """
+        Test that old orphaned files are deleted while referenced and recent ones are kept
+        """
+        settings.MEDIA_ROOT = str(tmp_path)
+        day = 86400
+        pdf = Pdf.objects.create(file=pdf_path('kept_hash'), hash='kept_hash')
+        kept_table = self.write(tmp_path, f'{tables_dir("kept_hash", "key")}/page-1-table-0.csv', age=2 * day)
+        CsvFile.objects.create(pdf=pdf, file=kept_table)
+        kept = [
+            self.write(tmp_path, pdf_path('kept_hash'), age=2 * day),
+            self.write(tmp_path, f'{tables_dir("kept_hash", "key")}/page-1-table-0.csv.gz', age=2 * day),
+            self.write(tmp_path, 'tmp/in-progress.tmp'),
+            self.write(tmp_path, pdf_path('new_hash')),
+            self.write(tmp_path, 'errors/or/ph/orphan_hash/error-1.txt', age=2 * day),
+        ]
+        orphaned = [
+            self.write(tmp_path, 'tmp/abandoned.tmp', age=2 * day),
+            self.write(tmp_path, 'temp/sample.pdf', age=2 * day),
+            self.write(tmp_path, 'csv/gone_hash.csv', age=2 * day),
+            self.write(tmp_path, pdf_path('gone_hash'), age=2 * day),
+            self.write(tmp_path, f'{tables_dir("gone_hash", "key")}/page-1-table-0.csv', age=2 * day),
+            self.write(tmp_path, 'tables/gone_hash/page-1-table-0.csv', age=2 * day),
+            self.write(tmp_path, 'errors/or/ph/orphan_hash/error-2.txt', age=8 * day),
+            self.write(tmp_path, 'uploads/6f1c3c0e-5e0b-4a47-9a43-3f0c1a8e5b6d.part', age=2 * day),
+        ]
+
+        reclaimed = collect_garbage(grace=day, error_ttl=7 * day, batch_size=2)
+        assert {kind: files for kind, (files, _) in reclaimed.items()} == {
+            'temp': 2, 'pdfs': 1, 'tables': 3, 'errors': 1, 'uploads': 1
+        }
+        assert all((tmp_path / path).exists() for path in kept)
+        assert not any((tmp_path / path).exists() for path in orphaned)
+        assert not (tmp_path / 'tables/gone_hash').exists()
+
+
+class TestAdmission:
+    def test_count_pages(self, tmp_path):
+        """
+        Test that pages are counted from the page objects, /Pages nodes excluded
+        """
+        path = tmp_path / 'pages.pdf'
+        path.write_bytes(b'%PDF-1.4\n1 0 obj << /Type /Pages /Count 3 >>\n' + b'<< /Type/Page /Parent 1 0 R >>\n' * 3)
+        assert count_pages(path) == 3
+        assert estimate_cost(path)['estimated_pages'] == 3
+
+
+class TestWarmUp:
+    def test_warm_up_leaves_database_alone(self):
+        """
+        Test that the pre-fork warm-up imports the stack without opening a database connection
+        """
+        with patch.object(BaseDatabaseWrapper, 'ensure_connection') as ensure_connection:
+            engines = warm_up()
+
+        assert 'pdfplumber' in engines
+        ensure_connection.assert_not_called()
+
+
+class TestLazyImports:
+    def test_extraction_stack_not_imported_at_startup(self):
+        """
+        Test that loading the URLconf and the job queue leaves pandas and pdfplumber for the first extraction
+        """
+        statement = (
+            'import sys, django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns; '
+            'import extract.jobs; print(sorted({"pandas", "pdfplumber"} & set(sys.modules)))'
+        )
+        completed = subprocess.run([sys.executable, '-c', statement], capture_output=True, text=True, env=dict(os.environ))
+        assert completed.stdout.strip() == '[]', completed.stderr
+
 
 def create_test_database():
     """
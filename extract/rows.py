@@ -0,0 +1,124 @@
+"""
+Row-level storage of extracted tables.
+
+With PDF_INGEST_TABLE_ROWS on, workers load the rows of every new
+extraction result into TableRow, together with the page and table they
+came from. A lookup such as one account number across thousands of
+statements is then a single query instead of fetching and parsing every
+table. On Postgres the rows are streamed in with COPY and the GIN index on
+data (migration 0013) serves the column/value filter. Other databases get
+batched INSERTs and scan the rows a lookup is narrowed down to.
+"""
+import json
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.lookups import Exact
+
+from . import metrics
+from .downloads import read_batches
+from .models import ExtractionResult, TableRow
+
+COPY_COLUMNS = ['pdf_id', 'result_id', 'table_id', 'page_number', 'table_index', 'row_number', 'data']
+INSERT_BATCH_SIZE = 1000
+
+
+def ingest_enabled():
+    return getattr(settings, 'PDF_INGEST_TABLE_ROWS', False)
+
+
+def _can_copy():
+    """COPY ... FROM STDIN goes through the copy() API of psycopg 3."""
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    return is_psycopg3
+
+
+def _iter_rows(result, tables):
+    """Yields the rows of the tables of a result as COPY_COLUMNS tuples, read back from the stored files."""
+    for table in tables:
+        row_number = 0
+        for batch in read_batches(table.file.name, table.member, table.format):
+            for record in batch.to_dict('records'):
+                yield result.pdf_id, result.pk, table.pk, table.page_number, table.table_index, row_number, record
+                row_number += 1
+
+
+def ingest_rows(result):
+    """
+    Loads the rows of every table of a result into TableRow.
+
+    Returns:
+    - Number of rows loaded
+    """
+    # Listed up front, the connection cannot run other queries during a COPY
+    tables = list(result.tables.order_by('page_number', 'table_index', 'id'))
+    rows = _iter_rows(result, tables)
+    loaded = 0
+    with metrics.timer('ingest'):
+        if _can_copy():
+            quote = connection.ops.quote_name
+            statement = f'COPY {quote(TableRow._meta.db_table)} ({", ".join(map(quote, COPY_COLUMNS))}) FROM STDIN'
+            with connection.cursor() as cursor, cursor.cursor.copy(statement) as copy:
+                for *position, data in rows:
+                    copy.write_row((*position, json.dumps(data, default=str)))
+                    loaded += 1
+        else:
+            batch = []
+            for pdf_id, result_id, table_id, page_number, table_index, row_number, data in rows:
+                batch.append(TableRow(
+                    pdf_id=pdf_id, result_id=result_id, table_id=table_id, page_number=page_number,
+                    table_index=table_index, row_number=row_number, data=data
+                ))
+                if len(batch) == INSERT_BATCH_SIZE:
+                    TableRow.objects.bulk_create(batch)
+                    loaded += len(batch)
+                    batch = []
+            TableRow.objects.bulk_create(batch)
+            loaded += len(batch)
+    metrics.inc('pdf_table_rows_total', loaded)
+    return loaded
+
+
+def ingest_missing_rows():
+    """
+    Loads the rows of the results stored before ingestion was turned on.
+
+    Returns:
+    - Number of results and of rows loaded
+    """
+    missing = ExtractionResult.objects.filter(~Exists(TableRow.objects.filter(result=OuterRef('pk'))))
+    results = rows = 0
+    for pk in list(missing.values_list('pk', flat=True)):
+        with transaction.atomic():
+            result = ExtractionResult.objects.filter(pk=pk).first()
+            if result is not None:
+                rows += ingest_rows(result)
+                results += 1
+    return results, rows
+
+
+def find_rows(column=None, value=None, pdf_hash=None, page_number=None):
+    """
+    TableRows whose column holds exactly value, of one document and page when given.
+
+    Where JSON containment is supported (Postgres) the column filter is
+    data @> {column: value}, which the GIN index serves. Cells are stored as
+    text, so value is compared as a string.
+    """
+    rows = TableRow.objects.all()
+    if pdf_hash:
+        rows = rows.filter(pdf__hash=pdf_hash)
+    if page_number is not None:
+        rows = rows.filter(page_number=page_number)
+    if column is not None:
+        if connection.features.supports_json_field_contains:
+            rows = rows.filter(data__contains={column: value})
+        else:
+            # An expression, a column named like a lookup or containing __ could not be a keyword argument
+            rows = rows.filter(Exact(KeyTextTransform(column, 'data'), value))
+    return rows
@@ -0,0 +1,172 @@
+"""
+Full-text search over the cells of extracted tables.
+
+Tables are indexed as their extraction completes, in segments of
+SEGMENT_ROWS rows so that no index entry outgrows what a tsvector can hold
+however long the table. On Postgres a segment is a tsvector with a GIN
+index (migration 0014), matched with websearch_to_tsquery and ranked with
+ts_rank. Elsewhere a segment is a set of SearchPosting rows, a local
+inverted index on (term, segment), ranked by tf-idf. Either way every term
+of a query has to occur in the same segment, and the scores of the
+segments of a table add up.
+
+Results never change once stored, so each is indexed once. A result that
+only differs from an indexed one of the same PDF by its output format
+holds the same cells and is skipped.
+"""
+import math
+import re
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Case, Count, Exists, F, FloatField, OuterRef, Sum, Value, When
+from django.db.models.expressions import RawSQL
+
+from . import metrics
+from .downloads import read_batches
+from .models import ExtractionResult, SearchPosting, SearchSegment
+
+SEGMENT_ROWS = 500
+MAX_TERM_LENGTH = 100
+# Words, numbers and codes such as 1,234.50, 2024-01-31 or ACC-1002 stay one term
+TERM = re.compile(r'\w+(?:[.,\-/]\w+)*')
+# No stemming or stop words, cells are names, numbers and codes more than prose
+TEXT_SEARCH_CONFIG = 'simple'
+INSERT_BATCH_SIZE = 100
+
+
+def search_enabled():
+    return getattr(settings, 'PDF_SEARCH_INDEX', True)
+
+
+def tokenize(text):
+    """Lower-cased search terms of a text, queries and cells alike."""
+    return [term[:MAX_TERM_LENGTH] for term in TERM.findall(text.lower())]
+
+
+def _segments(tables):
+    """Yields (table, segment number, text) for every SEGMENT_ROWS rows of the tables, the header opens the first segment."""
+    for table in tables:
+        number, lines = 0, None
+        for batch in read_batches(table.file.name, table.member, table.format):
+            if lines is None:
+                lines = [' '.join(map(str, batch.columns))]
+            for row in batch.itertuples(index=False, name=None):
+                lines.append(' '.join(str(value) for value in row if value is not None))
+                if len(lines) >= SEGMENT_ROWS:
+                    yield table, number, '\n'.join(lines)
+                    number, lines = number + 1, []
+        if lines:
+            yield table, number, '\n'.join(lines)
+
+
+def index_result(result):
+    """
+    Adds the tables of an extraction result to the search index.
+
+    Returns:
+    - Number of segments indexed, 0 when the result or one with the same cells is indexed already
+    """
+    equivalent = SearchSegment.objects.filter(
+        pdf_id=result.pdf_id, result__engine=result.engine, result__engine_version=result.engine_version
+    )
+    if equivalent.exists():
+        return 0
+
+    tables = list(result.tables.order_by('page_number', 'table_index', 'id'))
+    segments = _segments(tables)
+    indexed = 0
+    with metrics.timer('index'):
+        if connection.vendor == 'postgresql':
+            quote = connection.ops.quote_name
+            statement = (
+                f'INSERT INTO {quote(SearchSegment._meta.db_table)} '
+                '(pdf_id, result_id, table_id, segment, page_number, table_index, search_vector) '
+                'VALUES (%s, %s, %s, %s, %s, %s, to_tsvector(%s, %s))'
+            )
+            params = (
+                (result.pdf_id, result.pk, table.pk, number, table.page_number, table.table_index, TEXT_SEARCH_CONFIG, text)
+                for table, number, text in segments
+            )
+            with connection.cursor() as cursor:
+                while batch := list(islice(params, INSERT_BATCH_SIZE)):
+                    cursor.executemany(statement, batch)
+                    indexed += len(batch)
+        else:
+            for table, number, text in segments:
+                segment = SearchSegment.objects.create(
+                    pdf_id=result.pdf_id, result=result, table=table, segment=number,
+                    page_number=table.page_number, table_index=table.table_index
+                )
+                SearchPosting.objects.bulk_create(
+                    (SearchPosting(term=term, segment=segment, count=count) for term, count in Counter(tokenize(text)).items()),
+                    batch_size=1000
+                )
+                indexed += 1
+    metrics.inc('pdf_search_segments_total', indexed)
+    return indexed
+
+
+def index_missing_results():
+    """
+    Indexes the results stored before the search index was turned on.
+
+    Returns:
+    - Number of segments indexed
+    """
+    missing = ExtractionResult.objects.filter(~Exists(SearchSegment.objects.filter(result=OuterRef('pk'))))
+    indexed = 0
+    for pk in list(missing.values_list('pk', flat=True)):
+        with transaction.atomic():
+            result = ExtractionResult.objects.filter(pk=pk).first()
+            if result is not None:
+                indexed += index_result(result)
+    return indexed
+
+
+def search_tables(query, pdf_hash=None, limit=50):
+    """
+    Tables whose cells contain every term of query, best match first.
+
+    Args:
+    - query: Search terms, on Postgres in websearch_to_tsquery syntax ("quoted phrases", or, -excluded)
+    - pdf_hash: Only search the tables of this PDF
+    - limit: Number of tables returned
+
+    Returns:
+    - Dicts of table_id, pdf_hash, page_number, table_index and score
+    """
+    if connection.vendor == 'postgresql':
+        tsquery = 'websearch_to_tsquery(%s, %s)'
+        matches = SearchSegment.objects.filter(
+            RawSQL(f'search_vector @@ {tsquery}', [TEXT_SEARCH_CONFIG, query], output_field=BooleanField())
+        )
+        score = Sum(RawSQL(f'ts_rank(search_vector, {tsquery})', [TEXT_SEARCH_CONFIG, query], output_field=FloatField()))
+        prefix = ''
+    else:
+        terms = sorted(set(tokenize(query)))
+        postings = SearchPosting.objects.filter(term__in=terms)
+        # Segments per term, for the inverse document frequency
+        frequencies = dict(postings.order_by().values_list('term').annotate(Count('id')))
+        if not terms or len(frequencies) < len(terms):
+            return []
+        total = SearchSegment.objects.count()
+        score = Sum(Case(
+            *[When(term=term, then=F('count') * Value(math.log(1 + total / frequency))) for term, frequency in frequencies.items()],
+            output_field=FloatField()
+        ))
+        complete = postings.order_by().values('segment').annotate(matched=Count('id')).filter(matched=len(terms)).values('segment')
+        matches = postings.filter(segment__in=complete)
+        prefix = 'segment__'
+
+    if pdf_hash:
+        matches = matches.filter(**{f'{prefix}pdf__hash': pdf_hash})
+    positions = ['table_id', 'page_number', 'table_index']
+    if prefix:
+        tables = matches.order_by().values(pdf_hash=F(f'{prefix}pdf__hash'), **{name: F(prefix + name) for name in positions})
+    else:
+        # Model fields cannot be renamed to themselves
+        tables = matches.order_by().values(*positions, pdf_hash=F('pdf__hash'))
+    return list(tables.annotate(score=score).order_by('-score', 'table_id')[:limit])
@@ -0,0 +1,252 @@
+"""
+Layout of the files stored under MEDIA_ROOT.
+
+Everything belonging to a PDF is keyed by its SHA-256 and sharded on the
+first two pairs of hex digits, so no directory holds more than 256 shards
+or the files of more PDFs than happen to share a shard:
+
+- pdfs/ab/cd/<hash>.pdf: The uploaded PDF
+- tables/ab/cd/<hash>/<variant>/: The tables of one extraction result and their download renditions
+- errors/ab/cd/<hash>/: Error details and cProfile reports
+- uploads/<session>.part: Resumable uploads being received
+- tmp/: Files being written
+
+Files are written to tmp/ and renamed into place once complete
+(write_atomically, store_file), a reader never sees half a file under its
+final name and a crash leaves nothing but a temporary file behind.
+collect_garbage reclaims those, as well as PDFs, tables and error reports
+nothing refers to any more, walking the tree one directory at a time and
+checking the database in batches. Rows from before this layout keep their
+paths and are read and collected like the others, as are the temp/ and csv/
+directories of older versions.
+"""
+import os
+import time
+import uuid
+
+from django.conf import settings
+
+ROOTS = ['tmp', 'pdfs', 'tables', 'errors', 'uploads']
+# Written by versions before this layout: temporary uploads and one CSV per PDF
+LEGACY_ROOTS = {'temp': 'temp', 'csv': 'tables'}
+TEMP_SUFFIXES = ('.tmp', '.part')
+GC_BATCH_SIZE = 1000
+
+
+def shard(key):
+    """Shard directories of a key, e.g. ab/cd for abcdef..."""
+    return os.path.join(key[:2], key[2:4])
+
+
+def full_path(relative_path):
+    return os.path.join(settings.MEDIA_ROOT, relative_path)
+
+
+def pdf_path(file_hash):
+    """Content-addressed location of a PDF, relative to MEDIA_ROOT."""
+    return os.path.join('pdfs', shard(file_hash), f'{file_hash}.pdf')
+
+
+def tables_dir(file_hash, variant=None):
+    """Directory of the tables of a PDF, of one extraction result (variant) when given, relative to MEDIA_ROOT."""
+    directory = os.path.join('tables', shard(file_hash), file_hash)
+    return os.path.join(directory, variant) if variant else directory
+
+
+def error_path(file_hash, name):
+    """Location of an error or profile report of a PDF, relative to MEDIA_ROOT."""
+    return os.path.join('errors', shard(file_hash), file_hash, name)
+
+
+def temp_path(suffix='.tmp'):
+    """Absolute path of a new temporary file on the same file system as the stored files."""
+    directory = full_path('tmp')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex + suffix)
+
+
+def _move(temporary, path):
+    """Renames a temporary file to the absolute path, creating its directory."""
+    for attempt in range(3):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(temporary, path)
+            return
+        except FileNotFoundError:
+            # collect_garbage removed the empty directory in between
+            if attempt == 2 or not os.path.exists(temporary):
+                raise
+
+
+def write_atomically(path, write):
+    """Calls write(file) on a temporary file that replaces the absolute path once complete."""
+    temporary = temp_path()
+    try:
+        with open(temporary, 'wb') as output:
+            write(output)
+        _move(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def store_file(temporary, relative_path):
+    """
+    Moves a complete temporary file to a content-addressed path. The bytes at
+    that path are the same whoever stored them, so a file already there is
+    kept and the temporary file removed. Its modification time is refreshed,
+    collect_garbage leaves recently stored files alone.
+
+    Returns:
+    - Whether the file was newly stored
+    """
+    path = full_path(relative_path)
+    if os.path.exists(path):
+        os.utime(path)
+        os.remove(temporary)
+        return False
+    _move(temporary, path)
+    return True
+
+
+def store_pdf(temporary, file_hash):
+    """
+    Stores a spooled PDF under pdf_path(file_hash).
+
+    Returns:
+    - The path relative to MEDIA_ROOT and whether the file was newly stored
+    """
+    relative_path = pdf_path(file_hash)
+    return relative_path, store_file(temporary, relative_path)
+
+
+def _walk(root):
+    """Yields the path relative to MEDIA_ROOT and the os.stat_result of every file under root."""
+    for directory, _, names in os.walk(full_path(root)):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield os.path.relpath(path, settings.MEDIA_ROOT), stat
+
+
+def _kind(path):
+    """What a stored file is for collect_garbage: temp, pdfs, tables, errors, uploads or None to leave it alone."""
+    root = path.split(os.sep, 1)[0]
+    if root == 'tmp' or (root != 'uploads' and path.endswith(TEMP_SUFFIXES)):
+        return 'temp'
+    return root if root in ROOTS else LEGACY_ROOTS.get(root)
+
+
+def _table_owner(path):
+    """Hash of the PDF a table file belongs to, in the sharded layout or the tables/<hash>/ and csv/<hash>.csv ones before it."""
+    parts = path.split(os.sep)
+    if parts[0] == 'csv':
+        return os.path.splitext(parts[-1])[0]
+    if len(parts) > 4 and len(parts[1]) == len(parts[2]) == 2 and parts[3].startswith(parts[1] + parts[2]):
+        return parts[3]
+    return parts[1] if len(parts) > 2 else None
+
+
+def _live_paths(kind, paths):
+    """The paths among a batch of one kind that the database still refers to."""
+    from .models import CsvFile, ExtractionJob, Pdf, UploadSession
+
+    if kind == 'pdfs':
+        return set(Pdf.objects.filter(file__in=paths).values_list('file', flat=True))
+    if kind == 'tables':
+        # Download renditions are not in the database, a file is in use when
+        # a table of its directory is. csv/ is shared by every PDF.
+        stored = set(CsvFile.objects.filter(pdf__hash__in={_table_owner(path) for path in paths}).values_list('file', flat=True))
+        directories = {os.path.dirname(path) for path in stored} - {'csv'}
+        return {path for path in paths if path in stored or os.path.dirname(path) in directories}
+    if kind == 'errors':
+        jobs = ExtractionJob.objects.filter(error_file__in=paths) | ExtractionJob.objects.filter(profile_file__in=paths)
+        return {path for pair in jobs.values_list('error_file', 'profile_file') for path in pair}
+    sessions = {}
+    for path in paths:
+        try:
+            sessions[uuid.UUID(os.path.splitext(os.path.basename(path))[0])] = path
+        except ValueError:
+            continue
+    return {sessions[pk] for pk in UploadSession.objects.filter(pk__in=sessions).values_list('pk', flat=True)}
+
+
+def _remove_empty_directories(root):
+    """Removes the empty directories under root, writers recreate theirs (see _move)."""
+    top = full_path(root)
+    for directory, _, names in os.walk(top, topdown=False):
+        if directory == top or names:
+            continue
+        try:
+            os.rmdir(directory)
+        except OSError:
+            # Not empty, e.g. its subdirectories are kept or it was written to concurrently
+            continue
+
+
+def collect_garbage(grace=None, error_ttl=None, dry_run=False, batch_size=GC_BATCH_SIZE):
+    """
+    Deletes the stored files nothing refers to any more.
+
+    Only files older than grace are considered: tables are written before the
+    rows of their result and a PDF before its Pdf row, a newer file may be in
+    the middle of that. Error and profile reports referred to by a job are
+    kept, other reports (e.g. of a failed upload) after error_ttl.
+
+    Args:
+    - grace: Minimum age in seconds (default: PDF_STORAGE_GC_GRACE)
+    - error_ttl: Age in seconds of unreferenced reports (default: PDF_ERROR_REPORT_TTL)
+    - dry_run: Only count what would be deleted
+    - batch_size: Paths checked against the database per query
+
+    Returns:
+    - Dict of kind (temp, pdfs, tables, errors, uploads) -> [files, bytes] deleted
+    """
+    grace = grace if grace is not None else getattr(settings, 'PDF_STORAGE_GC_GRACE', 86400)
+    error_ttl = error_ttl if error_ttl is not None else getattr(settings, 'PDF_ERROR_REPORT_TTL', 7 * 86400)
+    started = time.time()
+    reclaimed = {kind: [0, 0] for kind in ['temp', 'pdfs', 'tables', 'errors', 'uploads']}
+    pending = {kind: [] for kind in reclaimed if kind != 'temp'}
+
+    def delete(kind, path, size):
+        if not dry_run:
+            try:
+                # Stored again since it was listed, see store_file
+                if os.stat(full_path(path)).st_mtime >= started - grace:
+                    return
+                os.remove(full_path(path))
+            except FileNotFoundError:
+                return
+        reclaimed[kind][0] += 1
+        reclaimed[kind][1] += size
+
+    def resolve(kind):
+        live = _live_paths(kind, [path for path, _ in pending[kind]])
+        for path, size in pending[kind]:
+            if path not in live:
+                delete(kind, path, size)
+        pending[kind].clear()
+
+    for root in [*ROOTS, *LEGACY_ROOTS]:
+        for path, stat in _walk(root):
+            kind = _kind(path)
+            min_age = max(grace, error_ttl) if kind == 'errors' else grace
+            if kind is None or stat.st_mtime >= started - min_age:
+                continue
+            if kind == 'temp':
+                delete(kind, path, stat.st_size)
+                continue
+            pending[kind].append((path, stat.st_size))
+            if len(pending[kind]) >= batch_size:
+                resolve(kind)
+    for kind in pending:
+        resolve(kind)
+
+    if not dry_run:
+        for root in [*ROOTS, *LEGACY_ROOTS]:
+            _remove_empty_directories(root)
+    return reclaimed
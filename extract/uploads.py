@@ -0,0 +1,226 @@
+"""
+Resumable uploads.
+
+A client creates an UploadSession with the total size, PUTs the bytes in
+order with Content-Range headers and finalizes the session, which stores
+the PDF like a regular upload. A failed chunk is retried from the offset the
+session reports, the bytes before it are kept.
+
+The SHA-256 is computed while the chunks arrive. hashlib objects cannot be
+stored in the database though, so the hash state lives in the process that
+received the latest chunk. When the next chunk lands in another process,
+the hash is computed from the spool file once the upload is finalized.
+"""
+import hashlib
+import os
+import re
+import shutil
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import UploadSession
+from .storage import store_pdf, temp_path
+from .utils import PDF_MAGIC, InvalidUpload
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_SIZE = 64 * 1024
+MAX_CACHED_HASHERS = 128
+
+# Session id -> (offset hashed up to, hashlib object), least recently used first
+_hashers = OrderedDict()
+
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk does not start where the session left off."""
+
+    def __init__(self, received):
+        super().__init__(f'Expected a chunk starting at byte {received}')
+        self.received = received
+
+
+def max_upload_size():
+    return getattr(settings, 'PDF_MAX_RESUMABLE_UPLOAD_SIZE', 500 * 1024 * 1024)
+
+
+def spool_path(session):
+    """Absolute path of the file the chunks of a session are written to."""
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{session.pk}.part')
+
+
+def parse_content_range(header, size):
+    """
+    Parses a "bytes <first>-<last>/<total>" Content-Range header.
+
+    Returns:
+    - Offset and length of the chunk
+
+    Raises:
+    - InvalidUpload: The header is missing, malformed or does not match the session size
+    """
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        raise InvalidUpload('Content-Range must be "bytes <first>-<last>/<total>"')
+    first, last, total = map(int, match.groups())
+    if total != size:
+        raise InvalidUpload(f'Content-Range total {total} does not match the upload size {size}')
+    if last < first or last >= size:
+        raise InvalidUpload('Content-Range is outside of the upload')
+    return first, last - first + 1
+
+
+def _remember_hasher(session_id, offset, hasher):
+    _hashers[session_id] = (offset, hasher)
+    _hashers.move_to_end(session_id)
+    while len(_hashers) > MAX_CACHED_HASHERS:
+        _hashers.popitem(last=False)
+
+
+def write_chunk(session, offset, length, stream):
+    """
+    Writes length bytes read from stream at offset into the spool file.
+
+    The body is received into a temporary file first. Only the request that
+    advances the session from offset copies it into the spool, in the same
+    transaction, so a concurrent request for the same range never writes
+    there and the kept hash state always matches the spooled bytes.
+
+    Returns:
+    - The number of bytes the session has received
+
+    Raises:
+    - UploadOffsetMismatch: offset is not where the session left off, e.g. a retried or concurrent chunk
+    - InvalidUpload: The body is shorter than announced or the upload is not a PDF
+    """
+    if offset != session.received:
+        raise UploadOffsetMismatch(session.received)
+
+    # Copied, so a chunk that loses a race does not advance the kept state
+    cached = _hashers.get(session.pk)
+    hasher = cached[1].copy() if cached and cached[0] == offset else None
+    if offset == 0:
+        hasher = hashlib.sha256()
+
+    chunk_path = temp_path('.part')
+    try:
+        written = 0
+        with metrics.timer('upload_chunk'), open(chunk_path, 'wb') as chunk:
+            while written < length:
+                piece = stream.read(min(READ_SIZE, length - written))
+                if not piece:
+                    break
+                chunk.write(piece)
+                if hasher is not None:
+                    hasher.update(piece)
+                written += len(piece)
+        if written != length:
+            raise InvalidUpload(f'Chunk ended after {written} of {length} bytes')
+
+        received = offset + length
+        try:
+            with transaction.atomic():
+                # Holds the session row until the chunk is in the spool
+                updated = UploadSession.objects.filter(pk=session.pk, received=offset).update(
+                    received=received, updated_at=timezone.now()
+                )
+                if not updated:
+                    # Another request for the same range got there first
+                    raise UploadOffsetMismatch(
+                        UploadSession.objects.filter(pk=session.pk).values_list('received', flat=True).first() or 0
+                    )
+                _append_chunk(chunk_path, spool_path(session), offset)
+                if offset < len(PDF_MAGIC) <= received and _read_head(spool_path(session)) != PDF_MAGIC:
+                    raise InvalidUpload('File is not a PDF')
+        except InvalidUpload:
+            delete_upload(session)
+            raise
+    finally:
+        os.remove(chunk_path)
+
+    session.received = received
+    metrics.inc('pdf_ingested_bytes_total', length)
+    if hasher is not None:
+        _remember_hasher(session.pk, received, hasher)
+    else:
+        _hashers.pop(session.pk, None)
+    return received
+
+
+def _append_chunk(chunk_path, path, offset):
+    """Copies a received chunk into the spool file at offset."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(chunk_path, 'rb') as chunk, os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT, 0o644), 'wb') as spool:
+        spool.seek(offset)
+        shutil.copyfileobj(chunk, spool, READ_SIZE)
+
+
+def _read_head(path):
+    with open(path, 'rb') as spool:
+        return spool.read(len(PDF_MAGIC))
+
+
+def file_digest(path):
+    """SHA-256 of a file on disk."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as spooled:
+        for piece in iter(lambda: spooled.read(1024 * 1024), b''):
+            digest.update(piece)
+    return digest.hexdigest()
+
+
+def finalize_upload(session):
+    """
+    Stores a fully received upload under its content hash and deletes the session.
+
+    Returns:
+    - The hex SHA-256, the path relative to MEDIA_ROOT and whether the file was newly stored
+
+    Raises:
+    - InvalidUpload: Not all bytes were received yet
+    - UploadSession.DoesNotExist: The session was finalized or deleted concurrently
+    """
+    if session.received != session.size:
+        raise InvalidUpload(f'Upload incomplete, {session.received} of {session.size} bytes received')
+
+    cached = _hashers.pop(session.pk, None)
+    path = spool_path(session)
+    digest = cached[1].hexdigest() if cached and cached[0] == session.size else file_digest(path)
+
+    # Deleting the row claims the spool file, a concurrent finalize gets nothing to delete
+    deleted, _ = UploadSession.objects.filter(pk=session.pk).delete()
+    if not deleted:
+        raise UploadSession.DoesNotExist()
+
+    relative_path, created = store_pdf(path, digest)
+    return digest, relative_path, created
+
+
+def delete_upload(session):
+    """Aborts an upload and removes what was received."""
+    _hashers.pop(session.pk, None)
+    session.delete()
+    if os.path.exists(spool_path(session)):
+        os.remove(spool_path(session))
+
+
+def expire_upload_sessions(max_age=None):
+    """
+    Deletes upload sessions that received nothing for max_age seconds.
+
+    Args:
+    - max_age: Idle time in seconds (default: PDF_UPLOAD_SESSION_TTL)
+
+    Returns:
+    - Number of sessions deleted
+    """
+    max_age = max_age if max_age is not None else getattr(settings, 'PDF_UPLOAD_SESSION_TTL', 86400)
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=max_age))
+    expired = 0
+    for session in stale.iterator():
+        delete_upload(session)
+        expired += 1
+    return expired
@@ -1,9 +1,19 @@
 from django.urls import path
 
-from extract.views import PdfListView, PdfProcessingStatusView, PdfTableExtractorView
+from extract.views import (BatchExtractView, MetricsView, PdfListView, PdfProcessingStatusView, PdfStatusEventsView, PdfTableExtractorView, TableDownloadView, TableRowQueryView, TableSearchView,
+                           UploadFinalizeView, UploadSessionCreateView, UploadSessionView)
 
 urlpatterns = [
     path('extract-table/', PdfTableExtractorView.as_view(), name='extract-table'),
+    path('extract-batch/', BatchExtractView.as_view(), name='extract-batch'),
     path('status/<str:hash>/', PdfProcessingStatusView.as_view(), name='pdf-status'),
+    path('status/<str:hash>/events/', PdfStatusEventsView.as_view(), name='pdf-status-events'),
     path('list/', PdfListView.as_view(), name='pdf-list'),
+    path('tables/<int:pk>/', TableDownloadView.as_view(), name='table-download'),
+    path('rows/', TableRowQueryView.as_view(), name='table-rows'),
+    path('search/', TableSearchView.as_view(), name='table-search'),
+    path('uploads/', UploadSessionCreateView.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<uuid:pk>/finalize/', UploadFinalizeView.as_view(), name='upload-finalize'),
+    path('metrics/', MetricsView.as_view(), name='pdf-metrics'),
 ]
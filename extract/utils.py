@@ -1,18 +1,34 @@
 import hashlib
+import importlib.util
+import io
 import os
+import pstats
+import time
 import traceback
+import uuid
+import zipfile
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import TextIOWrapper
+from itertools import chain, islice
 
-import pandas as pd
-import pdfplumber
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+
+from . import metrics
+from .engines import get_engine, is_table_candidate
+from .storage import error_path, full_path, store_pdf, tables_dir, temp_path, write_atomically
+
+PDF_MAGIC = b'%PDF-'
+
+
+class InvalidUpload(ValueError):
+    """Raised when an upload is rejected while it is being ingested."""
 
 
 def validate_file(file):
     """Additional file validation"""
     # Check file size (e.g., max 10MB)
-    if file.size > 10 * 1024 * 1024:
+    if file.size > getattr(settings, 'PDF_MAX_UPLOAD_SIZE', 10 * 1024 * 1024):
         return False
 
     # Check file extension
@@ -21,38 +37,254 @@ def validate_file(file):
     return file_extension in allowed_extensions
 
 
-def generate_file_hash(file):
-    """Generates a hash for the PDF file."""
-    file.seek(0)  # Make sure the file pointer is at the start
+@metrics.timer('ingest')
+def ingest_upload(file, max_size=None):
+    """
+    Hashes, validates and stores an uploaded PDF in a single streaming read.
+
+    The bytes are spooled to a temporary file while the SHA-256 is computed,
+    then renamed to storage.pdf_path(hash). A file that is already stored
+    under that hash is left untouched. Besides the whole call (ingest) the
+    time spent hashing (hash) and spooling and storing the file (spool) is
+    observed in pdf_stage_seconds, once per file.
+
+    Args:
+    - file: Django UploadedFile (or any File) to ingest
+    - max_size: Size limit in bytes (default: PDF_MAX_UPLOAD_SIZE)
+
+    Returns:
+    - The hex SHA-256, the path relative to MEDIA_ROOT and whether the file was newly stored
+
+    Raises:
+    - InvalidUpload: The content is not a PDF or exceeds the size limit
+    """
+    max_size = max_size or getattr(settings, 'PDF_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+
     file_hash = hashlib.sha256()
-    for chunk in file.chunks():
-        file_hash.update(chunk)
-    return file_hash.hexdigest()
+    size = 0
+    head = b''
+    hash_seconds = spool_seconds = 0.0
+    spool_path = temp_path('.part')
+    try:
+        with open(spool_path, 'wb') as spool:
+            file.seek(0)  # Make sure the file pointer is at the start
+            for chunk in file.chunks():
+                if len(head) < len(PDF_MAGIC):
+                    head += chunk[:len(PDF_MAGIC) - len(head)]
+                    if len(head) == len(PDF_MAGIC) and head != PDF_MAGIC:
+                        raise InvalidUpload('File is not a PDF')
+
+                size += len(chunk)
+                if size > max_size:
+                    raise InvalidUpload('File too large')
+
+                started = time.perf_counter()
+                file_hash.update(chunk)
+                hashed = time.perf_counter()
+                spool.write(chunk)
+                hash_seconds += hashed - started
+                spool_seconds += time.perf_counter() - hashed
+
+        if head != PDF_MAGIC:
+            raise InvalidUpload('File is not a PDF')
+
+        digest = file_hash.hexdigest()
+        started = time.perf_counter()
+        relative_path, created = store_pdf(spool_path, digest)
+        spool_seconds += time.perf_counter() - started
+        metrics.observe('pdf_stage_seconds', hash_seconds, stage='hash')
+        metrics.observe('pdf_stage_seconds', spool_seconds, stage='spool')
+        metrics.inc('pdf_ingested_bytes_total', size)
+        return digest, relative_path, created
 
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
 
-def save_temp_pdf(file):
-    """Saves the PDF file temporarily."""
-    temp_path = os.path.join(settings.MEDIA_ROOT, 'temp', file.name)
-    os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-    with open(temp_path, 'wb') as temp_file:
-        for chunk in file.chunks():
-            temp_file.write(chunk)
-    return temp_path
+
+ExtractedTable = namedtuple('ExtractedTable', ['page_number', 'table_index', 'data'])
+
+
+class MemoryLimitExceeded(Exception):
+    """Raised when an extraction grows past its memory ceiling."""
+
+
+def current_rss():
+    """Resident set size of this process in bytes, 0 where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
 
 
-def extract_tables(pdf_path):
-    """Extracts tables from the PDF using pdfplumber."""
+def check_memory(limit, page_number):
+    """Raises MemoryLimitExceeded once the process uses more than limit bytes, 0 disables the check."""
+    if not limit:
+        return
+    rss = current_rss()
+    if rss > limit:
+        raise MemoryLimitExceeded(
+            f'Extraction stopped after page {page_number}: '
+            f'{rss // 2 ** 20} MB in use exceeds the {limit // 2 ** 20} MB limit'
+        )
+
+
+def _page_tables(pdf_path, page, engine, stats, prefilter=True):
+    """
+    Extracts and cleans every table of a single pdfplumber page.
+
+    With prefilter, pages that fail the cheap is_table_candidate screen never
+    reach the engine. stats counts pages, skips by reason and candidates that
+    turned out to hold no table, for tuning the pre-filter.
+    """
+    import pandas as pd
+
+    stats['pages'] += 1
+    metrics.inc('pdf_pages_total', engine=engine.name)
+    if prefilter:
+        with metrics.timer('prefilter'):
+            candidate, skip_reason = is_table_candidate(page)
+        if not candidate:
+            stats[f'skipped_{skip_reason}'] += 1
+            metrics.inc('pdf_pages_skipped_total', reason=skip_reason)
+            return []
+    stats['candidates'] += 1
+
+    with metrics.timer('page'):
+        raw_tables = engine.extract_page(pdf_path, page)
+
+    tables = []
+    for table_index, table in enumerate(raw_tables):
+        if not table:
+            continue
+        # Clean and standardize the table data
+        with metrics.timer('clean'):
+            cleaned_table = clean_table_data(table)
+        with metrics.timer('dataframe'):
+            data = pd.DataFrame(cleaned_table[1:], columns=cleaned_table[0])
+        tables.append(ExtractedTable(page.page_number, table_index, data))
+
+    metrics.inc('pdf_tables_total', len(tables))
+    if not tables:
+        stats['candidates_without_tables'] += 1
+    return tables
+
+
+def _iter_pages(pdf_path, pages, engine, stats, prefilter, memory_limit, on_page_done=None):
+    """Yields the tables of pages one page at a time, calling on_page_done(page_number) after each page."""
+    for page in pages:
+        yield from _page_tables(pdf_path, page, engine, stats, prefilter)
+        # pdfplumber keeps the parsed objects of every page until the PDF is
+        # closed, a few MB per page, drop them as soon as the page is done
+        page.close()
+        check_memory(memory_limit, page.page_number)
+        if on_page_done is not None:
+            on_page_done(page.page_number)
+
+
+def _extract_page_range(pdf_path, start, stop, engine_name, prefilter, memory_limit=0):
+    """
+    Extracts the tables of pages [start, stop). Runs inside a pool worker, which
+    opens the PDF itself and sends its metrics back along with the tables.
+    """
+    import pdfplumber
+
+    stats = Counter()
+    with pdfplumber.open(pdf_path) as pdf:
+        tables = list(_iter_pages(pdf_path, pdf.pages[start:stop], get_engine(engine_name), stats, prefilter, memory_limit))
+    return tables, stats, metrics.drain()
+
+
+def iter_tables(pdf_path, workers=None, chunk_size=None, engine='pdfplumber', prefilter=None, stats=None, memory_limit=None,
+                on_progress=None):
+    """
+    Yields the tables of the PDF in page order, as they are extracted.
+
+    Pages are released as soon as their tables are yielded, so the peak memory
+    stays flat however long the document is. Documents with at least
+    PDF_PAGE_PARALLEL_MIN_PAGES pages are split into chunks of chunk_size
+    pages that are extracted by a pool of worker processes, with at most one
+    chunk per worker in flight.
+
+    Args:
+    - pdf_path: Path of the PDF on disk
+    - workers: Number of worker processes (default: PDF_PAGE_WORKERS, 1 disables the pool)
+    - chunk_size: Pages handed to a worker at a time (default: PDF_PAGE_CHUNK_SIZE)
+    - engine: Engine name, "auto" picks one per page
+    - prefilter: Skip pages that cannot hold a table before running the engine (default: PDF_PAGE_PREFILTER)
+    - stats: Optional Counter that receives the page statistics of _page_tables
+    - memory_limit: Resident memory in bytes past which MemoryLimitExceeded is raised (default: PDF_EXTRACTION_MEMORY_LIMIT)
+    - on_progress: Optional callable(pages_done, pages_total, tables_found), called once the page count
+      is known and after every page, or every chunk with the pool, once its tables were consumed
+
+    Yields:
+    - ExtractedTable (page number, index on the page, DataFrame)
+    """
+    import pdfplumber
+
+    workers = workers or getattr(settings, 'PDF_PAGE_WORKERS', 1)
+    chunk_size = chunk_size or getattr(settings, 'PDF_PAGE_CHUNK_SIZE', 10)
+    min_pages = getattr(settings, 'PDF_PAGE_PARALLEL_MIN_PAGES', 50)
+
+    prefilter = prefilter if prefilter is not None else getattr(settings, 'PDF_PAGE_PREFILTER', True)
+    memory_limit = memory_limit if memory_limit is not None else getattr(settings, 'PDF_EXTRACTION_MEMORY_LIMIT', 0)
+    stats = stats if stats is not None else Counter()
+
+    tables_found = 0
+
+    def report(pages_done):
+        if on_progress is not None:
+            on_progress(pages_done, page_count, tables_found)
+
+    started = time.perf_counter()
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        metrics.observe('pdf_stage_seconds', time.perf_counter() - started, stage='open')
+        report(0)
+        parallel = workers > 1 and page_count >= min_pages
+        if not parallel:
+            for table in _iter_pages(pdf_path, pdf.pages, get_engine(engine), stats, prefilter, memory_limit, report):
+                tables_found += 1
+                yield table
+            return
+
+    page_ranges = ((start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size))
+    pool_size = min(workers, -(-page_count // chunk_size))
+    with ProcessPoolExecutor(max_workers=pool_size, initializer=metrics.reset) as executor:
+        def submit(start, stop):
+            return stop, executor.submit(_extract_page_range, pdf_path, start, stop, engine, prefilter, memory_limit)
+
+        # Chunks are collected in submission order, i.e. page order, and a new
+        # one is only submitted when a finished one is taken off the queue
+        pending = deque(submit(start, stop) for start, stop in islice(page_ranges, pool_size))
+        while pending:
+            last_page, future = pending.popleft()
+            chunk_tables, chunk_stats, chunk_metrics = future.result()
+            pending.extend(submit(start, stop) for start, stop in islice(page_ranges, 1))
+            stats.update(chunk_stats)
+            metrics.merge(chunk_metrics)
+            for table in chunk_tables:
+                tables_found += 1
+                yield table
+            check_memory(memory_limit, last_page)
+            report(last_page)
+
+
+def extract_tables(pdf_path, workers=None, chunk_size=None, engine='pdfplumber', prefilter=None, stats=None, memory_limit=None,
+                   on_progress=None):
+    """
+    Extracts every table of the PDF at once, see iter_tables for the arguments.
+
+    Holds all DataFrames in memory, jobs stream iter_tables into save_tables instead.
+
+    Returns:
+    - List of ExtractedTable (page number, index on the page, DataFrame) and the error traceback or None
+    """
     tables = []
     error_details = None
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                table = page.extract_table()
-                if table:
-                    # Clean and standardize the table data
-                    cleaned_table = clean_table_data(table)
-                    tables.append(pd.DataFrame(cleaned_table[1:], columns=cleaned_table[0]))
-
+        tables = list(iter_tables(pdf_path, workers, chunk_size, engine, prefilter, stats, memory_limit, on_progress))
     except Exception as e:
         # Capture detailed error information
         error_details = traceback.format_exc()
@@ -69,18 +301,54 @@ def save_error_details(file_hash, error_details):
     - error_details: Error traceback or details
 
     Returns:
-    - Path to the saved error file
+    - Path to the saved error file, relative to MEDIA_ROOT
     """
-    # Generate error file path
-    error_file_path = f'errors/{file_hash}_error.txt'
+    return _save_report(file_hash, 'error', str(error_details))
 
-    # Save error details using Django's default storage
-    default_storage.save(
-        error_file_path,
-        ContentFile(str(error_details).encode('utf-8'))
-    )
 
-    return error_file_path
+def _save_report(file_hash, label, text):
+    """Writes a text report under errors/, a unique name per report so that retries do not overwrite earlier ones."""
+    relative_path = error_path(file_hash, f'{label}-{uuid.uuid4().hex[:12]}.txt')
+    write_atomically(full_path(relative_path), lambda output: output.write(text.encode('utf-8')))
+    return relative_path
+
+
+def save_profile(file_hash, profiler, label):
+    """
+    Save a cProfile report next to the error details of the file
+
+    Args:
+    - file_hash: Unique identifier for the file
+    - profiler: Finished cProfile.Profile
+    - label: What was profiled, e.g. "request" or "job-12"
+
+    Returns:
+    - Path to the saved report, relative to MEDIA_ROOT
+    """
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(getattr(settings, 'PDF_PROFILE_REPORT_LINES', 60))
+    return _save_report(file_hash, f'{label}-profile', report.getvalue())
+
+
+def _clean_row(row):
+    """
+    Strips every cell of a row, None becomes ''.
+
+    Returns:
+    - The cleaned cells, or None when the row holds no text
+    """
+    if None not in row:
+        try:
+            # All-string rows, the common case, are stripped without a Python level loop
+            cleaned = list(map(str.strip, row))
+        except TypeError:
+            pass
+        else:
+            return cleaned if any(cleaned) else None
+
+    cleaned = [str(cell).strip() if cell is not None else '' for cell in row]
+    # Falsy values such as 0 do not count as text, like they never did
+    return cleaned if any(cell and text for cell, text in zip(row, cleaned)) else None
 
 
 def clean_table_data(table):
@@ -89,66 +357,147 @@ def clean_table_data(table):
     - Remove empty rows and columns
     - Ensure proper header alignment
     - Remove unnecessary whitespace
+
+    Runs in a single pass over the rows and strips every cell once,
+    benchmarks/clean_table_data.py checks the output against the original
+    implementation.
     """
-    # Remove completely empty rows
-    cleaned_table = [row for row in table if any(cell and str(cell).strip() for cell in row)]
+    headers = None
+    cleaned_data_rows = []
+    for row in table:
+        cleaned_row = _clean_row(row)
+        # Remove completely empty rows
+        if cleaned_row is None:
+            continue
 
-    # Find the first row with meaningful headers
-    header_row = next((row for row in cleaned_table if any(cell and str(cell).strip() for cell in row)), None)
+        # The first row with text holds the headers, empty cells get a placeholder name
+        if headers is None:
+            headers = [text if cell else f'Column_{i}' for i, (cell, text) in enumerate(zip(row, cleaned_row))]
+            continue
+
+        # Ensure row has same length as headers, filling with empty string if needed
+        if len(cleaned_row) != len(headers):
+            cleaned_row = cleaned_row[:len(headers)] + [''] * (len(headers) - len(cleaned_row))
+        cleaned_data_rows.append(cleaned_row)
 
-    if header_row is None:
+    if headers is None:
         return table
 
-    # Get the index of the header row
-    header_index = cleaned_table.index(header_row)
+    # Combine headers and data
+    return [headers] + cleaned_data_rows
 
-    # Extract headers, removing None or empty values
-    headers = [str(cell).strip() if cell else f'Column_{i}' for i, cell in enumerate(header_row)]
 
-    # Get data rows, skipping header and empty rows
-    data_rows = cleaned_table[header_index + 1:]
+TABLE_OUTPUT_FORMATS = ['csv', 'zip', 'parquet', 'arrow']
 
-    # Clean and align data rows
-    cleaned_data_rows = []
-    for row in data_rows:
-        # Ensure row has same length as headers, filling with empty string if needed
-        cleaned_row = [str(cell).strip() if cell is not None else '' for cell in row[:len(headers)]]
-        while len(cleaned_row) < len(headers):
-            cleaned_row.append('')
-        cleaned_data_rows.append(cleaned_row)
 
-    # Combine headers and data
-    return [headers] + cleaned_data_rows
+def available_output_formats():
+    """Output formats usable in this environment, the columnar ones need pyarrow."""
+    if importlib.util.find_spec('pyarrow') is None:
+        return ['csv', 'zip']
+    return TABLE_OUTPUT_FORMATS
 
 
-def save_table_as_csv(tables, file_hash):
-    """Saves the extracted tables as CSV files."""
-    global table
-    if not tables or not isinstance(tables[0], (pd.DataFrame, list, dict)):
-        raise ValueError("The first element of 'tables' must be tabular data.")
+def _as_dataframe(table):
+    """Preprocess a table into a DataFrame"""
+    import pandas as pd
 
-    # Preprocess tables[0] into a DataFrame
-    if isinstance(tables[0], pd.DataFrame):
-        table = tables[0]
-    elif isinstance(tables[0], list):
+    if isinstance(table, pd.DataFrame):
+        return table
+    if isinstance(table, list):
         try:
-            table = pd.DataFrame(tables[0])
+            return pd.DataFrame(table)
         except ValueError as e:
             print(f"Error converting to DataFrame: {e}")
             # Attempt to normalize irregular data
-            normalized_data = [row if isinstance(row, list) else [row] for row in tables[0]]
-            table = pd.DataFrame(normalized_data)
-    elif isinstance(tables[0], dict):
-        table = pd.DataFrame([tables[0]])
+            normalized_data = [row if isinstance(row, list) else [row] for row in table]
+            return pd.DataFrame(normalized_data)
+    if isinstance(table, dict):
+        return pd.DataFrame([table])
+    raise ValueError("Every element of 'tables' must be tabular data.")
 
-    # Use a relative path within MEDIA_ROOT
-    relative_path = os.path.join('csv', f'{file_hash}.csv')
-    full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
 
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+def _with_unique_columns(data):
+    """Columnar formats need unique string column names, cleaned headers can repeat."""
+    seen = {}
+    columns = []
+    for column in map(str, data.columns):
+        count = seen.get(column, 0)
+        seen[column] = count + 1
+        columns.append(f'{column}_{count}' if count else column)
+    return data.set_axis(columns, axis=1)
 
-    # Save the CSV
-    table.to_csv(full_path, index=False)
 
-    return relative_path
+def table_filename(table, extension):
+    """File or zip member name of an extracted table."""
+    return f'page-{table.page_number}-table-{table.table_index}.{extension}'
+
+
+def _write_table(data, output_format, output):
+    """Writes one table to a binary file in output_format (csv, parquet or arrow)."""
+    if output_format == 'csv':
+        data.to_csv(output, index=False, encoding='utf-8')
+    elif output_format == 'parquet':
+        _with_unique_columns(data).to_parquet(output, index=False)
+    else:
+        _with_unique_columns(data).to_feather(output)
+
+
+def save_tables(tables, file_hash, output_format='csv', variant=None):
+    """
+    Saves every extracted table under storage.tables_dir(hash, variant), the
+    variant directory keeps results of different extractor settings side by
+    side. Every file is written atomically.
+
+    Formats:
+    - csv: One CSV per table
+    - zip: A single tables.zip with one CSV member per table
+    - parquet / arrow: One Parquet or Arrow IPC file per table (requires pyarrow)
+
+    Args:
+    - tables: ExtractedTables as yielded by iter_tables, any iterable (plain tables are numbered in order)
+    - file_hash: Unique identifier for the file
+    - output_format: One of TABLE_OUTPUT_FORMATS
+    - variant: Optional subdirectory, e.g. the result cache key
+
+    Returns:
+    - One dict per table with the relative path, zip member, page number, table index and format
+    """
+    if output_format not in TABLE_OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'.")
+    tables = iter(tables)
+    first_table = next(tables, None)
+    if first_table is None:
+        raise ValueError("No tables to save.")
+
+    # Tables are written as they come, a generator is never held in memory in full
+    tables = (
+        table if isinstance(table, ExtractedTable) else ExtractedTable(None, index, _as_dataframe(table))
+        for index, table in enumerate(chain([first_table], tables))
+    )
+
+    relative_dir = tables_dir(file_hash, variant)
+    saved = []
+    if output_format == 'zip':
+        relative_path = os.path.join(relative_dir, 'tables.zip')
+
+        def write_bundle(output):
+            with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+                for table in tables:
+                    member = table_filename(table, 'csv')
+                    with metrics.timer('write'), bundle.open(member, 'w') as member_file, \
+                            TextIOWrapper(member_file, encoding='utf-8', newline='') as text:
+                        table.data.to_csv(text, index=False)
+                    saved.append({'path': relative_path, 'member': member, 'page_number': table.page_number,
+                                  'table_index': table.table_index, 'format': output_format})
+
+        write_atomically(full_path(relative_path), write_bundle)
+        return saved
+
+    for table in tables:
+        extension = 'csv' if output_format == 'csv' else output_format
+        relative_path = os.path.join(relative_dir, table_filename(table, extension))
+        with metrics.timer('write'):
+            write_atomically(full_path(relative_path), lambda output: _write_table(table.data, output_format, output))
+        saved.append({'path': relative_path, 'member': '', 'page_number': table.page_number,
+                      'table_index': table.table_index, 'format': output_format})
+    return saved
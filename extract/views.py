@@ -1,19 +1,146 @@
+import asyncio
+import cProfile
+import hashlib
+import json
 import os
+import random
 import traceback
+import zipfile
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, time
 
-from django.shortcuts import get_object_or_404
+from adrf.views import APIView
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
 from rest_framework import status
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import BaseRenderer
 from rest_framework.response import Response
-from rest_framework.views import APIView
+from rest_framework.settings import api_settings
 
-from .models import CsvFile, Pdf
-from .utils import extract_tables, generate_file_hash, save_error_details, save_table_as_csv, save_temp_pdf, validate_file
+from . import metrics
+from .admission import admission_retry_after
+from .cache import TABLE_FIELDS, extraction_identity, get_cached_tables, result_cache_key, status_cache
+from .downloads import DOWNLOAD_FORMATS, RangeNotSatisfiable, available_download_formats, materialize, negotiate_encoding, negotiate_format, parse_range, read_blocks
+from .engines import available_engines
+from .jobs import enqueue_extraction, enqueue_extractions
+from .models import CsvFile, ExtractionJob, ExtractionResult, Pdf, UploadSession
+from .rows import find_rows
+from .search import search_tables
+from .uploads import UploadOffsetMismatch, delete_upload, finalize_upload, max_upload_size, parse_content_range, write_chunk
+from .utils import PDF_MAGIC, InvalidUpload, available_output_formats, ingest_upload, save_error_details, save_profile, validate_file
+
+
+def table_data(request, table):
+    """Describes one extracted table (a CsvFile values() row, see TABLE_FIELDS) in API responses."""
+    return {
+        'page_number': table['page_number'],
+        'table_index': table['table_index'],
+        'format': table['format'],
+        'member': table['member'] or None,
+        'url': request.build_absolute_uri(f'/media/{table["file"]}'),
+        'download_url': request.build_absolute_uri(f'/api/v1/pdfs/tables/{table["id"]}/'),
+    }
+
+
+def parse_limit(params, default, maximum):
+    """Page size from the limit query parameter, capped at maximum. Raises ValueError when it is not a positive integer."""
+    limit = params.get('limit', str(default))
+    if not limit.isdigit() or int(limit) < 1:
+        raise ValueError('Invalid limit')
+    return min(int(limit), maximum)
+
+
+def unsupported_options_response(output_format, engine):
+    """A 400 response when the requested output format or engine is not available, otherwise None."""
+    if output_format not in available_output_formats():
+        return Response({'error': f'Unsupported output format: {output_format}'}, status=status.HTTP_400_BAD_REQUEST)
+    if engine not in available_engines():
+        return Response({'error': f'Unsupported extraction engine: {engine}'}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+
+def over_capacity_response(request):
+    """A 503 with Retry-After while too much extraction work is queued (see extract.admission), otherwise None."""
+    retry_after = admission_retry_after()
+    if retry_after is None:
+        return None
+    metrics.inc('pdf_admission_rejected_total', endpoint=request.resolver_match.url_name)
+    response = Response(
+        {'error': 'Too many extractions queued, retry later', 'retry_after': retry_after},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
 
 
 class PdfTableExtractorView(APIView):
-    def post(self, request, *args, **kwargs):
-        global pdf_path, file_hash
+    """
+    POST endpoint that stores a PDF and queues its table extraction.
+
+    Extraction runs in the workers started with ``manage.py run_extraction_workers``,
+    the response only carries the hash to poll the status endpoint with.
+
+    The view is async: parsing the body and hashing and storing the file run
+    in a thread through run_blocking and the database is reached through the
+    async ORM, so under ASGI a slow upload does not hold on to a thread.
+
+    Staff can pass ?profile=1 or an X-Profile: 1 header to run the request, and
+    the job it queues, under cProfile. The request report covers the work
+    done in run_blocking and is linked in the response, the job report in the
+    status endpoint once the job finished. One in PDF_PROFILE_SAMPLE_RATE
+    requests is profiled the same way.
+    """
+    profile = False
+    profiler = None
+    file_hash = None
+
+    async def post(self, request, *args, **kwargs):
+        requested = self.profile_requested(request)
+        sample_rate = getattr(settings, 'PDF_PROFILE_SAMPLE_RATE', 0)
+        self.profile = requested or (sample_rate > 0 and random.randrange(sample_rate) == 0)
+        if self.profile:
+            self.profiler = cProfile.Profile()
+        try:
+            # Refused before the file is hashed and stored
+            response = await sync_to_async(over_capacity_response)(request)
+            if response is not None:
+                return response
+            response = await self.upload(request)
+            if self.profiler is not None and self.file_hash:
+                profile_path = await sync_to_async(save_profile)(self.file_hash, self.profiler, 'request')
+                if requested:
+                    response.data['profile_url'] = request.build_absolute_uri(f'/media/{profile_path}')
+            return response
+
+        finally:
+            metrics.flush()
+
+    def profile_requested(self, request):
+        """Whether a staff user asked for the request to be profiled."""
+        flag = request.query_params.get('profile') or request.headers.get('X-Profile', '')
+        return flag.lower() in ('1', 'true') and request.user.is_staff
+
+    async def run_blocking(self, func, *args):
+        """Runs file I/O or CPU bound work in a thread, under the request profiler when there is one."""
+        if self.profiler is not None:
+            return await sync_to_async(self.profiler.runcall)(func, *args)
+        return await sync_to_async(func)(*args)
+
+    async def upload(self, request):
         try:
+            # The multipart body is spooled to disk, parse it off the event loop
+            await self.run_blocking(lambda: request.data)
             file = request.FILES.get('file')
             if not file:
                 return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -22,107 +149,838 @@ class PdfTableExtractorView(APIView):
             if not validate_file(file):
                 return Response({'error': 'Invalid file'}, status=status.HTTP_400_BAD_REQUEST)
 
-            file_hash = generate_file_hash(file)
-            pdf_path = None
-            # Check for existing file
-            if Pdf.objects.filter(hash=file_hash).exists():
-                return Response({"message": "File Already Exists"})
+            output_format = request.data.get('output_format', 'csv')
+            engine = request.data.get('engine', 'pdfplumber')
+            error_response = unsupported_options_response(output_format, engine)
+            if error_response:
+                return error_response
 
-            pdf_path = None
             try:
-                pdf_path = save_temp_pdf(file)
+                file_hash, pdf_path, created = await self.run_blocking(ingest_upload, file)
+            except InvalidUpload as e:
+                return Response({'error': f'Invalid file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            self.file_hash = file_hash
 
-                pdf_instance = Pdf.objects.create(file=file, hash=file_hash)
+            return await self.register_pdf(request, file_hash, pdf_path, created, engine, output_format)
 
-                tables = extract_tables(pdf_path)
+        except Exception as e:
+            return await self.processing_error_response(request, e)
 
-                if not tables:
-                    return Response({'error': 'No tables found in PDF'}, status=status.HTTP_400_BAD_REQUEST)
+    async def register_pdf(self, request, file_hash, pdf_path, created, engine, output_format):
+        """Creates the Pdf row of a stored upload and queues its extraction, or answers from the existing one."""
+        # Check for existing file
+        with metrics.timer('lookup'):
+            existing_pdf = await Pdf.objects.filter(hash=file_hash).afirst()
+        if existing_pdf:
+            if created and existing_pdf.file.name != pdf_path:
+                # Rows from before content addressing keep their original path
+                os.remove(os.path.join(settings.MEDIA_ROOT, pdf_path))
+            return await self.existing_file_response(request, existing_pdf, engine, output_format)
 
-                csv_file = save_table_as_csv(tables, file_hash)
+        try:
+            pdf_instance = await sync_to_async(self.create_pdf)(file_hash, pdf_path, engine, output_format)
+        except IntegrityError:
+            # A concurrent upload of the same content won the insert
+            return Response({"message": "File Already Exists"})
 
-                csv_instance = CsvFile.objects.create(
-                    pdf=pdf_instance,
-                    file=csv_file
-                )
+        return self.queued_response(request, pdf_instance)
 
-                response_data = {
-                    'hash': pdf_instance.hash,
-                    'pdf_url': request.build_absolute_uri(f'/media/{pdf_instance.file.name}'),
-                    'csv_url': request.build_absolute_uri(f'/media/{csv_instance.file.name}'),
-                }
-                return Response({"message": "Successfully Extracted Tables", "data": response_data}, status=status.HTTP_200_OK)
+    def create_pdf(self, file_hash, pdf_path, engine, output_format):
+        # The async ORM has no transactions, the row and its job are inserted in a thread
+        with transaction.atomic():
+            pdf_instance = Pdf.objects.create(file=pdf_path, hash=file_hash)
+            enqueue_extraction(pdf_instance, output_format, engine, profile=self.profile)
+        return pdf_instance
 
-            except Exception as e:
-                return Response({'error': f'Processing error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    async def processing_error_response(self, request, error):
+        response_data = {'error': f'Processing error: {str(error)}'}
+        if self.file_hash:
+            error_file_path = await sync_to_async(save_error_details)(self.file_hash, traceback.format_exc())
+            response_data['error_file_url'] = request.build_absolute_uri(f'/media/{error_file_path}')
+        return Response(response_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def queued_response(self, request, pdf_instance):
+        response_data = {
+            'hash': pdf_instance.hash,
+            'pdf_url': request.build_absolute_uri(f'/media/{pdf_instance.file.name}'),
+            'status_url': request.build_absolute_uri(f'/api/v1/pdfs/status/{pdf_instance.hash}/'),
+        }
+        return Response({"message": "Extraction Queued", "data": response_data}, status=status.HTTP_202_ACCEPTED)
+
+    async def existing_file_response(self, request, pdf_instance, engine, output_format):
+        """
+        Answers a re-upload from the result cache.
+
+        A hit returns the stored tables straight away. On a miss (the earlier
+        extraction failed or used other settings) a new job is queued, unless
+        one for the same settings is already waiting or running.
+        """
+        cache_key = result_cache_key(pdf_instance.hash, *extraction_identity(engine, output_format))
+        tables = await sync_to_async(get_cached_tables)(cache_key)
+        if tables is not None:
+            response_data = {
+                'hash': pdf_instance.hash,
+                'pdf_url': request.build_absolute_uri(f'/media/{pdf_instance.file.name}'),
+                'tables': [table_data(request, table) for table in tables],
+            }
+            return Response({"message": "File Already Exists", "data": response_data})
+
+        active_job = await pdf_instance.jobs.filter(
+            engine=engine,
+            output_format=output_format,
+            status__in=[ExtractionJob.QUEUED, ExtractionJob.RUNNING]
+        ).afirst()
+        if active_job is None:
+            await sync_to_async(enqueue_extraction)(pdf_instance, output_format, engine, profile=self.profile)
+            return self.queued_response(request, pdf_instance)
+
+        response_data = {
+            'hash': pdf_instance.hash,
+            'status': active_job.status,
+            'status_url': request.build_absolute_uri(f'/api/v1/pdfs/status/{pdf_instance.hash}/'),
+        }
+        return Response({"message": "File Already Exists", "data": response_data})
+
+
+def upload_session_data(request, session):
+    """Describes a resumable upload in API responses."""
+    return {
+        'id': str(session.pk),
+        'size': session.size,
+        'received': session.received,
+        'upload_url': request.build_absolute_uri(f'/api/v1/pdfs/uploads/{session.pk}/'),
+        'finalize_url': request.build_absolute_uri(f'/api/v1/pdfs/uploads/{session.pk}/finalize/'),
+    }
+
+
+class UploadSessionCreateView(APIView):
+    """
+    POST endpoint that starts a resumable upload, for PDFs too large to send in
+    one request. The payload holds the total "size" in bytes and optionally
+    the "filename".
+    """
+
+    def post(self, request, *args, **kwargs):
+        # Refused before the client sends the bytes
+        response = over_capacity_response(request)
+        if response is not None:
+            metrics.flush()
+            return response
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+        if size < len(PDF_MAGIC):
+            # Smaller uploads could not even hold the PDF header that write_chunk checks
+            return Response({'error': f'size must be at least {len(PDF_MAGIC)} bytes'}, status=status.HTTP_400_BAD_REQUEST)
+        if size > max_upload_size():
+            return Response({'error': f'File too large, the limit is {max_upload_size()} bytes'}, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = str(request.data.get('filename', ''))[:255]
+        session = UploadSession.objects.create(size=size, filename=filename)
+        return Response(upload_session_data(request, session), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    """
+    Endpoint of one resumable upload.
+
+    GET reports how many bytes were received, which is where an interrupted
+    client resumes. PUT appends the raw request body at the offset given by a
+    "Content-Range: bytes <first>-<last>/<size>" header, chunks have to arrive
+    in order. DELETE aborts the upload.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=pk)
+        return Response(upload_session_data(request, session))
+
+    def put(self, request, pk, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=pk)
+        try:
+            offset, length = parse_content_range(request.headers.get('Content-Range'), session.size)
+            if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+                raise InvalidUpload('Content-Length does not match the Content-Range')
+            write_chunk(session, offset, length, request.stream)
+        except UploadOffsetMismatch as e:
+            return Response({'error': str(e), 'received': e.received}, status=status.HTTP_409_CONFLICT)
+        except InvalidUpload as e:
+            return Response({'error': f'Invalid chunk: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            metrics.flush()
+        return Response(upload_session_data(request, session))
+
+    def delete(self, request, pk, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=pk)
+        delete_upload(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadFinalizeView(PdfTableExtractorView):
+    """
+    POST endpoint that completes a resumable upload and queues its extraction.
+    Takes the same "engine" and "output_format" and answers like a single
+    request upload.
+    """
+
+    async def upload(self, request):
+        session = await aget_object_or_404(UploadSession, pk=self.kwargs['pk'])
+        try:
+            await self.run_blocking(lambda: request.data)
+            output_format = request.data.get('output_format', 'csv')
+            engine = request.data.get('engine', 'pdfplumber')
+            error_response = unsupported_options_response(output_format, engine)
+            if error_response:
+                return error_response
+
+            try:
+                file_hash, pdf_path, created = await self.run_blocking(finalize_upload, session)
+            except InvalidUpload as e:
+                return Response({'error': str(e), 'received': session.received}, status=status.HTTP_409_CONFLICT)
+            except UploadSession.DoesNotExist:
+                raise Http404
+            self.file_hash = file_hash
+
+            return await self.register_pdf(request, file_hash, pdf_path, created, engine, output_format)
+
+        except Http404:
+            raise
         except Exception as e:
-            error_details = traceback.format_exc()
-            error_file_path = save_error_details(file_hash, error_details)
-            return Response({
-                'error': f'Processing error: {str(e)}',
-                'error_file_url': request.build_absolute_uri(f'/media/{error_file_path}')
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return await self.processing_error_response(request, e)
+
+
+class BatchExtractView(APIView):
+    """
+    POST endpoint that stores many PDFs and queues their extraction in one
+    request. The files are sent as repeated "file" entries, as a zip "archive"
+    of PDFs, or both, with one "engine" and "output_format" for all of them.
+
+    Files are registered batch_size at a time: every batch is deduplicated
+    against the stored hashes in one query and its new Pdf rows and jobs are
+    inserted with bulk_create, so the number of queries does not grow with
+    the batch. The manifest is streamed as NDJSON, one line per file in the
+    order they were sent, as soon as its batch is registered.
+
+    The view is async and the manifest an async iterator, so ASGI servers send
+    it as it is written. Every file is stored and every batch registered in a
+    thread.
+    """
+    batch_size = 100
+
+    async def post(self, request, *args, **kwargs):
+        response = await sync_to_async(over_capacity_response)(request)
+        if response is not None:
+            metrics.flush()
+            return response
+        # The multipart body is spooled to disk, parse it off the event loop
+        await sync_to_async(lambda: request.data)()
+        output_format = request.data.get('output_format', 'csv')
+        engine = request.data.get('engine', 'pdfplumber')
+        error_response = unsupported_options_response(output_format, engine)
+        if error_response:
+            return error_response
+
+        files = request.FILES.getlist('file')
+        archive = request.FILES.get('archive')
+        members = []
+        if archive:
+            try:
+                archive = await sync_to_async(zipfile.ZipFile)(archive)
+            except zipfile.BadZipFile:
+                return Response({'error': 'Invalid archive'}, status=status.HTTP_400_BAD_REQUEST)
+            members = [info for info in archive.infolist() if not info.is_dir()]
+        if not files and not members:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_files = getattr(settings, 'PDF_BATCH_MAX_FILES', 1000)
+        if len(files) + len(members) > max_files:
+            return Response({'error': f'Too many files, the limit is {max_files}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        uploads = self.ingest(files, archive, members)
+        return StreamingHttpResponse(
+            self.manifest(request, uploads, engine, output_format), content_type='application/x-ndjson'
+        )
 
+    async def ingest(self, files, archive, members):
+        """Stores the sent files one by one, yielding their manifest entry with the hash or the error."""
+        for file in files:
+            if not validate_file(file):
+                yield {'name': file.name, 'error': 'Invalid file'}
+                continue
+            yield await sync_to_async(self.ingest_file)(file.name, file)
+
+        max_size = getattr(settings, 'PDF_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+        for info in members:
+            if not info.filename.lower().endswith('.pdf') or info.file_size > max_size:
+                yield {'name': info.filename, 'error': 'Invalid file'}
+                continue
+            yield await sync_to_async(self.ingest_member)(archive, info)
+
+    def ingest_member(self, archive, info):
+        with archive.open(info) as member:
+            return self.ingest_file(info.filename, File(member, name=info.filename))
+
+    def ingest_file(self, name, file):
+        try:
+            file_hash, pdf_path, created = ingest_upload(file)
+        except InvalidUpload as e:
+            return {'name': name, 'error': f'Invalid file: {e}'}
+        return {'name': name, 'hash': file_hash, 'path': pdf_path, 'created': created}
+
+    async def batches(self, uploads):
+        batch = []
+        async for entry in uploads:
+            batch.append(entry)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def manifest(self, request, uploads, engine, output_format):
+        try:
+            async for batch in self.batches(uploads):
+                await sync_to_async(self.register)(batch, engine, output_format)
+                for entry in batch:
+                    yield json.dumps(self.manifest_line(request, entry)) + '\n'
         finally:
-            # Cleanup temporary PDF if it exists
-            if pdf_path and os.path.exists(pdf_path):
-                os.remove(pdf_path)
+            metrics.flush()
+
+    def register(self, entries, engine, output_format):
+        """
+        Creates the Pdf rows of a batch of stored files and queues what is not
+        extracted yet, adding 'status' and 'existing' to every stored entry.
+
+        A re-sent file is answered like a single re-upload: complete when its
+        tables are cached for these settings, the state of the job already
+        waiting or running for them, otherwise queued again.
+        """
+        stored = [entry for entry in entries if 'hash' in entry]
+        if not stored:
+            return
+
+        with metrics.timer('lookup'):
+            pdfs = Pdf.objects.in_bulk({entry['hash'] for entry in stored}, field_name='hash')
+        for entry in stored:
+            existing_pdf = pdfs.get(entry['hash'])
+            entry['existing'] = existing_pdf is not None
+            if existing_pdf and entry['created'] and existing_pdf.file.name != entry['path']:
+                # Rows from before content addressing keep their original path
+                os.remove(os.path.join(settings.MEDIA_ROOT, entry['path']))
+
+        identity = extraction_identity(engine, output_format)
+        cache_keys = {pdf.hash: result_cache_key(pdf.hash, *identity) for pdf in pdfs.values()}
+        cached = set(ExtractionResult.objects.filter(cache_key__in=cache_keys.values()).values_list('cache_key', flat=True))
+        if cached:
+            ExtractionResult.objects.filter(cache_key__in=cached).update(last_used_at=timezone.now())
+        metrics.inc('pdf_result_cache_requests_total', len(cached), result='hit')
+        metrics.inc('pdf_result_cache_requests_total', len(cache_keys) - len(cached), result='miss')
+        active_jobs = dict(ExtractionJob.objects.filter(
+            pdf__in=list(pdfs.values()),
+            engine=engine,
+            output_format=output_format,
+            status__in=[ExtractionJob.QUEUED, ExtractionJob.RUNNING]
+        ).values_list('pdf__hash', 'status'))
+
+        statuses = {}
+        for file_hash in cache_keys:
+            if cache_keys[file_hash] in cached:
+                statuses[file_hash] = ExtractionJob.COMPLETE
+            elif file_hash in active_jobs:
+                statuses[file_hash] = active_jobs[file_hash]
+
+        new_paths = {entry['hash']: entry['path'] for entry in stored if entry['hash'] not in pdfs}
+        with transaction.atomic():
+            if new_paths:
+                # A concurrent upload of the same content may win the insert of a row
+                Pdf.objects.bulk_create(
+                    [Pdf(file=path, hash=file_hash) for file_hash, path in new_paths.items()], ignore_conflicts=True
+                )
+                pdfs.update(Pdf.objects.in_bulk(list(new_paths), field_name='hash'))
+            queued = [pdf for file_hash, pdf in pdfs.items() if file_hash not in statuses]
+            enqueue_extractions(queued, output_format, engine)
+        statuses.update((pdf.hash, ExtractionJob.QUEUED) for pdf in queued)
+
+        for entry in stored:
+            entry['status'] = statuses[entry['hash']]
+
+    def manifest_line(self, request, entry):
+        if 'error' in entry:
+            return {'name': entry['name'], 'error': entry['error']}
+        return {
+            'name': entry['name'],
+            'hash': entry['hash'],
+            'status': entry['status'],
+            'existing': entry['existing'],
+            'status_url': request.build_absolute_uri(f'/api/v1/pdfs/status/{entry["hash"]}/'),
+        }
+
+
+def job_etag(job, staff):
+    """ETag of a status response, it only changes when the job row does (result tables never change)."""
+    version = (
+        f'{job.pk}:{job.status}:{job.attempts}:{job.result_id}:{job.error_file}:{job.profile_file if staff else ""}:'
+        f'{job.pages_done}:{job.pages_total}:{job.tables_found}'
+    )
+    return '"' + hashlib.sha1(version.encode()).hexdigest() + '"'
+
+
+def job_progress(job):
+    """
+    Page-level progress of a job, None until its worker has opened the PDF.
+
+    The rate is measured from the start of the attempt to the latest progress
+    update, and the ETA of a running job is what is left at that rate minus
+    the time since that update.
+    """
+    if job.pages_total is None:
+        return None
+    progress = {
+        'pages_done': job.pages_done,
+        'pages_total': job.pages_total,
+        'tables_found': job.tables_found,
+        'percent': round(100 * job.pages_done / job.pages_total, 1) if job.pages_total else 100.0,
+        'pages_per_second': None,
+        'eta_seconds': None,
+    }
+    elapsed = (job.progress_at - job.started_at).total_seconds() if job.progress_at and job.started_at else 0
+    if job.pages_done and elapsed > 0:
+        rate = job.pages_done / elapsed
+        progress['pages_per_second'] = round(rate, 2)
+        if job.status == ExtractionJob.RUNNING:
+            since_update = (timezone.now() - job.progress_at).total_seconds()
+            progress['eta_seconds'] = round(max((job.pages_total - job.pages_done) / rate - since_update, 0), 1)
+    return progress
 
 
 class PdfProcessingStatusView(APIView):
     """
-    GET endpoint to check the status of a PDF processing task.
+    GET endpoint to check the status of a PDF processing task. Async, so that
+    under ASGI polling clients do not tie up a thread each.
+
+    The latest job is read together with its PDF in one query on
+    extract_job_pdf_latest_idx. Responses carry an ETag of the job row and a
+    poll sending it back in If-None-Match gets 304 before the tables are
+    read. With PDF_STATUS_CACHE_TTL set, responses are also kept in the
+    PDF_STATUS_CACHE_ALIAS cache for that many seconds, so repeated polls
+    within it do not reach the database at all.
+    """
+
+    async def get(self, request, hash, *args, **kwargs):
+        try:
+            staff = request.user.is_staff
+            cache = status_cache()
+            cache_key = f'pdf-status:{request.get_host()}:{hash}:{int(staff)}'
+            cached = await cache.aget(cache_key) if cache is not None else None
+            if cached is not None:
+                etag, response_data = cached
+            else:
+                job = await self.latest_job(hash)
+                if job is None:
+                    if not await Pdf.objects.filter(hash=hash).aexists():
+                        raise Http404('No Pdf matches the given query.')
+                    return Response({'error': 'No extraction job found'}, status=status.HTTP_404_NOT_FOUND)
+                etag, response_data = job_etag(job, staff), None
+
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+
+            if response_data is None:
+                response_data = await self.status_data(request, job, staff)
+                if cache is not None:
+                    await cache.aset(cache_key, (etag, response_data), settings.PDF_STATUS_CACHE_TTL)
+
+            response = Response(response_data, status=status.HTTP_200_OK)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+
+        except Http404:
+            raise
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def latest_job(self, hash):
+        return await ExtractionJob.objects.select_related('pdf').filter(pdf__hash=hash).order_by('-created_at', '-id').afirst()
+
+    async def status_data(self, request, job, staff):
+        response_data = {'status': job.status}
+        progress = job_progress(job)
+        if progress is not None:
+            response_data['progress'] = progress
+        if job.status == ExtractionJob.COMPLETE:
+            result_tables = CsvFile.objects.filter(result_id=job.result_id).values(*TABLE_FIELDS) if job.result_id else CsvFile.objects.none()
+            tables = [table_data(request, table) async for table in result_tables]
+            response_data.update({
+                'pdf_url': request.build_absolute_uri(f'/media/{job.pdf.file.name}'),
+                'csv_url': tables[0]['url'] if tables else None,
+                'tables': tables,
+            })
+
+        if job.status == ExtractionJob.FAILED:
+            response_data['error_file_url'] = request.build_absolute_uri(f'/media/{job.error_file}') if job.error_file else None
+
+        if job.profile_file and staff:
+            response_data['profile_url'] = request.build_absolute_uri(f'/media/{job.profile_file}')
+        return response_data
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Accepts EventSource requests (Accept: text/event-stream) in content negotiation, errors are rendered as JSON."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class PdfStatusEventsView(PdfProcessingStatusView):
+    """
+    GET endpoint streaming the status of a PDF as server-sent events, for
+    clients that would rather not poll.
+
+    Every PDF_STATUS_EVENTS_INTERVAL seconds the latest job is read and a
+    "status" event with the body of the status endpoint is sent when its
+    ETag changed, which is also the event id. The stream ends once the job is
+    complete or failed, or after PDF_STATUS_EVENTS_TIMEOUT seconds, when
+    EventSource reconnects on its own. A reconnect whose Last-Event-ID is the
+    final state gets 204, which tells EventSource to stop.
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
+    heartbeat = 15
+    finished = (ExtractionJob.COMPLETE, ExtractionJob.FAILED)
+
+    async def get(self, request, hash, *args, **kwargs):
+        staff = request.user.is_staff
+        job = await self.latest_job(hash)
+        if job is None:
+            if not await Pdf.objects.filter(hash=hash).aexists():
+                raise Http404('No Pdf matches the given query.')
+            return Response({'error': 'No extraction job found'}, status=status.HTTP_404_NOT_FOUND)
+
+        last_event_id = request.headers.get('Last-Event-ID')
+        if job.status in self.finished and last_event_id == job_etag(job, staff).strip('"'):
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+        response = StreamingHttpResponse(self.events(request, hash, staff, job, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keeps nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def events(self, request, hash, staff, job, last_event_id):
+        interval = getattr(settings, 'PDF_STATUS_EVENTS_INTERVAL', 1.0)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + getattr(settings, 'PDF_STATUS_EVENTS_TIMEOUT', 300)
+        sent_at = loop.time()
+        yield f'retry: {int(interval * 1000)}\n\n'
+        while True:
+            event_id = job_etag(job, staff).strip('"')
+            if event_id != last_event_id:
+                data = json.dumps(await self.status_data(request, job, staff), cls=DjangoJSONEncoder)
+                yield f'id: {event_id}\nevent: status\ndata: {data}\n\n'
+                last_event_id, sent_at = event_id, loop.time()
+            elif loop.time() - sent_at >= self.heartbeat:
+                yield ': keep-alive\n\n'
+                sent_at = loop.time()
+
+            if job.status in self.finished or loop.time() >= deadline:
+                return
+            await asyncio.sleep(interval)
+            job = await self.latest_job(hash)
+            if job is None:
+                return
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Leaves Accept to the view, which renders its errors with the first renderer."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class TableDownloadView(APIView):
+    """
+    GET endpoint streaming one extracted table, see extract.downloads.
+
+    The format (csv, jsonl or parquet) is negotiated from Accept or picked
+    with ?format=, the content coding (zstd or gzip, Parquet is compressed
+    already) from Accept-Encoding. Responses carry a strong ETag and
+    Last-Modified of the served rendition for conditional requests, and a
+    single bytes Range is answered with 206 Partial Content.
     """
+    content_negotiation_class = IgnoreClientContentNegotiation
 
-    def get(self, request, hash, *args, **kwargs):
+    async def get(self, request, pk, *args, **kwargs):
+        table = await aget_object_or_404(CsvFile.objects.only('file', 'member', 'format', 'result_id'), pk=pk)
         try:
-            pdf_instance = get_object_or_404(Pdf, hash=hash)
-
-            # Check if a CSV file exists for the PDF
-            csv_instance = CsvFile.objects.filter(pdf=pdf_instance).first()
-            if csv_instance:
-                return Response({
-                    'status': 'complete',
-                    'pdf_url': request.build_absolute_uri(f'/media/{pdf_instance.file.name}'),
-                    'csv_url': request.build_absolute_uri(f'/media/{csv_instance.file.name}')
-                }, status=status.HTTP_200_OK)
-
-            # Check for error details
-            error_file_path = f'errors/{hash}.txt'  # Assuming errors are stored in a dedicated folder
-            error_file_full_path = os.path.join('media', error_file_path)
-            if os.path.exists(error_file_full_path):
-                return Response({
-                    'status': 'failed',
-                    'error_file_url': request.build_absolute_uri(f'/media/{error_file_path}')
-                }, status=status.HTTP_200_OK)
-
-            return Response({'status': 'in-progress'}, status=status.HTTP_200_OK)
+            requested = request.query_params.get('format')
+            if requested:
+                output_format = requested if requested in available_download_formats() else None
+            else:
+                default = table.format if table.format in DOWNLOAD_FORMATS else 'csv'
+                output_format = negotiate_format(request.headers.get('Accept'), default)
+            if output_format is None:
+                return Response(
+                    {'error': f'Not acceptable, available formats: {", ".join(available_download_formats())}'},
+                    status=status.HTTP_406_NOT_ACCEPTABLE
+                )
+            encoding = None if output_format == 'parquet' else negotiate_encoding(request.headers.get('Accept-Encoding'))
+
+            try:
+                path, written = await sync_to_async(materialize, thread_sensitive=False)(
+                    table.file.name, table.member, table.format, output_format, encoding
+                )
+            except FileNotFoundError:
+                return Response({'error': 'Table file not found'}, status=status.HTTP_404_NOT_FOUND)
+            if written and table.result_id:
+                # Renditions count towards the result cache budget
+                await ExtractionResult.objects.filter(pk=table.result_id).aupdate(size_bytes=F('size_bytes') + written)
+
+            stat = os.stat(path)
+            etag = '"' + hashlib.sha1(f'{path}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest() + '"'
+            headers = {
+                'ETag': etag,
+                'Last-Modified': http_date(stat.st_mtime),
+                'Accept-Ranges': 'bytes',
+                'Vary': 'Accept, Accept-Encoding',
+            }
+            not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+            if not_modified is not None:
+                for name, value in headers.items():
+                    not_modified[name] = value
+                return not_modified
+
+            if_range = request.headers.get('If-Range')
+            byte_range = None
+            if not if_range or if_range in (etag, headers['Last-Modified']):
+                try:
+                    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+                except RangeNotSatisfiable:
+                    response = Response({'error': 'Range not satisfiable'}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                    response['Content-Range'] = f'bytes */{stat.st_size}'
+                    return response
+
+            start, length = byte_range or (0, stat.st_size)
+            response = StreamingHttpResponse(
+                read_blocks(path, start, length), content_type=DOWNLOAD_FORMATS[output_format][0],
+                status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK, headers=headers
+            )
+            response['Content-Length'] = length
+            if byte_range:
+                response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+            if encoding:
+                response['Content-Encoding'] = encoding
+            stem = os.path.splitext(table.member or os.path.basename(table.file.name))[0]
+            response['Content-Disposition'] = f'attachment; filename="{stem}.{output_format}"'
+            metrics.inc('pdf_downloads_total', format=output_format, encoding=encoding or 'identity')
+            metrics.inc('pdf_download_bytes_total', length)
+            return response
 
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            metrics.flush()
+
+
+def encode_cursor(uploaded_at, pk):
+    """Opaque keyset cursor for the (uploaded_at, id) position of a row."""
+    return urlsafe_b64encode(f'{uploaded_at.isoformat()}|{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor, raises ValueError for malformed cursors."""
+    try:
+        uploaded_at, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+
+def parse_datetime_param(value, name):
+    """Accepts an ISO date or datetime query parameter."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            raise ValueError(f'Invalid {name}')
+        parsed = datetime.combine(parsed_date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
 
 
 class PdfListView(APIView):
     """
-    GET endpoint to list all PDFs and their corresponding CSVs.
+    GET endpoint to list PDFs and their corresponding CSVs.
+
+    Results are ordered by upload time and keyset-paginated on (uploaded_at, id):
+    pass the returned next_cursor as ?cursor= to fetch the next page. Optional
+    filters are status, uploaded_after and uploaded_before (ISO dates), and
+    limit sets the page size. The body is streamed row by row from an async
+    iterator.
     """
+    default_limit = 100
+    max_limit = 1000
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        try:
+            params = request.query_params
+            limit = parse_limit(params, self.default_limit, self.max_limit)
+
+            pdfs = Pdf.objects.order_by('uploaded_at', 'id')
+            if params.get('status'):
+                pdfs = pdfs.filter(status=params['status'])
+            if params.get('uploaded_after'):
+                pdfs = pdfs.filter(uploaded_at__gte=parse_datetime_param(params['uploaded_after'], 'uploaded_after'))
+            if params.get('uploaded_before'):
+                pdfs = pdfs.filter(uploaded_at__lt=parse_datetime_param(params['uploaded_before'], 'uploaded_before'))
+            if params.get('cursor'):
+                uploaded_at, pk = decode_cursor(params['cursor'])
+                pdfs = pdfs.filter(Q(uploaded_at__gt=uploaded_at) | Q(uploaded_at=uploaded_at, id__gt=pk))
+
+            # The first table comes from a correlated subquery instead of one query per row
+            first_csv = CsvFile.objects.filter(pdf=OuterRef('pk')).order_by('page_number', 'table_index', 'id').values('file')[:1]
+            rows = pdfs.annotate(csv_file=Subquery(first_csv)).values('id', 'hash', 'uploaded_at', 'status', 'file', 'csv_file')
+
+            return StreamingHttpResponse(self.stream(request, rows[:limit + 1], limit), content_type='application/json')
+
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def stream(self, request, rows, limit):
+        yield '{"pdfs": ['
+        next_cursor = None
+        last = None
+        count = 0
+        async for pdf in rows.aiterator(chunk_size=self.default_limit):
+            if count == limit:
+                next_cursor = encode_cursor(last['uploaded_at'], last['id'])
+                break
+            yield (',' if count else '') + json.dumps({
+                'hash': pdf['hash'],
+                'status': pdf['status'],
+                'uploaded_at': pdf['uploaded_at'],
+                'pdf_url': request.build_absolute_uri(f'/media/{pdf["file"]}'),
+                'csv_url': request.build_absolute_uri(f'/media/{pdf["csv_file"]}') if pdf['csv_file'] else None
+            }, cls=DjangoJSONEncoder)
+            last = pdf
+            count += 1
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+
+class TableRowQueryView(APIView):
+    """
+    GET endpoint looking up rows of extracted tables, see extract.rows.
+
+    column and value select the rows whose column holds exactly value, pdf
+    (a hash) and page_number narrow the lookup down to one document or page.
+    Either column or pdf is required. Rows come in load order, keyset-paginated
+    on their id: pass the returned next_cursor as ?cursor= for the next page.
+    """
+    default_limit = 100
+    max_limit = 1000
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            params = request.query_params
+            limit = parse_limit(params, self.default_limit, self.max_limit)
+
+            column, value = params.get('column'), params.get('value')
+            if (column is None) != (value is None):
+                raise ValueError('column and value must be given together')
+            if column is None and not params.get('pdf'):
+                raise ValueError('Filter by column and value or by pdf')
+            page_number = params.get('page_number')
+            if page_number is not None and not page_number.isdigit():
+                raise ValueError('Invalid page_number')
+            cursor = params.get('cursor')
+            if cursor is not None and not cursor.isdigit():
+                raise ValueError('Invalid cursor')
+
+            rows = find_rows(column, value, params.get('pdf'), int(page_number) if page_number else None).order_by('id')
+            if cursor:
+                rows = rows.filter(id__gt=int(cursor))
+            rows = rows.values('id', 'pdf__hash', 'table_id', 'page_number', 'table_index', 'row_number', 'data')
+            found = [row async for row in rows[:limit + 1]]
+
+            return Response({
+                'rows': [{
+                    'pdf': row['pdf__hash'],
+                    'page_number': row['page_number'],
+                    'table_index': row['table_index'],
+                    'row_number': row['row_number'],
+                    'data': row['data'],
+                    'download_url': request.build_absolute_uri(f'/api/v1/pdfs/tables/{row["table_id"]}/'),
+                } for row in found[:limit]],
+                'next_cursor': str(found[limit - 1]['id']) if len(found) > limit else None,
+            }, status=status.HTTP_200_OK)
+
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class TableSearchView(APIView):
+    """
+    GET endpoint searching the cells of extracted tables, see extract.search.
+
+    q holds the search terms, pdf (a hash) restricts the search to one
+    document. The best matching tables, at most limit, come back grouped by
+    document: documents ordered by the summed score of their tables, tables
+    by their own score, each with its page, position and download URL.
+    """
+    default_limit = 50
+    max_limit = 500
+
+    async def get(self, request, *args, **kwargs):
         try:
-            pdfs = Pdf.objects.all()
-            pdf_list = []
-
-            for pdf in pdfs:
-                csv_instance = CsvFile.objects.filter(pdf=pdf).first()
-                pdf_list.append({
-                    'hash': pdf.hash,
-                    'uploaded_at': pdf.uploaded_at,
-                    'pdf_url': request.build_absolute_uri(f'/media/{pdf.file.name}'),
-                    'csv_url': request.build_absolute_uri(f'/media/{csv_instance.file.name}') if csv_instance else None
+            params = request.query_params
+            query = params.get('q', '').strip()
+            if not query:
+                raise ValueError('Missing search terms (q)')
+            limit = parse_limit(params, self.default_limit, self.max_limit)
+
+            with metrics.timer('search'):
+                tables = await sync_to_async(search_tables)(query, params.get('pdf'), limit)
+
+            documents = {}
+            for table in tables:
+                document = documents.setdefault(table['pdf_hash'], {'pdf': table['pdf_hash'], 'score': 0.0, 'tables': []})
+                document['score'] += table['score']
+                document['tables'].append({
+                    'page_number': table['page_number'],
+                    'table_index': table['table_index'],
+                    'score': table['score'],
+                    'download_url': request.build_absolute_uri(f'/api/v1/pdfs/tables/{table["table_id"]}/'),
                 })
 
-            return Response({'pdfs': pdf_list}, status=status.HTTP_200_OK)
+            return Response({
+                'query': query,
+                'documents': sorted(documents.values(), key=lambda document: -document['score']),
+            }, status=status.HTTP_200_OK)
+
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            metrics.flush()
+
+
+class MetricsView(APIView):
+    """
+    GET endpoint with the extraction metrics of every web and worker process
+    in the Prometheus text format.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE)
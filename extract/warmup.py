@@ -0,0 +1,33 @@
+"""
+Start-up warm-up of the web processes.
+
+Django imports the URLconf, and with it every view and the extraction stack,
+on the first request a process serves. The production server calls
+warm_up() once before it forks its workers instead, so that cost is paid
+before accepting traffic and the imported modules are shared copy-on-write.
+"""
+import io
+
+
+def warm_up():
+    """
+    Imports and exercises what the first request would.
+
+    Runs in the server master before the workers are forked, so it must not
+    open database connections: a socket inherited by several workers would
+    be shared between them.
+
+    Returns:
+    - Names of the extraction engines available in this environment
+    """
+    import pandas as pd
+    import pdfplumber  # noqa: F401
+    from django.urls import reverse
+
+    from .engines import available_engines
+
+    # Resolving a name loads the URLconf, the views and their imports
+    reverse('pdf-list')
+    # pandas imports its CSV writer and formatting modules on first use
+    pd.DataFrame([['warm', 'up']]).to_csv(io.StringIO(), index=False)
+    return available_engines()
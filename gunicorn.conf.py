@@ -0,0 +1,27 @@
+"""
+Gunicorn settings of the production run mode (MODE=production in entrypoint.sh).
+
+The ASGI app runs in pre-forked uvicorn workers. preload_app imports it in the
+master and when_ready warms the extraction stack there (extract.warmup), so
+every worker is forked with it already imported and no request pays for it.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'uvicorn_worker.UvicornWorker'
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# Recycles workers now and then so a slow leak cannot grow without bound
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = '-' if os.environ.get('GUNICORN_ACCESS_LOG') else None
+
+
+def when_ready(server):
+    from extract.warmup import warm_up
+
+    engines = warm_up()
+    server.log.info('Extraction stack warmed up, engines: %s', ', '.join(engines))
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# Pools the database connections of the web server when DB_POOL_MAX_SIZE is set
+os.environ.setdefault('DJANGO_DB_POOL', '1')
 
 application = get_asgi_application()
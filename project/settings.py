@@ -88,9 +88,29 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', None),
         'HOST': os.environ.get('DB_HOST', None),
         'PORT': os.environ.get('DB_PORT', None),
+        # Seconds a connection is kept for the next request (0 closes it after
+        # every request), checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Connection pool per process (psycopg 3), for the async web server only
+# (project/asgi.py sets DJANGO_DB_POOL). It runs every request in its own
+# thread, where persistent connections are not reused, so it needs the pool.
+# Django refuses a pool together with CONN_MAX_AGE, the extraction workers and
+# management commands keep DB_CONN_MAX_AGE.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+if DB_POOL_MAX_SIZE and os.environ.get('DJANGO_DB_POOL'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -135,3 +155,107 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# PDF extraction
+
+# Largest PDF accepted by the upload endpoint, in bytes
+PDF_MAX_UPLOAD_SIZE = int(os.environ.get('PDF_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+
+# Worker processes started by `manage.py run_extraction_workers` (default: CPU count)
+PDF_EXTRACTION_WORKERS = int(os.environ.get('PDF_EXTRACTION_WORKERS', 0)) or None
+
+# Seconds before a running job is considered abandoned and requeued
+PDF_JOB_TIMEOUT = int(os.environ.get('PDF_JOB_TIMEOUT', 3600))
+
+PDF_JOB_MAX_ATTEMPTS = int(os.environ.get('PDF_JOB_MAX_ATTEMPTS', 3))
+
+# Page-parallel extraction within a single job, 1 keeps it serial
+PDF_PAGE_WORKERS = int(os.environ.get('PDF_PAGE_WORKERS', 1))
+
+PDF_PAGE_CHUNK_SIZE = int(os.environ.get('PDF_PAGE_CHUNK_SIZE', 10))
+
+PDF_PAGE_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PAGE_PARALLEL_MIN_PAGES', 50))
+
+# Resident memory in bytes of an extraction process past which its job is
+# failed instead of growing further (0 disables the check, Linux only)
+PDF_EXTRACTION_MEMORY_LIMIT = int(os.environ.get('PDF_EXTRACTION_MEMORY_LIMIT', 0))
+
+# Skip pages without ruling lines or column-aligned text before table detection
+PDF_PAGE_PREFILTER = os.environ.get('PDF_PAGE_PREFILTER', 'true').lower() == 'true'
+
+# Disk budget for cached table artifacts in bytes, least recently used results
+# are evicted past it (0 disables eviction)
+PDF_RESULT_CACHE_MAX_BYTES = int(os.environ.get('PDF_RESULT_CACHE_MAX_BYTES', 0))
+
+# Seconds result metadata stays in the in-process cache tier (0 disables it)
+PDF_RESULT_HOT_CACHE_TTL = int(os.environ.get('PDF_RESULT_HOT_CACHE_TTL', 60))
+
+# Directory where every web and worker process writes its metrics snapshot for
+# api/v1/pdfs/metrics/ to add up (empty keeps the metrics per process)
+PDF_METRICS_DIR = os.environ.get('PDF_METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+
+# Seconds between two snapshot writes of a process
+PDF_METRICS_FLUSH_INTERVAL = int(os.environ.get('PDF_METRICS_FLUSH_INTERVAL', 10))
+
+# Seconds after which the snapshot of a process that stopped writing is dropped
+PDF_METRICS_RETENTION = int(os.environ.get('PDF_METRICS_RETENTION', 86400))
+
+# Profile 1 in N upload requests and their jobs with cProfile (0 disables
+# sampling, staff can always ask for a profile with ?profile=1)
+PDF_PROFILE_SAMPLE_RATE = int(os.environ.get('PDF_PROFILE_SAMPLE_RATE', 0))
+
+# Largest file accepted by resumable uploads in bytes
+PDF_MAX_RESUMABLE_UPLOAD_SIZE = int(os.environ.get('PDF_MAX_RESUMABLE_UPLOAD_SIZE', 500 * 1024 * 1024))
+
+# Seconds an unfinished resumable upload is kept after its last chunk
+PDF_UPLOAD_SESSION_TTL = int(os.environ.get('PDF_UPLOAD_SESSION_TTL', 86400))
+
+# Most files accepted by one batch upload (api/v1/pdfs/extract-batch/), counting
+# zip archive members. Django's own limit on multipart files follows it.
+PDF_BATCH_MAX_FILES = int(os.environ.get('PDF_BATCH_MAX_FILES', 1000))
+DATA_UPLOAD_MAX_NUMBER_FILES = PDF_BATCH_MAX_FILES
+
+# Seconds a status response is served from the cache below without reading
+# the job row again (0 disables it). Keep it to a second or two, workers
+# cannot invalidate it.
+PDF_STATUS_CACHE_TTL = int(os.environ.get('PDF_STATUS_CACHE_TTL', 0))
+PDF_STATUS_CACHE_ALIAS = os.environ.get('PDF_STATUS_CACHE_ALIAS', 'default')
+
+# Seconds between two progress writes of a running job to its row
+PDF_PROGRESS_INTERVAL = float(os.environ.get('PDF_PROGRESS_INTERVAL', 1.0))
+
+# Seconds between the job reads of a status event stream, and how long a
+# stream stays open before the client reconnects
+PDF_STATUS_EVENTS_INTERVAL = float(os.environ.get('PDF_STATUS_EVENTS_INTERVAL', 1.0))
+PDF_STATUS_EVENTS_TIMEOUT = int(os.environ.get('PDF_STATUS_EVENTS_TIMEOUT', 300))
+
+# Content codings the workers pre-compress CSV tables with for the download
+# endpoint (gzip, zstd, which needs the zstandard package), empty disables it
+PDF_DOWNLOAD_PRECOMPRESS = [name for name in os.environ.get('PDF_DOWNLOAD_PRECOMPRESS', 'gzip,zstd').split(',') if name]
+
+# Load the rows of every new extraction result into the database for the
+# row query endpoint (api/v1/pdfs/rows/), with COPY on Postgres. Results
+# stored before are loaded with manage.py ingest_table_rows.
+PDF_INGEST_TABLE_ROWS = os.environ.get('PDF_INGEST_TABLE_ROWS', 'false').lower() == 'true'
+
+# Add the cells of every new extraction result to the full-text search index
+# (api/v1/pdfs/search/), a tsvector with a GIN index on Postgres. Results
+# stored before are indexed with manage.py index_search_tables.
+PDF_SEARCH_INDEX = os.environ.get('PDF_SEARCH_INDEX', 'true').lower() == 'true'
+
+# Minimum age in seconds of the files manage.py collect_storage_garbage
+# deletes, keep it above PDF_JOB_TIMEOUT: tables are written before the rows
+# that refer to them. Error reports no job refers to, e.g. of failed
+# uploads, are kept PDF_ERROR_REPORT_TTL seconds.
+PDF_STORAGE_GC_GRACE = int(os.environ.get('PDF_STORAGE_GC_GRACE', 86400))
+PDF_ERROR_REPORT_TTL = int(os.environ.get('PDF_ERROR_REPORT_TTL', 7 * 86400))
+
+# Estimated peak memory in bytes the extraction jobs running on one host may
+# add up to, a worker waits before claiming a job that does not fit (0
+# leaves it to the number of workers). See extract/admission.py.
+PDF_EXTRACTION_MEMORY_BUDGET = int(os.environ.get('PDF_EXTRACTION_MEMORY_BUDGET', 0))
+
+# Pages that may wait in the extraction queue, uploads beyond it get a 503
+# with Retry-After (0 disables the limit)
+PDF_ADMISSION_MAX_QUEUED_PAGES = int(os.environ.get('PDF_ADMISSION_MAX_QUEUED_PAGES', 0))